@@ -8,11 +8,14 @@ from urllib.parse import urljoin
 from django import forms
 from django.contrib import admin, messages
 from django.contrib.admin.utils import display_for_field, display_for_value
-from django.urls import reverse
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from jsonfield import JSONField
 from stripe.error import AuthenticationError, InvalidRequestError
 
-from . import enums, models
+from . import enums, instrumentation, models
+from .settings import djstripe_settings
 
 
 def custom_display_for_JSONfield(value, field, empty_value_display):
@@ -152,6 +155,19 @@ class IdempotencyKeyAdmin(ReadOnlyMixin, admin.ModelAdmin):
     search_fields = ("uuid", "action")
 
 
+@admin.register(models.SyncCheckpoint)
+class SyncCheckpointAdmin(ReadOnlyMixin, admin.ModelAdmin):
+    list_display = (
+        "model_name",
+        "stripe_account",
+        "high_water_mark",
+        "starting_after",
+        "updated",
+    )
+    list_filter = ("model_name",)
+    search_fields = ("model_name", "stripe_account")
+
+
 @admin.register(models.WebhookEventTrigger)
 class WebhookEventTriggerAdmin(ReadOnlyMixin, admin.ModelAdmin):
     list_display = (
@@ -162,9 +178,20 @@ class WebhookEventTriggerAdmin(ReadOnlyMixin, admin.ModelAdmin):
         "processed",
         "valid",
         "exception",
+        "attempts",
         "djstripe_version",
     )
-    list_filter = ("created", "valid", "processed")
+    list_filter = (
+        "created",
+        "valid",
+        "processed",
+        "deferred",
+        "dead_lettered",
+        "duplicate",
+    )
+    search_fields = ("stripe_event_id",)
+    # The body may be stored compressed or in a storage backend
+    readonly_fields = ("decoded_body",)
     list_select_related = ("event",)
     raw_id_fields = get_forward_relation_fields_for_model(models.WebhookEventTrigger)
 
@@ -390,6 +417,37 @@ class EventAdmin(ReadOnlyMixin, StripeModelAdmin):
     list_display = ("type", "request_id")
     list_filter = ("type", "created")
     search_fields = ("request_id",)
+    change_list_template = "djstripe/admin/event/change_list.html"
+
+    def get_urls(self):
+        return [
+            path(
+                "latency/",
+                self.admin_site.admin_view(self.latency_view),
+                name="djstripe_event_latency",
+            )
+        ] + super().get_urls()
+
+    def latency_view(self, request):
+        """
+        Displays the latency of the latest events processed by this process,
+        see DJSTRIPE_INSTRUMENTATION_LATENCY_WINDOW.
+
+        The latencies are kept in memory, so the events processed by other
+        processes (other web server workers, djstripe_process_webhooks) are
+        not included: use a StatsdSink or PrometheusSink to aggregate them.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Webhook event latency",
+            "opts": self.model._meta,
+            "window": djstripe_settings.INSTRUMENTATION_LATENCY_WINDOW,
+            "summary": instrumentation.latency_summary.summary(),
+        }
+        return TemplateResponse(request, "djstripe/admin/event/latency.html", context)
 
 
 @admin.register(models.File)
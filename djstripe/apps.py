@@ -9,8 +9,9 @@ __version__ = pkg_resources.get_distribution("dj-stripe").version
 
 class DjstripeAppConfig(AppConfig):
     """
-    An AppConfig for dj-stripe which loads system checks
-    and event handlers once Django is ready.
+    An AppConfig for dj-stripe which loads system checks and event handlers,
+    and installs the dj-stripe HTTP client (if DJSTRIPE_HTTP_CLIENT_ENABLED)
+    once Django is ready.
     """
 
     name = "djstripe"
@@ -23,6 +24,8 @@ class DjstripeAppConfig(AppConfig):
             checks,
             event_handlers,
         )
+        from .http_client import install_http_client
+        from .settings import djstripe_settings
 
         # Set app info
         # https://stripe.com/docs/building-plugins#setappinfo
@@ -31,3 +34,6 @@ class DjstripeAppConfig(AppConfig):
             version=__version__,
             url="https://github.com/dj-stripe/dj-stripe",
         )
+
+        if djstripe_settings.HTTP_CLIENT_ENABLED:
+            install_http_client()
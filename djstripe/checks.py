@@ -162,6 +162,105 @@ def check_webhook_validation(app_configs=None, **kwargs):
     return messages
 
 
+@checks.register("djstripe")
+def check_webhook_processing_mode(app_configs=None, **kwargs):
+    """
+    Check that DJSTRIPE_WEBHOOK_PROCESSING_MODE is valid
+    """
+    from .settings import djstripe_settings
+
+    messages = []
+
+    processing_modes = ("inline", "deferred")
+
+    if djstripe_settings.WEBHOOK_PROCESSING_MODE not in processing_modes:
+        messages.append(
+            checks.Critical(
+                "DJSTRIPE_WEBHOOK_PROCESSING_MODE is invalid",
+                hint="Set DJSTRIPE_WEBHOOK_PROCESSING_MODE to one of {}".format(
+                    ", ".join(processing_modes)
+                ),
+                id="djstripe.C008",
+            )
+        )
+    elif (
+        djstripe_settings.WEBHOOK_PROCESSING_MODE == "deferred"
+        and djstripe_settings.WEBHOOK_VALIDATION == "retrieve_event"
+    ):
+        messages.append(
+            checks.Warning(
+                "DJSTRIPE_WEBHOOK_PROCESSING_MODE='deferred' but webhooks are "
+                "still validated by retrieving their event from Stripe before "
+                "responding",
+                hint="Set DJSTRIPE_WEBHOOK_VALIDATION='verify_signature'",
+                id="djstripe.W005",
+            )
+        )
+
+    return messages
+
+
+@checks.register("djstripe")
+def check_webhook_body_storage(app_configs=None, **kwargs):
+    """
+    Check that DJSTRIPE_WEBHOOK_BODY_STORAGE is valid
+    """
+    from .models.webhooks import BODY_STORAGES
+    from .settings import djstripe_settings
+
+    messages = []
+
+    if djstripe_settings.WEBHOOK_BODY_STORAGE not in BODY_STORAGES:
+        messages.append(
+            checks.Critical(
+                "DJSTRIPE_WEBHOOK_BODY_STORAGE is invalid",
+                hint="Set DJSTRIPE_WEBHOOK_BODY_STORAGE to one of {}".format(
+                    ", ".join(BODY_STORAGES)
+                ),
+                id="djstripe.C009",
+            )
+        )
+    elif djstripe_settings.WEBHOOK_BODY_STORAGE == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            messages.append(
+                checks.Critical(
+                    "DJSTRIPE_WEBHOOK_BODY_STORAGE='zstd' requires the zstandard "
+                    "package",
+                    hint="Install zstandard, or set "
+                    "DJSTRIPE_WEBHOOK_BODY_STORAGE='gzip'",
+                    id="djstripe.C010",
+                )
+            )
+
+    return messages
+
+
+@checks.register("djstripe")
+def check_webhook_duplicate_policy(app_configs=None, **kwargs):
+    """
+    Check that DJSTRIPE_WEBHOOK_DUPLICATE_POLICY is valid
+    """
+    from .models.webhooks import DUPLICATE_POLICIES
+    from .settings import djstripe_settings
+
+    messages = []
+
+    if djstripe_settings.WEBHOOK_DUPLICATE_POLICY not in DUPLICATE_POLICIES:
+        messages.append(
+            checks.Critical(
+                "DJSTRIPE_WEBHOOK_DUPLICATE_POLICY is invalid",
+                hint="Set DJSTRIPE_WEBHOOK_DUPLICATE_POLICY to one of {}".format(
+                    ", ".join(DUPLICATE_POLICIES)
+                ),
+                id="djstripe.C011",
+            )
+        )
+
+    return messages
+
+
 @checks.register("djstripe")
 def check_subscriber_key_length(app_configs=None, **kwargs):
     """
@@ -1,10 +1,16 @@
 """
 dj-stripe Context Managers
 """
+import logging
 from contextlib import contextmanager
+from contextvars import ContextVar
 
 from .settings import djstripe_settings
 
+logger = logging.getLogger(__name__)
+
+_identity_map = ContextVar("djstripe_identity_map", default=None)
+
 
 @contextmanager
 def stripe_temporary_api_version(version, validate=True):
@@ -23,3 +29,106 @@ def stripe_temporary_api_version(version, validate=True):
     finally:
         # Validation is bypassed since we're restoring a previous value.
         djstripe_settings.set_stripe_api_version(old_version, validate=False)
+
+
+class IdentityMap:
+    """
+    The dj-stripe objects loaded within a stripe_identity_map() block, by model
+    and Stripe id.
+
+    The hits and misses counters tell how many lookups were answered from the
+    identity map, and how many had to go to the database (or the Stripe API).
+    """
+
+    def __init__(self):
+        self.instances = {}
+        # The owner accounts of the API keys, see StripeModel._find_owner_account()
+        self.api_key_accounts = {}
+        # The Stripe data of the related objects retrieved ahead of their sync,
+        # see StripeModel._prefetch_foreign_keys()
+        self.prefetched = {}
+        # The sync fields of the objects being created by sync_from_stripe_data(),
+        # see StripeModel._create_from_stripe_object()
+        self.sync_fields = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.instances)
+
+    def get(self, model, id):
+        instance = self.instances.get((model, id))
+        if instance is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return instance
+
+    def add(self, instance):
+        self.instances[(type(instance), instance.id)] = instance
+
+    def _get_maps(self):
+        return (
+            self.instances,
+            self.api_key_accounts,
+            self.prefetched,
+            self.sync_fields,
+        )
+
+    def savepoint(self):
+        """
+        Returns a copy of the identity map's contents, for rollback().
+        """
+        return [dict(values) for values in self._get_maps()]
+
+    def rollback(self, savepoint):
+        """
+        Restores the contents of the identity map to what they were when
+        savepoint() returned savepoint, e.g. after the transaction which
+        created or changed some of the objects was rolled back.
+        """
+        for values, saved_values in zip(self._get_maps(), savepoint):
+            values.clear()
+            values.update(saved_values)
+
+    def clear(self):
+        for values in self._get_maps():
+            values.clear()
+
+
+def get_identity_map():
+    """
+    Return the IdentityMap of the current stripe_identity_map() block, if any.
+    """
+    return _identity_map.get()
+
+
+@contextmanager
+def stripe_identity_map():
+    """
+    Load each dj-stripe object at most once while syncing within this block.
+
+    Foreign keys to objects that were already looked up or synced within the
+    block are resolved to the same instance, without querying the database
+    or the Stripe API again. Each top-level sync_from_stripe_data() call opens
+    one; open it explicitly to share it across many calls, e.g. in batch jobs.
+
+    Nested blocks share the outermost block's identity map, which is yielded.
+    Objects deleted or rolled back within the block may still be returned, so
+    keep it to the scope of a transaction.
+    """
+
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        yield identity_map
+        return
+
+    identity_map = IdentityMap()
+    token = _identity_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _identity_map.reset(token)
+        logger.debug(
+            "Identity map: %d hits, %d misses", identity_map.hits, identity_map.misses
+        )
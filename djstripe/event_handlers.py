@@ -13,19 +13,33 @@ NOTE:
     re-retrieve the object you wish to process.
 
 """
+import functools
 import logging
+import threading
+import time
+from collections import OrderedDict
 from enum import Enum
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+from stripe.util import convert_to_stripe_object
 
 from djstripe.settings import djstripe_settings
 
-from . import models, webhooks
+from . import instrumentation, models, webhooks
 from .enums import PayoutType, SourceType
 from .utils import convert_tstamp
 
 logger = logging.getLogger(__name__)
 
+# When the objects handled by _handle_crud_like_event were last retrieved from
+# Stripe, by (model, id, stripe account), least recently used first.
+# See DJSTRIPE_WEBHOOK_COALESCE_WINDOW.
+_recent_retrieves = OrderedDict()
+_recent_retrieves_lock = threading.Lock()
+RECENT_RETRIEVES_MAX_SIZE = 1024
+
 
 def update_customer_helper(metadata, customer_id, subscriber_key):
     """
@@ -403,8 +417,108 @@ def _handle_crud_like_event(
         if event.parts[:2] == ["account", "external_account"] and stripe_account:
             kwargs["account"] = models.Account._get_or_retrieve(id=stripe_account)
 
-        data = target_cls(**kwargs).api_retrieve(stripe_account=stripe_account)
-        # create or update the object from the retrieved Stripe Data
-        obj = target_cls.sync_from_stripe_data(data)
+        key = (target_cls, id, stripe_account)
+        obj = None
+        if djstripe_settings.WEBHOOK_SKIP_STALE_EVENTS and event.created:
+            # Events aren't sent in order: skip the events the local object is
+            # already up to date with.
+            obj = target_cls._get_synced_after(id, event.created)
+
+        if obj is None and _can_sync_from_payload(target_cls, event, data, id):
+            # create or update the object from the event's (signed) payload
+            obj = target_cls.sync_from_stripe_data(
+                convert_to_stripe_object(data["object"], stripe_account=stripe_account),
+                source_timestamp=event.created,
+            )
+
+        if obj is None:
+            obj = _get_recently_retrieved(target_cls, key, event)
+
+        if obj is None:
+            retrieved_at = timezone.now()
+            with instrumentation.measure("webhook.retrieve", event_type=event.type):
+                data = target_cls(**kwargs).api_retrieve(stripe_account=stripe_account)
+            # create or update the object from the retrieved Stripe Data, which
+            # is current even if the local clock is behind Stripe's
+            obj = target_cls.sync_from_stripe_data(
+                data, source_timestamp=retrieved_at, check_stale=False
+            )
+            transaction.on_commit(
+                functools.partial(_remember_retrieve, key, retrieved_at.timestamp())
+            )
 
     return obj
+
+
+def _can_sync_from_payload(target_cls, event, data, id):
+    """
+    Returns whether the object can be synced from the event's payload instead
+    of being retrieved from Stripe (see DJSTRIPE_WEBHOOK_TRUST_PAYLOAD).
+
+    The payload is used only if it was validated, is rendered in the API
+    version dj-stripe uses, has the model's expand_fields expanded, and
+    is newer than the data the local object was synced from.
+    """
+    if (
+        not djstripe_settings.WEBHOOK_TRUST_PAYLOAD
+        or djstripe_settings.WEBHOOK_VALIDATION is None
+        or event.api_version != djstripe_settings.STRIPE_API_VERSION
+    ):
+        return False
+
+    payload = data.get("object") or {}
+    if payload.get("id") != id:
+        return False
+
+    for field in getattr(target_cls, "expand_fields", []):
+        value = payload.get(field.split(".")[0], "")
+        if isinstance(value, str):
+            # missing or unexpanded
+            return False
+
+    if not event.created:
+        return False
+    local_timestamps = (
+        target_cls.objects.filter(id=id)
+        .values_list("djstripe_source_timestamp", "djstripe_updated")
+        .first()
+    )
+    if local_timestamps is None:
+        return True
+    # The local object may have been synced from newer data than the event,
+    # in which case the payload would be outdated.
+    source_timestamp, updated = local_timestamps
+    return (source_timestamp or updated) < event.created
+
+
+def _get_recently_retrieved(target_cls, key, event):
+    """
+    Returns the local object if it was retrieved from Stripe and synced less than
+    DJSTRIPE_WEBHOOK_COALESCE_WINDOW seconds ago, after the event happened:
+    the retrieved data already included the event's changes.
+
+    Otherwise, returns None and the object must be retrieved.
+    """
+    window = djstripe_settings.WEBHOOK_COALESCE_WINDOW
+    if not window or not event.created:
+        return None
+
+    with _recent_retrieves_lock:
+        retrieved_at = _recent_retrieves.get(key)
+    if retrieved_at is None or time.time() - retrieved_at > window:
+        return None
+
+    # Event.created has a one second resolution
+    if event.created.timestamp() + 1 > retrieved_at:
+        return None
+
+    logger.debug("Skipping the retrieve of %s %s for event %r", *key[:2], event.id)
+    return target_cls.objects.filter(id=key[1]).first()
+
+
+def _remember_retrieve(key, retrieved_at):
+    with _recent_retrieves_lock:
+        _recent_retrieves[key] = retrieved_at
+        _recent_retrieves.move_to_end(key)
+        while len(_recent_retrieves) > RECENT_RETRIEVES_MAX_SIZE:
+            _recent_retrieves.popitem(last=False)
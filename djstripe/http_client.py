@@ -0,0 +1,151 @@
+"""
+The HTTP client dj-stripe installs for the requests to the Stripe API.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+from .settings import djstripe_settings
+from .signals import stripe_api_request
+
+logger = logging.getLogger(__name__)
+
+
+class DjstripeHTTPClient(RequestsClient):
+    """
+    A Stripe HTTP client which keeps its connections to the Stripe API open.
+
+    Like in the Stripe library's client, each thread sends its requests with its
+    own requests session. The sessions of a process share a single HTTPAdapter,
+    whose connection pool keeps up to pool_size connections open per host, so
+    that only the first requests pay for the TLS handshake.
+
+    Unless they are given, the proxy and whether to verify SSL certificates are
+    read from stripe.proxy and stripe.verify_ssl_certs for each request.
+
+    Failed requests are retried up to max_retries times (stripe.max_network_retries
+    if None), with exponential backoff and jitter. The duration of each request
+    is logged, and sent with the stripe_api_request signal.
+    """
+
+    name = "djstripe"
+
+    def __init__(
+        self,
+        timeout=80,
+        pool_size=10,
+        max_retries=None,
+        verify_ssl_certs=None,
+        proxy=None,
+        **kwargs,
+    ):
+        super().__init__(
+            timeout=timeout, verify_ssl_certs=verify_ssl_certs, proxy=proxy, **kwargs
+        )
+        self._pool_size = pool_size
+        self._max_retries = max_retries
+        self._adapter_lock = threading.Lock()
+        self._adapter_pid = None
+
+    # HTTPClient sets _verify_ssl_certs and _proxy once, from its arguments.
+    @property
+    def _verify_ssl_certs(self):
+        if self._configured_verify_ssl_certs is None:
+            return stripe.verify_ssl_certs
+        return self._configured_verify_ssl_certs
+
+    @_verify_ssl_certs.setter
+    def _verify_ssl_certs(self, value):
+        self._configured_verify_ssl_certs = value
+
+    @property
+    def _proxy(self):
+        proxy = self._configured_proxy or stripe.proxy
+        if isinstance(proxy, str):
+            proxy = {"http": proxy, "https": proxy}
+        return proxy
+
+    @_proxy.setter
+    def _proxy(self, value):
+        self._configured_proxy = value
+
+    def _get_adapter(self):
+        pid = os.getpid()
+        if self._adapter_pid != pid:
+            # Connections can't be shared with forked processes, so each
+            # process opens its own.
+            with self._adapter_lock:
+                if self._adapter_pid != pid:
+                    self._adapter = HTTPAdapter(pool_maxsize=self._pool_size)
+                    self._adapter_pid = pid
+        return self._adapter
+
+    def _get_session(self):
+        adapter = self._get_adapter()
+        if getattr(self._thread_local, "adapter", None) is not adapter:
+            session = self._session or requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._thread_local.session = session
+            self._thread_local.adapter = adapter
+        return self._thread_local.session
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        # RequestsClient sends the request with the session of the thread
+        self._get_session()
+
+        status_code = None
+        start = time.monotonic()
+        try:
+            response = super()._request_internal(
+                method, url, headers, post_data, is_streaming
+            )
+            status_code = response[1]
+            return response
+        finally:
+            duration = time.monotonic() - start
+            logger.debug(
+                "Stripe API request %s %s: %s in %.3fs",
+                method.upper(),
+                url,
+                status_code,
+                duration,
+            )
+            stripe_api_request.send(
+                sender=type(self),
+                method=method,
+                url=url,
+                status_code=status_code,
+                duration=duration,
+            )
+
+    def _max_network_retries(self):
+        if self._max_retries is None:
+            return super()._max_network_retries()
+        return self._max_retries
+
+
+def install_http_client():
+    """
+    Send the requests to the Stripe API with a DjstripeHTTPClient configured
+    from the dj-stripe settings, unless another client was set as
+    stripe.default_http_client already.
+
+    :returns: Whether the client was installed.
+    :rtype: bool
+    """
+    if stripe.default_http_client is not None:
+        return False
+
+    stripe.default_http_client = DjstripeHTTPClient(
+        timeout=djstripe_settings.HTTP_CLIENT_TIMEOUT,
+        pool_size=djstripe_settings.HTTP_CLIENT_POOL_SIZE,
+        max_retries=djstripe_settings.HTTP_CLIENT_MAX_RETRIES,
+    )
+    return True
@@ -0,0 +1,274 @@
+"""
+Timing of the stages of webhook processing.
+
+Each of these stages records a Measurement: its duration and outcome, the
+event type and, for webhook handlers, the handler.
+
+- "webhook.event": creating an Event and calling its handlers and signal
+- "webhook.event.create": creating the Event from the webhook payload
+- "webhook.handler": calling a webhook handler
+- "webhook.signal": sending the signal of the event type
+- "webhook.retrieve": retrieving the object of the event from Stripe
+
+Measurements are sent to the sinks set in DJSTRIPE_INSTRUMENTATION_SINKS: any
+callable taking a Measurement, such as the LoggingSink, StatsdSink and
+PrometheusSink below. With DJSTRIPE_INSTRUMENTATION_LATENCY_WINDOW, the latency
+of the latest events of each type is also kept in latency_summary, which the
+Event admin displays. It is kept in the memory of each process: the admin only
+shows the events processed by the process serving it, and not those processed
+by other web server processes or by djstripe_process_webhooks.
+
+Nothing is measured when no sink is set.
+"""
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import List, NamedTuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = "success"
+ERROR = "error"
+
+
+class Measurement(NamedTuple):
+    stage: str
+    duration: float
+    outcome: str = SUCCESS
+    event_type: str = ""
+    handler: str = ""
+
+
+class LoggingSink:
+    """
+    Logs each measurement, at the debug level by default.
+    """
+
+    def __init__(self, logger_name=__name__, level=logging.DEBUG):
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def __call__(self, measurement):
+        self.logger.log(
+            self.level,
+            "%s %s%s: %s in %.3fs",
+            measurement.stage,
+            measurement.event_type,
+            f" ({measurement.handler})" if measurement.handler else "",
+            measurement.outcome,
+            measurement.duration,
+        )
+
+
+class StatsdSink:
+    """
+    Sends each measurement to a StatsD client: a timing, in milliseconds, named
+    after the stage and event type (and handler), and a counter of the outcome.
+
+    The client needs the timing(name, milliseconds) and incr(name) methods of
+    the statsd package.
+    """
+
+    def __init__(self, client, prefix="djstripe"):
+        self.client = client
+        self.prefix = prefix
+
+    def __call__(self, measurement):
+        parts = [self.prefix, measurement.stage, measurement.event_type]
+        if measurement.handler:
+            parts.append(re.sub(r"[^\w]+", "_", measurement.handler))
+        name = ".".join(part for part in parts if part)
+        self.client.timing(name, measurement.duration * 1000)
+        self.client.incr(f"{name}.{measurement.outcome}")
+
+
+class PrometheusSink:
+    """
+    Records each measurement in a histogram of the durations and a counter of
+    the outcomes, labelled with the stage, event type and handler.
+
+    Requires the prometheus_client package.
+    """
+
+    def __init__(self, registry=None, namespace="djstripe"):
+        try:
+            import prometheus_client
+        except ImportError:  # pragma: no cover
+            raise ImproperlyConfigured(
+                "PrometheusSink requires the prometheus_client package."
+            )
+
+        kwargs = {"namespace": namespace}
+        if registry is not None:
+            kwargs["registry"] = registry
+        labels = ["stage", "event_type", "handler"]
+        self.durations = prometheus_client.Histogram(
+            "webhook_stage_duration_seconds",
+            "The duration of the stages of webhook processing",
+            labels,
+            **kwargs,
+        )
+        self.outcomes = prometheus_client.Counter(
+            "webhook_stage_total",
+            "The outcomes of the stages of webhook processing",
+            labels + ["outcome"],
+            **kwargs,
+        )
+
+    def __call__(self, measurement):
+        labels = (measurement.stage, measurement.event_type, measurement.handler)
+        self.durations.labels(*labels).observe(measurement.duration)
+        self.outcomes.labels(*labels, measurement.outcome).inc()
+
+
+class LatencySummary:
+    """
+    Keeps the latency and outcome of the latest `window` events of each type
+    (the "webhook.event" stage).
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._events = defaultdict(self._new_window)
+
+    def _new_window(self):
+        return deque(maxlen=self.window)
+
+    def resize(self, window):
+        with self._lock:
+            if window != self.window:
+                self.window = window
+                self._events = defaultdict(
+                    self._new_window,
+                    {
+                        event_type: deque(events, maxlen=window)
+                        for event_type, events in self._events.items()
+                    },
+                )
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def __call__(self, measurement):
+        if measurement.stage != "webhook.event":
+            return
+        with self._lock:
+            self._events[measurement.event_type].append(
+                (measurement.duration, measurement.outcome)
+            )
+
+    def summary(self) -> List[dict]:
+        """
+        Returns the count, errors, median, 95th percentile and max latency
+        (in seconds) of each event type, slowest first.
+        """
+        with self._lock:
+            events = {
+                event_type: list(window) for event_type, window in self._events.items()
+            }
+
+        rows = []
+        for event_type, measurements in events.items():
+            if not measurements:
+                continue
+            durations = sorted(duration for duration, _ in measurements)
+            count = len(durations)
+            rows.append(
+                {
+                    "event_type": event_type,
+                    "count": count,
+                    "errors": sum(outcome != SUCCESS for _, outcome in measurements),
+                    "p50": durations[(count - 1) // 2],
+                    "p95": durations[int((count - 1) * 0.95)],
+                    "max": durations[-1],
+                }
+            )
+        return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+latency_summary = LatencySummary()
+
+# The sinks resolved from the settings they were resolved from, see get_sinks()
+_sinks = (None, [])
+
+
+def get_sinks():
+    """
+    Returns the sinks measurements are sent to.
+    """
+    # Imported here, so that djstripe.webhooks can be imported before Django
+    # is set up
+    from .settings import djstripe_settings
+
+    global _sinks
+
+    key = (
+        tuple(djstripe_settings.INSTRUMENTATION_SINKS),
+        djstripe_settings.INSTRUMENTATION_LATENCY_WINDOW,
+    )
+    if _sinks[0] == key:
+        return _sinks[1]
+
+    configured, window = key
+    sinks = []
+    for sink in configured:
+        if isinstance(sink, str):
+            sink = import_string(sink)
+        if not callable(sink):
+            raise ImproperlyConfigured(
+                "DJSTRIPE_INSTRUMENTATION_SINKS must be callables or import paths "
+                "of callables."
+            )
+        sinks.append(sink)
+    if window:
+        latency_summary.resize(window)
+        sinks.append(latency_summary)
+
+    _sinks = (key, sinks)
+    return sinks
+
+
+def record(stage, duration, outcome=SUCCESS, event_type="", handler=""):
+    """
+    Sends a measurement to the sinks.
+    """
+    sinks = get_sinks()
+    if sinks:
+        _send(sinks, Measurement(stage, duration, outcome, event_type, handler))
+
+
+@contextmanager
+def measure(stage, event_type="", handler=""):
+    """
+    Context manager measuring the duration of its block, and whether it raised.
+    """
+    sinks = get_sinks()
+    if not sinks:
+        yield
+        return
+
+    start = time.perf_counter()
+    outcome = ERROR
+    try:
+        yield
+        outcome = SUCCESS
+    finally:
+        duration = time.perf_counter() - start
+        _send(sinks, Measurement(stage, duration, outcome, event_type, handler))
+
+
+def _send(sinks, measurement):
+    for sink in sinks:
+        try:
+            sink(measurement)
+        except Exception:
+            # Measuring must not break webhook processing
+            logger.exception("Instrumentation sink %r failed", sink)
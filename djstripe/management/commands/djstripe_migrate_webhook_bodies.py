@@ -0,0 +1,96 @@
+"""
+Move the bodies of the stored webhook events to another body storage.
+
+Changing DJSTRIPE_WEBHOOK_BODY_STORAGE only affects the webhook events received
+afterwards. This command re-encodes the bodies of the existing webhook events
+for the current DJSTRIPE_WEBHOOK_BODY_STORAGE (or --storage), --batch-size rows
+at a time. Bodies moved out of the storage backend are deleted from it. Bodies
+which can't be read or decoded are left as they are.
+
+Usage:
+    1) To compress the bodies stored inline:
+        python manage.py djstripe_migrate_webhook_bodies --storage gzip
+
+    2) To move the bodies back inline, 1000 rows at a time:
+        python manage.py djstripe_migrate_webhook_bodies --storage inline \
+            --batch-size 1000
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import WebhookEventTrigger
+from ...models.webhooks import (
+    BODY_STORAGES,
+    decode_body,
+    delete_stored_body,
+    get_body_storage,
+)
+from ...settings import djstripe_settings
+
+
+class Command(BaseCommand):
+    """Move the bodies of the stored webhook events to another body storage."""
+
+    help = "Move the bodies of the stored webhook events to another body storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--storage",
+            choices=BODY_STORAGES,
+            help="the body storage to move the bodies to "
+            "(default: DJSTRIPE_WEBHOOK_BODY_STORAGE)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="how many webhook events to migrate at a time (default 500)",
+        )
+
+    def handle(self, *args, **options):
+        storage = options["storage"] or djstripe_settings.WEBHOOK_BODY_STORAGE
+        batch_size = options["batch_size"]
+
+        migrated = 0
+        skipped = 0
+        last_id = 0
+        while True:
+            batch = list(
+                WebhookEventTrigger.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", "body")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            triggers, old_bodies = [], []
+            for trigger in batch:
+                if get_body_storage(trigger.body) == storage:
+                    continue
+                try:
+                    body = decode_body(trigger.body, strict=True)
+                except Exception as e:
+                    # Keep the body, and its stored file, as they are
+                    self.stderr.write(
+                        f"  Could not decode the body of webhook event trigger "
+                        f"{trigger.id}, skipping it: {e}"
+                    )
+                    skipped += 1
+                    continue
+                old_bodies.append(trigger.body)
+                trigger.set_body(body, storage)
+                triggers.append(trigger)
+
+            if triggers:
+                with transaction.atomic():
+                    WebhookEventTrigger.objects.bulk_update(triggers, ["body"])
+                # Only delete the stored bodies once nothing refers to them
+                for body in old_bodies:
+                    delete_stored_body(body)
+                migrated += len(triggers)
+                self.stdout.write(f"  Migrated {migrated} webhook event bodies")
+
+        self.stdout.write(f"Migrated {migrated} webhook event bodies to {storage}.")
+        if skipped:
+            self.stderr.write(f"Skipped {skipped} webhook event bodies.")
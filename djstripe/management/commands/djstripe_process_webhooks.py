@@ -0,0 +1,172 @@
+"""
+Process the webhook events waiting in the database webhook queue.
+
+With DJSTRIPE_WEBHOOK_PROCESSING_MODE = "deferred", the webhook view only
+stores and validates webhook events. This command processes them afterwards,
+and retries the webhook events that failed to process (with exponential
+backoff) until they succeed or fail --max-attempts times.
+
+Several instances of this command can run at once: each webhook event is
+claimed by a single worker.
+
+Usage:
+    1) To process the webhook events waiting in the queue, then exit:
+        python manage.py djstripe_process_webhooks
+
+    2) To keep processing webhook events as they arrive, checking the queue
+    every 5 seconds, 4 at a time:
+        python manage.py djstripe_process_webhooks --poll-interval 5 --concurrency 4
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from ...models import WebhookEventTrigger
+from ...settings import djstripe_settings
+
+
+class Command(BaseCommand):
+    """Process the webhook events waiting in the database webhook queue."""
+
+    help = "Process the webhook events waiting in the database webhook queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=100,
+            help="how many webhook events to claim from the queue at a time "
+            "(default 100)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0,
+            help="keep running, checking the queue every POLL_INTERVAL seconds "
+            "(default: exit once the queue is empty)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="how many webhook events to process at once (default 1)",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="how many times to try processing a webhook event before "
+            "giving up on it (default 5)",
+        )
+        parser.add_argument(
+            "--retry-delay",
+            type=float,
+            default=60,
+            help="how many seconds to wait before the first retry, doubling on "
+            "each retry (default 60)",
+        )
+        parser.add_argument(
+            "--lease",
+            type=float,
+            default=300,
+            help="how many seconds a claimed webhook event is reserved for this "
+            "worker, after which it is retried if it wasn't processed "
+            "(default 300)",
+        )
+
+    def handle(self, *args, **options):
+        self.limit = options["limit"]
+        self.concurrency = options["concurrency"]
+        self.max_attempts = options["max_attempts"]
+        self.retry_delay = options["retry_delay"]
+        self.lease = options["lease"]
+        poll_interval = options["poll_interval"]
+
+        self.executor = None
+        if self.concurrency > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        try:
+            while True:
+                claimed = self.process_queue()
+                if claimed < self.limit:
+                    if not poll_interval:
+                        break
+                    time.sleep(poll_interval)
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+
+    def get_queryset(self):
+        queryset = WebhookEventTrigger.objects.pending()
+        if djstripe_settings.WEBHOOK_QUEUE_BACKEND:
+            # Deferred webhook events are handed to the queue backend,
+            # only retry those that failed to process.
+            queryset = queryset.exclude(exception="")
+        return queryset
+
+    def process_queue(self):
+        """
+        Claims up to --limit webhook events from the queue and processes them.
+
+        :returns: the number of webhook events claimed from the queue.
+        :rtype: int
+        """
+        triggers = WebhookEventTrigger.objects.claim(
+            self.get_queryset(),
+            limit=self.limit,
+            lease=self.lease,
+            max_attempts=self.max_attempts,
+        )
+        if self.executor:
+            results = self.executor.map(self.process_trigger, triggers)
+        else:
+            results = map(self.process_trigger, triggers)
+
+        for trigger, processed in zip(triggers, results):
+            if processed:
+                self.stdout.write(f"  Processed {trigger.event}")
+            elif trigger.dead_lettered:
+                self.stderr.write(
+                    f"  Gave up on {trigger} after {trigger.attempts} attempts: "
+                    f"{trigger.exception}"
+                )
+            else:
+                self.stderr.write(
+                    f"  Failed to process {trigger}, retrying at "
+                    f"{trigger.next_attempt_at}: {trigger.exception}"
+                )
+
+        return len(triggers)
+
+    def process_trigger(self, trigger):
+        try:
+            if trigger.process_deferred():
+                return True
+            self.schedule_retry(trigger)
+            return False
+        finally:
+            if self.executor:
+                # Django opens a connection per thread, which would otherwise leak.
+                connections.close_all()
+
+    def schedule_retry(self, trigger):
+        """
+        Schedules the next attempt to process a trigger that failed to process,
+        with exponential backoff and jitter, or gives up on it after
+        --max-attempts attempts.
+        """
+        if trigger.attempts >= self.max_attempts:
+            trigger.dead_lettered = True
+            trigger.next_attempt_at = None
+        else:
+            delay = self.retry_delay * 2 ** (trigger.attempts - 1)
+            trigger.next_attempt_at = timezone.now() + timedelta(
+                seconds=random.uniform(delay / 2, delay)
+            )
+        trigger.save(update_fields=["dead_lettered", "next_attempt_at", "updated"])
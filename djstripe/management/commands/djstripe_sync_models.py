@@ -7,17 +7,98 @@ Invoke like so:
 
     2) To only sync Stripe Accounts:
         python manage.py djstripe_sync_models Account
+
+    3) To sync using 8 threads (e.g. to sync many connected accounts at once):
+        python manage.py djstripe_sync_models --workers 8
+
+    4) To only sync the objects created since the last incremental sync:
+        python manage.py djstripe_sync_models --incremental
 """
+import collections
+import datetime
+import functools
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List
 
+import django
 from django.apps import apps
 from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from stripe.error import StripeError
 
 from ... import enums, models
 from ...models.base import StripeBaseModel
 from ...settings import djstripe_settings
-
-# TODO Improve performance using multiprocessing
+from ...utils import convert_tstamp
+
+# The models whose Stripe list API can filter on the creation time
+INCREMENTAL_SYNC_MODELS = {
+    "Account",
+    "ApplicationFee",
+    "BalanceTransaction",
+    "Charge",
+    "Coupon",
+    "Customer",
+    "Dispute",
+    "Event",
+    "File",
+    "FileLink",
+    "Invoice",
+    "InvoiceItem",
+    "PaymentIntent",
+    "Payout",
+    "Plan",
+    "Price",
+    "Product",
+    "Refund",
+    "SetupIntent",
+    "Subscription",
+    "SubscriptionSchedule",
+    "TaxRate",
+    "Transfer",
+}
+
+
+def parse_since(value):
+    """
+    Parse the --since argument: a unix timestamp, an ISO 8601 date or datetime.
+    """
+    if value.isdigit():
+        return convert_tstamp(int(value))
+
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Invalid date: {value}")
+        since = datetime.datetime.combine(date, datetime.time())
+
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.utc)
+
+    return since
+
+
+def _sync_work_unit(model_name, list_kwargs, *, batch_size, incremental, since):
+    """
+    Syncs one work unit of a model in a worker process.
+
+    The command instance can't be shared with worker processes, so each
+    work unit gets its own, writing to the worker's stdout/stderr.
+    """
+    command = Command()
+    command.batch_size = batch_size
+    command.incremental = incremental
+    command.since = since
+    model = apps.get_model("djstripe", model_name)
+    try:
+        return command.sync_work_unit(model, list_kwargs)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
@@ -33,8 +114,44 @@ class Command(BaseCommand):
             help="restricts sync to these model names (default is to sync all "
             "supported models)",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="number of objects written to the database at once (default 100)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="number of work units (one per model, account and list "
+            "arguments) synced concurrently (default 1)",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=("thread", "process"),
+            default="thread",
+            help="whether --workers are threads or processes (default thread)",
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_since,
+            help="only sync objects created since this date (an ISO 8601 date or "
+            "datetime, or a unix timestamp)",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only sync objects created since the last incremental sync, "
+            "and resume interrupted incremental syncs where they stopped",
+        )
 
     def handle(self, *args, **options):
+        self.batch_size = options.get("batch_size") or 100
+        self.workers = max(options.get("workers") or 1, 1)
+        self.mode = options.get("mode") or "thread"
+        self.since = options.get("since")
+        self.incremental = options.get("incremental", False)
         app_label = "djstripe"
         app_config = apps.get_app_config(app_label)
         model_list = []  # type: List[models.StripeModel]
@@ -52,9 +169,38 @@ class Command(BaseCommand):
         else:
             model_list = app_config.get_models()
 
-        for model in model_list:
+        for model in self.sort_models_by_dependencies(model_list):
             self.sync_model(model)
 
+    @staticmethod
+    def sort_models_by_dependencies(model_list):
+        """
+        Returns the models ordered so that, as far as possible, the models each
+        model has foreign keys to are synced before it (eg. Account, then
+        Customer, then Subscription, then Invoice).
+
+        Circular relations (eg. Charge <-> Invoice) are broken arbitrarily,
+        otherwise the original order is kept.
+        """
+        model_list = list(model_list)
+        sorted_models = []
+        visiting = set()
+
+        def visit(model):
+            if model in sorted_models or model in visiting:
+                return
+            visiting.add(model)
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model in model_list:
+                    visit(field.related_model)
+            visiting.discard(model)
+            sorted_models.append(model)
+
+        for model in model_list:
+            visit(model)
+
+        return sorted_models
+
     def _should_sync_model(self, model):
         if not issubclass(model, StripeBaseModel):
             return False, "not a StripeModel"
@@ -90,64 +236,275 @@ class Command(BaseCommand):
             return
 
         self.stdout.write("Syncing {}:".format(model_name))
+        incremental = self.since or self.incremental
+        if incremental and model_name not in INCREMENTAL_SYNC_MODELS:
+            self.stderr.write(
+                f"  {model_name} can't be synced incrementally, syncing all objects"
+            )
 
         count = 0
+        errors = 0
         try:
-            # todo convert get_list_kwargs into a generator to make the code memory effecient.
-            for list_kwargs in self.get_list_kwargs(model):
-                stripe_account = list_kwargs.get("stripe_account", "")
+            for unit_count, unit_errors in self.run_work_units(
+                model, self.get_list_kwargs(model)
+            ):
+                count += unit_count
+                errors += unit_errors
 
-                if (
-                    model is models.Account
-                    and stripe_account == models.Account.get_default_account().id
-                ):
-                    # special case, since own account isn't returned by Account.api_list
-                    stripe_obj = models.Account.stripe_class.retrieve(
-                        api_key=djstripe_settings.STRIPE_SECRET_KEY
+            if count == 0:
+                self.stdout.write("  (no results)")
+            else:
+                self.stdout.write(
+                    "  Synced {count} {model_name}".format(
+                        count=count, model_name=model_name
                     )
+                )
+            if errors:
+                self.stdout.write(f"  Failed to sync {errors} {model_name}")
 
-                    djstripe_obj = model.sync_from_stripe_data(stripe_obj)
+        except Exception as e:
+            self.stderr.write(str(e))
+
+    def run_work_units(self, model, all_list_kwargs):
+        """
+        Syncs each work unit of the model (one per list_kwargs), yielding their
+        (count, errors) results.
+
+        With --workers, the work units are spread over a pool of threads or
+        processes, each using its own database connection.
+        """
+        if self.workers == 1:
+            for list_kwargs in all_list_kwargs:
+                yield self.sync_work_unit(model, list_kwargs)
+            return
+
+        if self.mode == "process":
+            # Spawned rather than forked, so that the workers start without the
+            # database connections the parent may have opened in the meantime.
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+            task = functools.partial(
+                _sync_work_unit,
+                model.__name__,
+                batch_size=self.batch_size,
+                incremental=self.incremental,
+                since=self.since,
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            task = functools.partial(self._sync_work_unit_in_thread, model)
+
+        # Only keep a few work units in flight, so that a generator of
+        # list_kwargs is consumed as fast as the workers sync them.
+        all_list_kwargs = iter(all_list_kwargs)
+        with executor:
+            futures = collections.deque(
+                executor.submit(task, list_kwargs)
+                for list_kwargs in itertools.islice(all_list_kwargs, 2 * self.workers)
+            )
+            while futures:
+                future = futures.popleft()
+                try:
+                    yield future.result()
+                except Exception as e:
+                    self.stderr.write(f"Skipping: {e}")
+                    yield 0, 1
+
+                for list_kwargs in itertools.islice(all_list_kwargs, 1):
+                    futures.append(executor.submit(task, list_kwargs))
+
+    def _sync_work_unit_in_thread(self, model, list_kwargs):
+        try:
+            return self.sync_work_unit(model, list_kwargs)
+        finally:
+            # Django opens a connection per thread, which would otherwise leak.
+            connections.close_all()
+
+    def sync_work_unit(self, model, list_kwargs):
+        """
+        Syncs all the objects of the model listed with list_kwargs.
+
+        :returns: the number of objects synced and the number of errors.
+        :rtype: Tuple[int, int]
+        """
+        count = 0
+        errors = 0
+        stripe_account = list_kwargs.get("stripe_account", "")
+
+        if (
+            model is models.Account
+            and stripe_account == models.Account.get_default_account().id
+        ):
+            # special case, since own account isn't returned by Account.api_list
+            stripe_obj = models.Account.stripe_class.retrieve(
+                api_key=djstripe_settings.STRIPE_SECRET_KEY
+            )
+
+            djstripe_obj = model.sync_from_stripe_data(stripe_obj)
+            self.stdout.write(
+                f"  id={djstripe_obj.id}, pk={djstripe_obj.pk} ({djstripe_obj} on {stripe_account})"
+            )
+
+            # syncing BankAccount and Card objects of Stripe Connected Express and Custom Accounts
+            self.sync_bank_accounts_and_cards(
+                djstripe_obj, stripe_account=stripe_account
+            )
+            count += 1
+
+        list_kwargs, checkpoint = self.get_incremental_list_kwargs(model, list_kwargs)
+        finished = False
+
+        try:
+            for djstripe_obj in self.checkpointed(
+                checkpoint,
+                self.sync_stripe_objects(model, model.api_list(**list_kwargs)),
+            ):
+                if djstripe_obj is None:
+                    # syncing this object failed, see sync_stripe_objects()
+                    errors += 1
+                    continue
+
+                # Skip model instances that throw an error
+                try:
                     self.stdout.write(
                         f"  id={djstripe_obj.id}, pk={djstripe_obj.pk} ({djstripe_obj} on {stripe_account})"
                     )
-
                     # syncing BankAccount and Card objects of Stripe Connected Express and Custom Accounts
                     self.sync_bank_accounts_and_cards(
                         djstripe_obj, stripe_account=stripe_account
                     )
                     count += 1
-
-                try:
-                    for stripe_obj in model.api_list(**list_kwargs):
-                        # Skip model instances that throw an error
-                        try:
-                            djstripe_obj = model.sync_from_stripe_data(stripe_obj)
-                            self.stdout.write(
-                                f"  id={djstripe_obj.id}, pk={djstripe_obj.pk} ({djstripe_obj} on {stripe_account})"
-                            )
-                            # syncing BankAccount and Card objects of Stripe Connected Express and Custom Accounts
-                            self.sync_bank_accounts_and_cards(
-                                djstripe_obj, stripe_account=stripe_account
-                            )
-                            count += 1
-                        except Exception as e:
-                            self.stderr.write(f"Skipping {stripe_obj.get('id')}: {e}")
-
-                            continue
                 except Exception as e:
-                    self.stderr.write(f"Skipping: {e}")
+                    self.stderr.write(f"Skipping {djstripe_obj.id}: {e}")
+                    errors += 1
+            finished = True
+        except Exception as e:
+            self.stderr.write(f"Skipping: {e}")
+            errors += 1
 
-            if count == 0:
-                self.stdout.write("  (no results)")
-            else:
+        if checkpoint is not None:
+            self.save_checkpoint(checkpoint, finished=finished, errors=errors)
+
+        return count, errors
+
+    def get_incremental_list_kwargs(self, model, list_kwargs):
+        """
+        Returns the list_kwargs limiting the sync to the objects created since
+        --since or the last incremental sync, and the sync's checkpoint
+        (only with --incremental, otherwise None).
+
+        Stripe lists objects from newest to oldest, so an interrupted
+        incremental sync is resumed after the last object it synced.
+        """
+        if not (self.since or self.incremental):
+            return list_kwargs, None
+
+        if model.__name__ not in INCREMENTAL_SYNC_MODELS or not (
+            list_kwargs.keys() <= {"stripe_account", "expand"}
+        ):
+            # See sync_model()
+            return list_kwargs, None
+
+        since = self.since
+        checkpoint = None
+
+        if self.incremental:
+            checkpoint, _ = models.SyncCheckpoint.objects.get_or_create(
+                model_name=model.__name__,
+                stripe_account=list_kwargs.get("stripe_account") or "",
+            )
+            if checkpoint.high_water_mark and (
+                since is None or checkpoint.high_water_mark > since
+            ):
+                since = checkpoint.high_water_mark
+            if checkpoint.starting_after:
                 self.stdout.write(
-                    "  Synced {count} {model_name}".format(
-                        count=count, model_name=model_name
-                    )
+                    f"  Resuming {model.__name__} sync after "
+                    f"{checkpoint.starting_after}"
                 )
+                list_kwargs = {
+                    "starting_after": checkpoint.starting_after,
+                    **list_kwargs,
+                }
 
-        except Exception as e:
-            self.stderr.write(str(e))
+        if since is not None:
+            list_kwargs = {
+                "created": {"gte": int(since.timestamp())},
+                **list_kwargs,
+            }
+
+        return list_kwargs, checkpoint
+
+    def checkpointed(self, checkpoint, djstripe_objs):
+        """
+        Advances the checkpoint past each synced object, saving it every
+        batch_size objects so that an interrupted sync can be resumed.
+        """
+        if checkpoint is None:
+            yield from djstripe_objs
+            return
+
+        for i, djstripe_obj in enumerate(djstripe_objs, start=1):
+            yield djstripe_obj
+            if djstripe_obj is not None:
+                checkpoint.advance(djstripe_obj.created, djstripe_obj.id)
+            if i % self.batch_size == 0:
+                checkpoint.save()
+
+    @staticmethod
+    def save_checkpoint(checkpoint, *, finished, errors):
+        """
+        Saves the checkpoint at the end of a work unit.
+
+        Only a sync that went through all the objects without errors moves the
+        high-water mark forward. If some objects failed to sync, the next
+        incremental sync starts over from the same high-water mark; if the sync
+        was interrupted, it is resumed after the last object synced.
+        """
+        if finished and not errors:
+            checkpoint.complete()
+        elif finished:
+            checkpoint.starting_after = ""
+        checkpoint.save()
+
+    def sync_stripe_objects(self, model, stripe_objs):
+        """
+        Syncs the given stripe objects in batches, yielding the synced instances.
+
+        If a batch can't be synced in bulk because of a Stripe API error (e.g.
+        retrieving a related object) or a conflicting write, its objects are
+        synced one by one instead, yielding None for the objects that throw an
+        error. Other errors abort the sync.
+        """
+        sync_many = getattr(model, "sync_many_from_stripe_data", None)
+        stripe_objs = iter(stripe_objs)
+
+        while True:
+            batch = list(itertools.islice(stripe_objs, self.batch_size))
+            if not batch:
+                return
+
+            if sync_many is not None:
+                try:
+                    yield from sync_many(batch, batch_size=self.batch_size)
+                    continue
+                except (IntegrityError, StripeError) as e:
+                    self.stderr.write(
+                        f"  Could not sync {len(batch)} {model.__name__} at once, "
+                        f"syncing them one by one: {e}"
+                    )
+
+            for stripe_obj in batch:
+                # Skip model instances that throw an error
+                try:
+                    djstripe_obj = model.sync_from_stripe_data(stripe_obj)
+                except Exception as e:
+                    self.stderr.write(f"Skipping {stripe_obj.get('id')}: {e}")
+                    djstripe_obj = None
+                yield djstripe_obj
 
     @classmethod
     def get_stripe_account(cls, *args, **kwargs):
@@ -188,10 +545,9 @@ class Command(BaseCommand):
 
     @staticmethod
     def get_list_kwargs_pm(default_list_kwargs):
-        """Returns sequence of kwrags to sync Payment Methods for
+        """Yields the kwargs to sync Payment Methods for
         all Stripe Accounts"""
 
-        all_list_kwargs = []
         payment_method_types = enums.PaymentMethodType.__members__
 
         for def_kwarg in default_list_kwargs:
@@ -200,78 +556,59 @@ class Command(BaseCommand):
                 stripe_account=stripe_account
             ):
                 for type in payment_method_types:
-                    all_list_kwargs.append(
-                        {"customer": stripe_customer.id, "type": type, **def_kwarg}
-                    )
-
-        return all_list_kwargs
+                    yield {"customer": stripe_customer.id, "type": type, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_si(default_list_kwargs):
-        """Returns sequence of kwrags to sync Subscription Items for
+        """Yields the kwargs to sync Subscription Items for
         all Stripe Accounts"""
 
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
             stripe_account = def_kwarg.get("stripe_account")
             for subscription in models.Subscription.api_list(
                 stripe_account=stripe_account
             ):
-                all_list_kwargs.append({"subscription": subscription.id, **def_kwarg})
-        return all_list_kwargs
+                yield {"subscription": subscription.id, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_country_spec(default_list_kwargs):
-        """Returns sequence of kwrags to sync Country Specs for
+        """Yields the kwargs to sync Country Specs for
         all Stripe Accounts"""
 
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
-            all_list_kwargs.append({"limit": 50, **def_kwarg})
-
-        return all_list_kwargs
+            yield {"limit": 50, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_trr(default_list_kwargs):
-        """Returns sequence of kwrags to sync Transfer Reversals for
+        """Yields the kwargs to sync Transfer Reversals for
         all Stripe Accounts"""
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
             stripe_account = def_kwarg.get("stripe_account")
             for transfer in models.Transfer.api_list(stripe_account=stripe_account):
-                all_list_kwargs.append({"id": transfer.id, **def_kwarg})
-
-        return all_list_kwargs
+                yield {"id": transfer.id, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_fee_refund(default_list_kwargs):
-        """Returns sequence of kwrags to sync Application Fee Refunds for
+        """Yields the kwargs to sync Application Fee Refunds for
         all Stripe Accounts"""
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
             stripe_account = def_kwarg.get("stripe_account")
             for fee in models.ApplicationFee.api_list(stripe_account=stripe_account):
-                all_list_kwargs.append({"id": fee.id, **def_kwarg})
-
-        return all_list_kwargs
+                yield {"id": fee.id, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_tax_id(default_list_kwargs):
-        """Returns sequence of kwrags to sync Tax Ids for
+        """Yields the kwargs to sync Tax Ids for
         all Stripe Accounts"""
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
             stripe_account = def_kwarg.get("stripe_account")
             for customer in models.Customer.api_list(stripe_account=stripe_account):
-                all_list_kwargs.append({"id": customer.id, **def_kwarg})
-
-        return all_list_kwargs
+                yield {"id": customer.id, **def_kwarg}
 
     @staticmethod
     def get_list_kwargs_sis(default_list_kwargs):
-        """Returns sequence of kwrags to sync Usage Record Summarys for
+        """Yields the kwargs to sync Usage Record Summarys for
         all Stripe Accounts"""
-        all_list_kwargs = []
         for def_kwarg in default_list_kwargs:
             stripe_account = def_kwarg.get("stripe_account")
             for subscription in models.Subscription.api_list(
@@ -280,19 +617,19 @@ class Command(BaseCommand):
                 for subscription_item in models.SubscriptionItem.api_list(
                     subscription=subscription.id, stripe_account=stripe_account
                 ):
-                    all_list_kwargs.append({"id": subscription_item.id, **def_kwarg})
-
-        return all_list_kwargs
+                    yield {"id": subscription_item.id, **def_kwarg}
 
     # todo handle supoorting double + nested fields like data.invoice.subscriptions.customer etc?
     def get_list_kwargs(self, model):
         """
-        Returns a sequence of kwargs dicts to pass to model.api_list
+        Returns an iterable of kwargs dicts to pass to model.api_list
 
-        This allows us to sync models that require parameters to api_list
+        This allows us to sync models that require parameters to api_list.
+        Models listed per parent object (e.g. Subscription Items) get a
+        generator, which lists the parent objects as the work units are synced.
 
         :param model:
-        :return: Sequence[dict]
+        :return: Iterable[dict]
         """
 
         list_kwarg_handlers_dict = {
@@ -2,8 +2,11 @@
 dj-stripe model managers
 """
 import decimal
+from datetime import timedelta
 
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 
 class StripeModelManager(models.Manager):
@@ -100,3 +103,75 @@ class ChargeManager(models.Manager):
                 total_refunded=models.Sum("amount_refunded"),
             )
         )
+
+
+class WebhookEventTriggerManager(models.Manager):
+    """Manager used in models.WebhookEventTrigger."""
+
+    def pending(self):
+        """
+        Return the WebhookEventTriggers waiting in the webhook queue: the valid,
+        unprocessed triggers whose processing was deferred or failed, and which
+        are due for an attempt.
+        """
+        return self.filter(
+            Q(deferred=True) | ~Q(exception=""),
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()),
+            valid=True,
+            processed=False,
+            dead_lettered=False,
+        )
+
+    def received(self, event_id):
+        """
+        Return the valid WebhookEventTriggers of the Stripe event with the given
+        ID which were processed, or are waiting in the webhook queue: a webhook
+        event redelivered after these doesn't need to be processed again.
+        """
+        return self.filter(
+            Q(processed=True) | Q(deferred=True, dead_lettered=False),
+            stripe_event_id=event_id,
+            valid=True,
+        )
+
+    def claim(self, queryset, limit, lease, max_attempts=None):
+        """
+        Claim up to limit WebhookEventTriggers from queryset (oldest first) for
+        processing, so that other workers skip them for lease seconds.
+
+        The triggers of queryset which were attempted max_attempts times are
+        given up on (dead-lettered) instead: e.g. those whose worker crashed
+        during their last attempt, so that their lease ran out.
+
+        Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED where the
+        database supports it. Elsewhere, each trigger is claimed with an UPDATE
+        conditional on its attempts count, which only one worker can win.
+        """
+        db = router.db_for_write(self.model)
+        if max_attempts is not None:
+            queryset.using(db).filter(attempts__gte=max_attempts).update(
+                dead_lettered=True, next_attempt_at=None
+            )
+        queryset = queryset.using(db).order_by("created", "id")
+        lease_until = timezone.now() + timedelta(seconds=lease)
+
+        if connections[db].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=db):
+                ids = list(
+                    queryset.select_for_update(skip_locked=True).values_list(
+                        "id", flat=True
+                    )[:limit]
+                )
+                self.using(db).filter(id__in=ids).update(
+                    attempts=F("attempts") + 1, next_attempt_at=lease_until
+                )
+        else:
+            ids = [
+                id
+                for id, attempts in queryset.values_list("id", "attempts")[:limit]
+                if self.using(db)
+                .filter(id=id, attempts=attempts)
+                .update(attempts=attempts + 1, next_attempt_at=lease_until)
+            ]
+
+        return list(self.using(db).filter(id__in=ids).order_by("created", "id"))
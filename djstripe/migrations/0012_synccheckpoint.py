@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0011_2_7"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model_name",
+                    models.CharField(
+                        help_text="The name of the synced dj-stripe model.",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "stripe_account",
+                    models.CharField(
+                        blank=True,
+                        help_text="The ID of the Stripe Account the objects were listed for.",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "high_water_mark",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="The creation time of the newest object synced by the last completed sync.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "pending_high_water_mark",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="The creation time of the newest object synced by the sync in progress.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "starting_after",
+                    models.CharField(
+                        blank=True,
+                        help_text="The ID of the last object synced by the sync in progress, which it resumes from if it's interrupted.",
+                        max_length=255,
+                    ),
+                ),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("model_name", "stripe_account")},
+            },
+        ),
+    ]
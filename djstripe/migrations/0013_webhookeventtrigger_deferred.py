@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0012_synccheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="deferred",
+            field=models.BooleanField(
+                default=False,
+                help_text="Whether or not processing of the webhook event was "
+                "deferred to the webhook queue",
+            ),
+        ),
+    ]
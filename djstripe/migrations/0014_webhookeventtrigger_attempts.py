@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0013_webhookeventtrigger_deferred"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="attempts",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="How many times the webhook queue tried to process the "
+                "webhook event",
+            ),
+        ),
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="next_attempt_at",
+            field=models.DateTimeField(
+                blank=True,
+                null=True,
+                help_text="When the webhook queue may next try to process the "
+                "webhook event",
+            ),
+        ),
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="dead_lettered",
+            field=models.BooleanField(
+                default=False,
+                help_text="Whether or not the webhook queue gave up on processing "
+                "the webhook event after too many failed attempts",
+            ),
+        ),
+    ]
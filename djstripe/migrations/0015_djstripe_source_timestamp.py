@@ -0,0 +1,66 @@
+from django.db import migrations, models
+
+SOURCE_TIMESTAMP_MODELS = [
+    "account",
+    "apikey",
+    "applicationfee",
+    "applicationfeerefund",
+    "balancetransaction",
+    "bankaccount",
+    "card",
+    "charge",
+    "coupon",
+    "customer",
+    "dispute",
+    "event",
+    "file",
+    "filelink",
+    "invoice",
+    "invoiceitem",
+    "mandate",
+    "paymentintent",
+    "paymentmethod",
+    "payout",
+    "plan",
+    "price",
+    "product",
+    "refund",
+    "scheduledqueryrun",
+    "session",
+    "setupintent",
+    "source",
+    "subscription",
+    "subscriptionitem",
+    "subscriptionschedule",
+    "taxid",
+    "taxrate",
+    "transfer",
+    "transferreversal",
+    "upcominginvoice",
+    "usagerecord",
+    "usagerecordsummary",
+    "webhookendpoint",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0014_webhookeventtrigger_attempts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=model_name,
+            name="djstripe_source_timestamp",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the Stripe data this object was last synced from "
+                "was current (when it was retrieved, or when the event it came from "
+                "was created). Null if unknown.",
+                null=True,
+            ),
+        )
+        for model_name in SOURCE_TIMESTAMP_MODELS
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+
+PAYLOAD_HASH_MODELS = [
+    "account",
+    "apikey",
+    "applicationfee",
+    "applicationfeerefund",
+    "balancetransaction",
+    "bankaccount",
+    "card",
+    "charge",
+    "coupon",
+    "customer",
+    "dispute",
+    "event",
+    "file",
+    "filelink",
+    "invoice",
+    "invoiceitem",
+    "mandate",
+    "paymentintent",
+    "paymentmethod",
+    "payout",
+    "plan",
+    "price",
+    "product",
+    "refund",
+    "scheduledqueryrun",
+    "session",
+    "setupintent",
+    "source",
+    "subscription",
+    "subscriptionitem",
+    "subscriptionschedule",
+    "taxid",
+    "taxrate",
+    "transfer",
+    "transferreversal",
+    "upcominginvoice",
+    "usagerecord",
+    "usagerecordsummary",
+    "webhookendpoint",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0015_djstripe_source_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=model_name,
+            name="djstripe_payload_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="A hash of the Stripe data this object was last synced "
+                "from, so that syncing the same data again can be skipped.",
+                max_length=64,
+            ),
+        )
+        for model_name in PAYLOAD_HASH_MODELS
+    ]
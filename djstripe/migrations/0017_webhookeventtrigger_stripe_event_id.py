@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djstripe", "0016_djstripe_payload_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="stripe_event_id",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="The ID of the Stripe event in the webhook, as sent "
+                "(untrusted)",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="webhookeventtrigger",
+            name="duplicate",
+            field=models.BooleanField(
+                default=False,
+                help_text="Whether or not the webhook event was a redelivery of an "
+                "event which was already received, and was neither validated nor "
+                "processed",
+            ),
+        ),
+    ]
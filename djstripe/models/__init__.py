@@ -1,6 +1,6 @@
 from .account import Account
 from .api import APIKey
-from .base import IdempotencyKey, StripeModel
+from .base import IdempotencyKey, StripeModel, SyncCheckpoint
 from .billing import (
     Coupon,
     Invoice,
@@ -87,6 +87,7 @@ __all__ = [
     "Subscription",
     "SubscriptionItem",
     "SubscriptionSchedule",
+    "SyncCheckpoint",
     "TaxId",
     "TaxRate",
     "Transfer",
@@ -1,15 +1,23 @@
 import logging
+import operator
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from typing import Dict, List, Optional
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from django.db import IntegrityError, models, transaction
+from django.core.exceptions import FieldDoesNotExist
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
 from django.utils import dateformat, timezone
 from django.utils.encoding import smart_str
 from stripe.api_resources.abstract.api_resource import APIResource
 from stripe.error import InvalidRequestError
 
+from ..context_managers import get_identity_map, stripe_identity_map
 from ..fields import (
     JSONField,
     StripeDateTimeField,
@@ -19,10 +27,137 @@ from ..fields import (
 )
 from ..managers import StripeModelManager
 from ..settings import djstripe_settings
-from ..utils import get_friendly_currency_amount, get_id_from_stripe_data
+from ..utils import (
+    get_friendly_currency_amount,
+    get_id_from_stripe_data,
+    get_payload_hash,
+)
 
 logger = logging.getLogger(__name__)
 
+# Per-model cache of the field mapping plans built by
+# StripeModel._get_field_mapping_plan(). See clear_field_mapping_plans().
+_field_mapping_plans: Dict[type, List[tuple]] = {}
+
+
+# How many invoice lines _stripe_object_to_invoice_items() writes per query
+INVOICE_ITEMS_BATCH_SIZE = 500
+# How many items _stripe_object_to_subscription_items() writes per query
+SUBSCRIPTION_ITEMS_BATCH_SIZE = 500
+
+# The fields dj-stripe updates on each sync that changes an object, on top of
+# the fields that changed.
+SYNC_FIELDS = ["djstripe_updated", "djstripe_source_timestamp"]
+
+# Stripe rejects expansions nested more than 4 levels deep
+MAX_EXPAND_DEPTH = 4
+# A foreign key is expanded automatically (see DJSTRIPE_AUTO_EXPAND) once it was
+# synced from a bare id at least AUTO_EXPAND_MIN_SYNCS times, and the related
+# object had to be retrieved for at least AUTO_EXPAND_MIN_REFETCH_RATIO of them.
+AUTO_EXPAND_MIN_SYNCS = 20
+AUTO_EXPAND_MIN_REFETCH_RATIO = 0.9
+
+# Per-model refetch statistics, {model: {field name: [syncs, refetches]}}.
+# See record_refetch().
+_refetch_stats: Dict[type, Dict[str, list]] = {}
+_refetch_stats_lock = threading.Lock()
+# The models whose automatic expansions Stripe rejected
+_auto_expand_disabled = set()
+
+
+@receiver(class_prepared)
+def clear_field_mapping_plans(sender=None, **kwargs):
+    """
+    Discard all cached field mapping plans.
+
+    Preparing a model class can add relations (and so fields) to models that
+    already have a plan, so every plan is rebuilt lazily on next use.
+    """
+    _field_mapping_plans.clear()
+
+
+def record_refetch(model, field_name, refetched):
+    """
+    Records that a foreign key of model was synced from a bare id, and whether
+    the related object had to be retrieved from Stripe.
+    """
+    with _refetch_stats_lock:
+        stats = _refetch_stats.setdefault(model, {}).setdefault(field_name, [0, 0])
+        stats[0] += 1
+        if refetched:
+            stats[1] += 1
+
+
+def get_refetch_stats():
+    """
+    Returns the refetch statistics collected since the process started, as
+    {model: {field name: (syncs, refetches)}}.
+    """
+    with _refetch_stats_lock:
+        return {
+            model: {name: tuple(counts) for name, counts in fields.items()}
+            for model, fields in _refetch_stats.items()
+        }
+
+
+def clear_refetch_stats():
+    """
+    Discard the refetch statistics, and with them the automatic expansions.
+    """
+    with _refetch_stats_lock:
+        _refetch_stats.clear()
+        _auto_expand_disabled.clear()
+
+
+def _request_with_auto_expand(model, request, kwargs, auto_expand):
+    """
+    Sends request(**kwargs), also expanding the auto_expand paths.
+
+    If Stripe rejects the expansions (not every field referring to an object
+    can be expanded), the automatic expansions of model are disabled and the
+    request is sent again without them.
+    """
+    if not auto_expand:
+        return request(**kwargs)
+
+    expand = list(kwargs.get("expand") or [])
+    try:
+        return request(
+            **{**kwargs, "expand": expand + [p for p in auto_expand if p not in expand]}
+        )
+    except InvalidRequestError as e:
+        if "expand" not in str(e):
+            raise
+        logger.warning(
+            "Disabling the automatic expansions of %s (%s): %s",
+            model.__name__,
+            ", ".join(auto_expand),
+            e,
+        )
+        _auto_expand_disabled.add(model)
+        return request(**kwargs)
+
+
+def _get_field_converter(field):
+    """
+    Returns a callable converting the Stripe data for `field` to its db value.
+    """
+    if hasattr(field, "stripe_to_db"):
+        convert = field.stripe_to_db
+    else:
+        convert = operator.methodcaller("get", field.name)
+
+    if isinstance(field, (models.CharField, models.TextField)):
+        # TODO - this applies to StripeEnumField as well, since it
+        #  sub-classes CharField, is that intentional?
+        def convert_blank(data):
+            field_data = convert(data)
+            return "" if field_data is None else field_data
+
+        return convert_blank
+
+    return convert
+
 
 class StripeBaseModel(models.Model):
     stripe_class: Optional[APIResource] = None
@@ -46,8 +181,41 @@ class StripeBaseModel(models.Model):
 
         :returns: an iterator over all items in the query
         """
+        return _request_with_auto_expand(
+            cls,
+            cls.stripe_class.list,
+            {"api_key": api_key, **kwargs},
+            cls._get_list_auto_expand_fields(),
+        ).auto_paging_iter()
 
-        return cls.stripe_class.list(api_key=api_key, **kwargs).auto_paging_iter()
+    @classmethod
+    async def aapi_list(cls, api_key=djstripe_settings.STRIPE_SECRET_KEY, **kwargs):
+        """
+        Async version of api_list(): an async iterator over all items in the
+        query.
+
+        Each page is requested in a worker thread, so that the event loop isn't
+        blocked while waiting for Stripe.
+        """
+        page = await sync_to_async(_request_with_auto_expand, thread_sensitive=False)(
+            cls,
+            cls.stripe_class.list,
+            {"api_key": api_key, **kwargs},
+            cls._get_list_auto_expand_fields(),
+        )
+        while True:
+            for item in page.data:
+                yield item
+            if not page.has_more or not page.data:
+                return
+            page = await sync_to_async(page.next_page, thread_sensitive=False)()
+
+    @classmethod
+    def _get_list_auto_expand_fields(cls) -> List[str]:
+        """
+        The automatic expansions of the objects listed by api_list().
+        """
+        return []
 
 
 class StripeModel(StripeBaseModel):
@@ -96,11 +264,40 @@ class StripeModel(StripeBaseModel):
     description = models.TextField(
         null=True, blank=True, help_text="A description of this object."
     )
+    djstripe_source_timestamp = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the Stripe data this object was last synced from was "
+        "current (when it was retrieved, or when the event it came from was "
+        "created). Null if unknown.",
+    )
+    djstripe_payload_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        help_text="A hash of the Stripe data this object was last synced from, "
+        "so that syncing the same data again can be skipped.",
+    )
 
     class Meta:
         abstract = True
         get_latest_by = "created"
 
+    def save(self, *args, keep_payload_hash=False, **kwargs):
+        """
+        Saves the object. Unless keep_payload_hash is True, the object is then
+        considered changed since it was last synced, and the next sync won't be
+        skipped even if the Stripe data didn't change.
+        """
+        if not keep_payload_hash and self.djstripe_payload_hash:
+            self.djstripe_payload_hash = ""
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "djstripe_payload_hash"]
+        super().save(*args, **kwargs)
+
     def _get_base_stripe_dashboard_url(self):
         owner_path_prefix = (
             (self.djstripe_owner_account.id + "/")
@@ -189,15 +386,110 @@ class StripeModel(StripeBaseModel):
             for which this request is being made.
         :type stripe_account: string
         """
+        return self._stripe_retrieve(
+            **self._get_retrieve_kwargs(api_key, stripe_account)
+        )
+
+    async def aapi_retrieve(self, api_key=None, stripe_account=None):
+        """
+        Async version of api_retrieve().
+
+        The request is sent from a worker thread, so that the event loop isn't
+        blocked while waiting for Stripe, and many requests can be awaited
+        concurrently.
+        """
+        if type(self).api_retrieve is not StripeModel.api_retrieve:
+            # Customised retrieves may use the database, which must stay in
+            # the thread of the current request.
+            return await sync_to_async(self.api_retrieve)(
+                api_key=api_key, stripe_account=stripe_account
+            )
+
+        # Looking up the api key and account uses the database
+        kwargs = await sync_to_async(self._get_retrieve_kwargs)(api_key, stripe_account)
+        return await sync_to_async(self._stripe_retrieve, thread_sensitive=False)(
+            **kwargs
+        )
+
+    def _get_retrieve_kwargs(self, api_key=None, stripe_account=None):
         # Prefer passed in stripe_account if set.
         if not stripe_account:
             stripe_account = self._get_stripe_account_id(api_key)
 
-        return self.stripe_class.retrieve(
-            id=self.id,
-            api_key=api_key or self.default_api_key,
-            expand=self.expand_fields,
-            stripe_account=stripe_account,
+        return {
+            "id": self.id,
+            "api_key": api_key or self.default_api_key,
+            "expand": self.expand_fields,
+            "stripe_account": stripe_account,
+        }
+
+    @classmethod
+    def _stripe_retrieve(cls, **kwargs):
+        """
+        Retrieves an object from Stripe with the given kwargs, also expanding
+        the automatic expansions of the model.
+        """
+        return _request_with_auto_expand(
+            cls, cls.stripe_class.retrieve, kwargs, cls._get_auto_expand_fields()
+        )
+
+    @classmethod
+    def _get_auto_expand_fields(cls, max_depth=MAX_EXPAND_DEPTH) -> List[str]:
+        """
+        Returns the foreign keys to expand when retrieving objects of this model,
+        on top of expand_fields, as paths at most max_depth levels deep.
+
+        These are the foreign keys set in DJSTRIPE_AUTO_EXPAND_OVERRIDES for the
+        model or, with DJSTRIPE_AUTO_EXPAND, the foreign keys whose related
+        object almost always had to be retrieved when syncing (see
+        record_refetch()). The automatic expansions of the related models are
+        expanded as well, within Stripe's depth limit.
+        """
+        if max_depth < 1 or cls in _auto_expand_disabled:
+            return []
+
+        field_names = djstripe_settings.AUTO_EXPAND_OVERRIDES.get(cls.__name__)
+        if field_names is None:
+            if not djstripe_settings.AUTO_EXPAND:
+                return []
+            field_names = cls._get_refetched_fields()
+
+        paths = []
+        for field_name in field_names:
+            paths.append(field_name)
+            try:
+                related_model = cls._meta.get_field(field_name).related_model
+            except FieldDoesNotExist:
+                continue
+            if related_model is not None and issubclass(related_model, StripeModel):
+                paths.extend(
+                    f"{field_name}.{path}"
+                    for path in related_model._get_auto_expand_fields(max_depth - 1)
+                )
+        return paths
+
+    @classmethod
+    def _get_list_auto_expand_fields(cls) -> List[str]:
+        return [
+            f"data.{path}" for path in cls._get_auto_expand_fields(MAX_EXPAND_DEPTH - 1)
+        ]
+
+    @classmethod
+    def _get_refetched_fields(cls) -> List[str]:
+        """
+        Returns the foreign keys whose related object almost always had to be
+        retrieved when syncing objects of this model.
+        """
+        with _refetch_stats_lock:
+            stats = [
+                (field_name, *counts)
+                for field_name, counts in _refetch_stats.get(cls, {}).items()
+            ]
+        return sorted(
+            field_name
+            for field_name, syncs, refetches in stats
+            if syncs >= AUTO_EXPAND_MIN_SYNCS
+            and refetches >= syncs * AUTO_EXPAND_MIN_REFETCH_RATIO
         )
 
     @classmethod
@@ -289,7 +581,14 @@ class StripeModel(StripeBaseModel):
                         return Account._get_or_retrieve(id=stripe_account_id)
 
         # try to fetch by the given api_key.
-        return Account.get_or_retrieve_for_api_key(api_key)
+        identity_map = get_identity_map()
+        if identity_map is None:
+            return Account.get_or_retrieve_for_api_key(api_key)
+        if api_key not in identity_map.api_key_accounts:
+            identity_map.api_key_accounts[
+                api_key
+            ] = Account.get_or_retrieve_for_api_key(api_key)
+        return identity_map.api_key_accounts[api_key]
 
     @classmethod
     def _stripe_object_to_record(
@@ -329,6 +628,51 @@ class StripeModel(StripeBaseModel):
         if current_ids is None:
             current_ids = set()
 
+        cls._prefetch_foreign_keys(
+            [manipulated_data], current_ids=current_ids, stripe_account=stripe_account
+        )
+
+        for field, convert in cls._get_field_mapping_plan():
+            if convert is None:
+                field_data, skip, is_nulled = cls._stripe_object_field_to_foreign_key(
+                    field=field,
+                    manipulated_data=manipulated_data,
+                    current_ids=current_ids,
+                    pending_relations=pending_relations,
+                    stripe_account=stripe_account,
+                )
+
+                if skip and not is_nulled:
+                    continue
+            else:
+                field_data = convert(manipulated_data)
+
+            result[field.name] = field_data
+
+        # For all objects other than the account object itself, get the API key
+        # attached to the request, and get the matching Account for that key.
+        owner_account = cls._find_owner_account(data, api_key=api_key)
+        if owner_account:
+            result["djstripe_owner_account"] = owner_account
+
+        return result
+
+    @classmethod
+    def _get_field_mapping_plan(cls) -> List[tuple]:
+        """
+        Returns the list of ``(field, converter)`` pairs that
+        _stripe_object_to_record runs for this model.
+
+        The plan is built on first use and cached per model. A ``None`` converter
+        marks a relation, which has to be resolved through
+        _stripe_object_field_to_foreign_key as it depends on the sync state.
+        """
+        try:
+            return _field_mapping_plans[cls]
+        except KeyError:
+            pass
+
+        plan = []
         # Iterate over all the fields that we know are related to Stripe,
         # let each field work its own magic
         ignore_fields = ["date_purged", "subscriber"]  # XXX: Customer hack
@@ -354,39 +698,94 @@ class StripeModel(StripeBaseModel):
 
             # will work for Forward FK and OneToOneField relations and reverse OneToOneField relations
             if isinstance(field, (models.ForeignKey, models.OneToOneRel)):
-                field_data, skip, is_nulled = cls._stripe_object_field_to_foreign_key(
-                    field=field,
-                    manipulated_data=manipulated_data,
-                    current_ids=current_ids,
-                    pending_relations=pending_relations,
-                    stripe_account=stripe_account,
-                )
-
-                if skip and not is_nulled:
-                    continue
+                plan.append((field, None))
             else:
-                if hasattr(field, "stripe_to_db"):
-                    field_data = field.stripe_to_db(manipulated_data)
-                else:
-                    field_data = manipulated_data.get(field.name)
+                plan.append((field, _get_field_converter(field)))
+
+        _field_mapping_plans[cls] = plan
+        return plan
 
+    @classmethod
+    def _prefetch_foreign_keys(cls, data_list, current_ids=(), stripe_account=None):
+        """
+        Retrieves the related objects which the objects in data_list only refer
+        to by id, and which aren't synced yet, concurrently.
+
+        Syncing the foreign keys would otherwise retrieve them one after the
+        other. The retrieved data is kept in the current identity map, where
+        _get_or_create_from_stripe_object() picks it up: the related objects are
+        still synced (and their own foreign keys resolved) in the same order.
+        See DJSTRIPE_SYNC_PREFETCH_WORKERS.
+        """
+        identity_map = get_identity_map()
+        workers = djstripe_settings.SYNC_PREFETCH_WORKERS
+        if identity_map is None or not workers:
+            return
+
+        missing = {}
+        for field, convert in cls._get_field_mapping_plan():
+            model = field.related_model
+            if (
+                convert is not None
+                or not issubclass(model, StripeModel)
+                or not model._supports_prefetch()
+            ):
+                continue
+            for data in data_list:
+                id_ = data.get(field.name)
                 if (
-                    isinstance(field, (models.CharField, models.TextField))
-                    and field_data is None
+                    isinstance(id_, str)
+                    and id_ not in current_ids
+                    and (model, id_) not in identity_map.instances
+                    and (model, id_) not in identity_map.prefetched
                 ):
-                    # TODO - this applies to StripeEnumField as well, since it
-                    #  sub-classes CharField, is that intentional?
-                    field_data = ""
-
-            result[field.name] = field_data
-
-        # For all objects other than the account object itself, get the API key
-        # attached to the request, and get the matching Account for that key.
-        owner_account = cls._find_owner_account(data, api_key=api_key)
-        if owner_account:
-            result["djstripe_owner_account"] = owner_account
+                    missing.setdefault(model, set()).add(id_)
+
+        to_retrieve = []
+        for model, ids in missing.items():
+            # The related objects which exist already are loaded in one query,
+            # and resolved from the identity map when syncing the foreign keys.
+            for instance in model.stripe_objects.filter(id__in=ids):
+                identity_map.add(instance)
+                ids.discard(instance.id)
+            for id_ in ids:
+                # Looking up the api key and account uses the database, which
+                # must be done from this thread.
+                kwargs = model(id=id_)._get_retrieve_kwargs(
+                    stripe_account=stripe_account
+                )
+                to_retrieve.append((model, id_, kwargs))
+
+        if len(to_retrieve) < 2:
+            # Nothing to gain from retrieving it ahead
+            return
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(to_retrieve))) as executor:
+            futures = [
+                (model, id_, executor.submit(model._stripe_retrieve, **kwargs))
+                for model, id_, kwargs in to_retrieve
+            ]
+            for model, id_, future in futures:
+                try:
+                    identity_map.prefetched[(model, id_)] = future.result()
+                except Exception:
+                    # Retrieved (and handled) again when syncing the foreign key
+                    logger.debug(
+                        "Could not prefetch %s %s", model.__name__, id_, exc_info=True
+                    )
 
-        return result
+    @classmethod
+    def _supports_prefetch(cls) -> bool:
+        """
+        Whether _prefetch_foreign_keys() can retrieve objects of this model
+        ahead of their sync: models customising how they are retrieved or
+        created must go through it when syncing.
+        """
+        return (
+            cls.api_retrieve is StripeModel.api_retrieve
+            and cls._get_or_create_from_stripe_object.__func__
+            is StripeModel._get_or_create_from_stripe_object.__func__
+        )
 
     @classmethod
     def _stripe_object_field_to_foreign_key(
@@ -467,7 +866,10 @@ class StripeModel(StripeBaseModel):
                 # requests the same object
                 current_ids.add(id_)
 
-                field_data, _ = field.related_model._get_or_create_from_stripe_object(
+                (
+                    field_data,
+                    created,
+                ) = field.related_model._get_or_create_from_stripe_object(
                     manipulated_data,
                     field_name,
                     refetch=refetch,
@@ -475,6 +877,9 @@ class StripeModel(StripeBaseModel):
                     pending_relations=pending_relations,
                     stripe_account=stripe_account,
                 )
+                if refetch:
+                    # Only created from a bare id if it was retrieved
+                    record_refetch(cls, field_name, created)
 
                 # Remove the id of the current object from the list
                 # after it has been created or retrieved
@@ -515,35 +920,72 @@ class StripeModel(StripeBaseModel):
         :param cls: The target class for the instantiated object.
         :param data: The data dictionary received from the Stripe API.
         :type data: dict
+        :param pending_relations: list of tuples of relations to be attached
+            post-save, only given when the object was just created
+        :type pending_relations: list
         """
 
+        if not pending_relations:
+            return
+
         unprocessed_pending_relations = []
-        if pending_relations is not None:
-            for post_save_relation in pending_relations:
-                object_id, field, id_ = post_save_relation
-
-                if self.id == id_:
-                    # the target instance now exists
-                    target = field.model.objects.get(id=object_id)
-                    setattr(target, field.name, self)
-                    if isinstance(field, models.OneToOneRel):
-                        # this is a reverse relationship, so the relation exists on self
-                        self.save()
-                    else:
-                        # this is a forward relation on the target,
-                        # so we need to save it
-                        target.save()
+        # {(model, field): [ids of the objects to point at this object]}
+        relations_to_update = {}
+        for post_save_relation in pending_relations:
+            object_id, field, id_ = post_save_relation
+
+            if self.id != id_:
+                unprocessed_pending_relations.append(post_save_relation)
+            elif isinstance(field, models.OneToOneRel):
+                # this is a reverse relationship, so the relation exists on self
+                target = field.model.objects.get(id=object_id)
+                setattr(target, field.name, self)
+                self.save()
+            else:
+                # the target instance now exists
+                relations_to_update.setdefault((field.model, field), []).append(
+                    object_id
+                )
+
+        for (model, field), object_ids in relations_to_update.items():
+            # this is a forward relation on the targets, so update them all
+            # at once rather than saving each of them.
+            update_kwargs = {field.attname: self.pk}
+            if issubclass(model, StripeModel):
+                # QuerySet.update() doesn't bump auto_now fields
+                update_kwargs["djstripe_updated"] = timezone.now()
+            model.objects.filter(id__in=object_ids).update(**update_kwargs)
+            self._set_pending_relation_instances(model, field, object_ids)
+
+        if len(pending_relations) != len(unprocessed_pending_relations):
+            # replace in place so passed in list is updated in calling method
+            pending_relations[:] = unprocessed_pending_relations
+
+    def _set_pending_relation_instances(self, model, field, object_ids):
+        """
+        Point the in-memory instances of the objects just updated by
+        _attach_objects_post_save_hook() at this object, so that indirect
+        relations back to it (eg self.charge.invoice = self) are set without
+        reloading it from the database.
+        """
+        object_ids = set(object_ids)
+        instances = []
+
+        for self_field in self._meta.concrete_fields:
+            if self_field.is_relation and self_field.is_cached(self):
+                instance = self_field.get_cached_value(self)
+                if isinstance(instance, model) and instance.id in object_ids:
+                    instances.append(instance)
 
-                        # reload so that indirect relations back to this object
-                        # eg self.charge.invoice = self are set
-                        # TODO - reverse the field reference here to avoid hitting the DB?
-                        self.refresh_from_db()
-                else:
-                    unprocessed_pending_relations.append(post_save_relation)
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            for object_id in object_ids:
+                instance = identity_map.instances.get((model, object_id))
+                if instance is not None:
+                    instances.append(instance)
 
-            if len(pending_relations) != len(unprocessed_pending_relations):
-                # replace in place so passed in list is updated in calling method
-                pending_relations[:] = unprocessed_pending_relations
+        for instance in instances:
+            setattr(instance, field.name, self)
 
     @classmethod
     def _create_from_stripe_object(
@@ -583,9 +1025,12 @@ class StripeModel(StripeBaseModel):
             )
         )
         instance._attach_objects_hook(cls, data, current_ids=current_ids)
+        # Set by sync_from_stripe_data(), so that they are part of the INSERT
+        for attr, value in cls._pop_sync_fields(instance.id).items():
+            setattr(instance, attr, value)
 
         if save:
-            instance.save(force_insert=True)
+            instance.save(force_insert=True, keep_payload_hash=True)
 
         instance._attach_objects_post_save_hook(
             cls, data, pending_relations=pending_relations
@@ -593,6 +1038,27 @@ class StripeModel(StripeBaseModel):
 
         return instance
 
+    @classmethod
+    def _pop_prefetched(cls, id_):
+        """
+        Returns the Stripe data retrieved by _prefetch_foreign_keys() for the
+        object with the given id, if any.
+        """
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            return identity_map.prefetched.pop((cls, id_), None)
+
+    @classmethod
+    def _pop_sync_fields(cls, id_):
+        """
+        Returns the sync fields sync_from_stripe_data() set for the object with
+        the given id, if it is the object being synced.
+        """
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            return identity_map.sync_fields.pop((cls, id_), {})
+        return {}
+
     # flake8: noqa (C901)
     @classmethod
     def _get_or_create_from_stripe_object(
@@ -650,8 +1116,17 @@ class StripeModel(StripeBaseModel):
             # A field like {"subscription": {"id": sub_6lsC8pt7IcFpjA", ...}}
             data = field
 
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            instance = identity_map.get(cls, id_)
+            if instance is not None:
+                return instance, False
+
         try:
-            return cls.stripe_objects.get(id=id_), False
+            instance = cls.stripe_objects.get(id=id_)
+            if identity_map is not None:
+                identity_map.add(instance)
+            return instance, False
         except cls.DoesNotExist:
             if is_nested_data and refetch:
                 # This is what `data` usually looks like:
@@ -660,7 +1135,9 @@ class StripeModel(StripeBaseModel):
                 # If field_name="default_source", we get_or_create the card instead.
                 cls_instance = cls(id=id_)
                 try:
-                    data = cls_instance.api_retrieve(stripe_account=stripe_account)
+                    data = cls._pop_prefetched(id_) or cls_instance.api_retrieve(
+                        stripe_account=stripe_account
+                    )
                 except InvalidRequestError as e:
                     if "a similar object exists in" in str(e):
                         # HACK around a Stripe bug.
@@ -688,21 +1165,20 @@ class StripeModel(StripeBaseModel):
             cls.__name__, field_name
         )
 
+        if identity_map is not None:
+            savepoint = identity_map.savepoint()
         try:
             # We wrap the `_create_from_stripe_object` in a transaction to
             # avoid TransactionManagementError on subsequent queries in case
             # of the IntegrityError catch below. See PR #903
             with transaction.atomic():
-                return (
-                    cls._create_from_stripe_object(
-                        data,
-                        current_ids=current_ids,
-                        pending_relations=pending_relations,
-                        save=save,
-                        stripe_account=stripe_account,
-                        api_key=api_key,
-                    ),
-                    True,
+                instance = cls._create_from_stripe_object(
+                    data,
+                    current_ids=current_ids,
+                    pending_relations=pending_relations,
+                    save=save,
+                    stripe_account=stripe_account,
+                    api_key=api_key,
                 )
         except IntegrityError:
             # Handle the race condition that something else created the object
@@ -710,8 +1186,16 @@ class StripeModel(StripeBaseModel):
             # This is common during webhook handling, since Stripe sends
             # multiple webhook events simultaneously,
             # each of which will cause recursive syncs. See issue #429
+            if identity_map is not None:
+                # The objects created or changed in the rolled back
+                # transaction must be forgotten.
+                identity_map.rollback(savepoint)
             return cls.stripe_objects.get(id=id_), False
 
+        if identity_map is not None and instance.pk:
+            identity_map.add(instance)
+        return instance, True
+
     @classmethod
     def _stripe_object_to_customer(cls, target_cls, data, current_ids=None):
         """
@@ -825,42 +1309,66 @@ class StripeModel(StripeBaseModel):
         if not lines:
             return []
 
-        invoiceitems = []
-        for line in lines.auto_paging_iter():
-            if invoice.id:
-                save = True
-                line.setdefault("invoice", invoice.id)
-
-                if line.get("type") == "subscription":
-                    # Lines for subscriptions need to be keyed based on invoice and
-                    # subscription, because their id is *just* the subscription
-                    # when received from Stripe. This means that future updates to
-                    # a subscription will change previously saved invoices - Doing
-                    # the composite key avoids this.
-                    if not line["id"].startswith(invoice.id):
-                        line["id"] = "{invoice_id}-{subscription_id}".format(
-                            invoice_id=invoice.id, subscription_id=line["id"]
-                        )
-            else:
-                # Don't save invoice items for ephemeral invoices
-                save = False
-
-            line.setdefault("customer", invoice.customer.id)
-            line.setdefault("date", int(dateformat.format(invoice.created, "U")))
-
-            item, _ = target_cls._get_or_create_from_stripe_object(
-                line, refetch=False, save=save
+        if lines.get("has_more"):
+            lines = lines.auto_paging_iter()
+        else:
+            # Everything is in this page, no need for a paging iterator
+            lines = lines.get("data", [])
+
+        if not invoice.id:
+            # Don't save invoice items for ephemeral invoices
+            invoiceitems = []
+            for line in lines:
+                cls._prepare_invoice_item_data(line, invoice)
+                item, _ = target_cls._get_or_create_from_stripe_object(
+                    line, refetch=False, save=False
+                )
+                invoiceitems.append(item)
+            return invoiceitems
+
+        with stripe_identity_map() as identity_map:
+            # Lines point back to the invoice and its customer, which are
+            # already loaded.
+            identity_map.add(invoice)
+            if invoice.customer_id:
+                identity_map.add(invoice.customer)
+
+            return target_cls.sync_many_from_stripe_data(
+                (cls._prepare_invoice_item_data(line, invoice) for line in lines),
+                batch_size=INVOICE_ITEMS_BATCH_SIZE,
             )
-            invoiceitems.append(item)
 
-        return invoiceitems
+    @staticmethod
+    def _prepare_invoice_item_data(line, invoice):
+        """
+        Fills in the invoice line data from its invoice, for
+        _stripe_object_to_invoice_items().
+        """
+        if invoice.id:
+            line.setdefault("invoice", invoice.id)
+
+            if line.get("type") == "subscription":
+                # Lines for subscriptions need to be keyed based on invoice and
+                # subscription, because their id is *just* the subscription
+                # when received from Stripe. This means that future updates to
+                # a subscription will change previously saved invoices - Doing
+                # the composite key avoids this.
+                if not line["id"].startswith(invoice.id):
+                    line["id"] = "{invoice_id}-{subscription_id}".format(
+                        invoice_id=invoice.id, subscription_id=line["id"]
+                    )
+
+        line.setdefault("customer", invoice.customer.id)
+        line.setdefault("date", int(dateformat.format(invoice.created, "U")))
+        return line
 
     @classmethod
     def _stripe_object_to_subscription_items(cls, target_cls, data, subscription):
         """
         Retrieves SubscriptionItems for a subscription.
 
-        If the subscription item doesn't exist already then it is created.
+        The subscription items are synced in batches, and the subscription's
+        items that are no longer in the data are deleted.
 
         :param target_cls: The target class to instantiate per invoice item.
         :type target_cls: Type[djstripe.models.SubscriptionItem]
@@ -875,19 +1383,23 @@ class StripeModel(StripeBaseModel):
             subscription.items.delete()
             return []
 
-        pks = []
-        subscriptionitems = []
-        for item_data in items.auto_paging_iter():
-            item, _ = target_cls._get_or_create_from_stripe_object(
-                item_data, refetch=False
-            )
+        if items.get("has_more"):
+            items = items.auto_paging_iter()
+        else:
+            # Everything is in this page, no need for a paging iterator
+            items = items.get("data", [])
 
-            # sync the SubscriptionItem
-            target_cls.sync_from_stripe_data(item_data)
+        with stripe_identity_map() as identity_map:
+            # Items point back to the subscription, which is already loaded.
+            identity_map.add(subscription)
+
+            subscriptionitems = target_cls.sync_many_from_stripe_data(
+                items, batch_size=SUBSCRIPTION_ITEMS_BATCH_SIZE
+            )
 
-            pks.append(item.pk)
-            subscriptionitems.append(item)
-        subscription.items.exclude(pk__in=pks).delete()
+        subscription.items.exclude(
+            pk__in=[item.pk for item in subscriptionitems]
+        ).delete()
 
         return subscriptionitems
 
@@ -918,7 +1430,13 @@ class StripeModel(StripeBaseModel):
         return refund_objs
 
     @classmethod
-    def sync_from_stripe_data(cls, data, api_key=djstripe_settings.STRIPE_SECRET_KEY):
+    def sync_from_stripe_data(
+        cls,
+        data,
+        api_key=djstripe_settings.STRIPE_SECRET_KEY,
+        source_timestamp=None,
+        check_stale=True,
+    ):
         """
         Syncs this object from the stripe data provided.
 
@@ -926,38 +1444,379 @@ class StripeModel(StripeBaseModel):
 
         :param data: stripe object
         :type data: dict
+        :param source_timestamp: When the stripe data was current, e.g. when
+            the event it comes from was created. Defaults to now, for data that
+            was just retrieved.
+        :type source_timestamp: datetime
+        :param check_stale: If True and the object was already synced from data
+            newer than source_timestamp, it is returned as is. Pass False for
+            data that was just retrieved, which is always current: its
+            timestamp comes from the local clock, while the others come from
+            Stripe's (e.g. Event.created). The check assumes that both clocks
+            are less than a second apart.
+        :type check_stale: bool
         :rtype: cls
         """
-        current_ids = set()
-        data_id = data.get("id")
-        stripe_account = getattr(data, "stripe_account", None)
+        with stripe_identity_map() as identity_map:
+            current_ids = set()
+            data_id = data.get("id")
+            stripe_account = getattr(data, "stripe_account", None)
+            # Hashed before the hooks get a chance to modify the data
+            payload_hash = get_payload_hash(data)
+
+            if data_id:
+                # Fetched once: an object that needs updating is then resolved
+                # from the identity map by _get_or_create_from_stripe_object().
+                instance = identity_map.get(cls, data_id)
+                if instance is None:
+                    try:
+                        instance = cls.stripe_objects.get(id=data_id)
+                    except cls.DoesNotExist:
+                        pass
+                    else:
+                        identity_map.add(instance)
+                if instance is not None and instance._is_synced_from(
+                    payload_hash, source_timestamp if check_stale else None
+                ):
+                    logger.debug(
+                        "Not syncing %s %s from unchanged or older data",
+                        cls.__name__,
+                        data_id,
+                    )
+                    return instance
+
+            if source_timestamp is None:
+                source_timestamp = timezone.now()
+
+            if data_id:
+                # stop nested objects from trying to retrieve this object before
+                # initial sync is complete
+                current_ids.add(data_id)
+                # Saved with the object, if it gets created
+                identity_map.sync_fields[(cls, data_id)] = {
+                    "djstripe_source_timestamp": source_timestamp,
+                    "djstripe_payload_hash": payload_hash,
+                }
+
+            try:
+                instance, created = cls._get_or_create_from_stripe_object(
+                    data,
+                    current_ids=current_ids,
+                    stripe_account=stripe_account,
+                    api_key=api_key,
+                )
+            finally:
+                identity_map.sync_fields.pop((cls, data_id), None)
+
+            if not created:
+                old_values = instance._get_field_values()
+                record_data = cls._stripe_object_to_record(data, api_key=api_key)
+                for attr, value in record_data.items():
+                    setattr(instance, attr, value)
+                instance.djstripe_payload_hash = payload_hash
+                instance._attach_objects_hook(cls, data, current_ids=current_ids)
+                changed_fields = instance._get_changed_fields(old_values)
+                if changed_fields:
+                    instance.djstripe_source_timestamp = source_timestamp
+                    instance.save(
+                        update_fields=changed_fields + SYNC_FIELDS,
+                        keep_payload_hash=True,
+                    )
+                instance._attach_objects_post_save_hook(cls, data)
+                identity_map.add(instance)
+
+            for field in instance._meta.concrete_fields:
+                if isinstance(field, StripePercentField):
+                    # get rid of cached values
+                    delattr(instance, field.name)
+
+            return instance
+
+    def _get_field_values(self):
+        """
+        Returns the current value of each of this object's columns, for
+        _get_changed_fields().
+        """
+        return {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
 
-        if data_id:
-            # stop nested objects from trying to retrieve this object before
-            # initial sync is complete
-            current_ids.add(data_id)
+    def _get_changed_fields(self, old_values):
+        """
+        Returns the names of the fields whose value differs from old_values,
+        as returned by _get_field_values(), leaving out the SYNC_FIELDS.
+        """
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if field.name not in SYNC_FIELDS
+            and getattr(self, field.attname) != old_values[field.attname]
+        ]
 
-        instance, created = cls._get_or_create_from_stripe_object(
+    @classmethod
+    async def async_sync_from_stripe_data(
+        cls,
+        data,
+        api_key=djstripe_settings.STRIPE_SECRET_KEY,
+        source_timestamp=None,
+        check_stale=True,
+    ):
+        """
+        Async version of sync_from_stripe_data().
+
+        The sync runs in the thread of the current request, like the other
+        database queries made from async code, since it writes to the database
+        (and may retrieve related objects from Stripe).
+        """
+        return await sync_to_async(cls.sync_from_stripe_data)(
             data,
-            current_ids=current_ids,
-            stripe_account=stripe_account,
             api_key=api_key,
+            source_timestamp=source_timestamp,
+            check_stale=check_stale,
+        )
+
+    def _is_synced_from(self, payload_hash, source_timestamp=None):
+        """
+        Whether this object was last synced from the data with the given hash,
+        or (if source_timestamp is given) from data newer than source_timestamp.
+        """
+        if self.djstripe_payload_hash == payload_hash:
+            return True
+        # See _get_synced_after()
+        return (
+            source_timestamp is not None
+            and self.djstripe_source_timestamp is not None
+            and self.djstripe_source_timestamp
+            >= source_timestamp + timedelta(seconds=1)
+        )
+
+    @classmethod
+    def _get_synced_after(cls, id, source_timestamp):
+        """
+        Returns the object with the given id if it was last synced from data
+        newer than source_timestamp, otherwise None.
+
+        Stripe timestamps have a one second resolution, so the object's data
+        must be at least one second newer.
+        """
+        return (
+            cls.stripe_objects.filter(
+                id=id,
+                djstripe_source_timestamp__gte=source_timestamp + timedelta(seconds=1),
+            )
+            .order_by()
+            .first()
+        )
+
+    @classmethod
+    def sync_many_from_stripe_data(
+        cls, data_list, batch_size=100, api_key=djstripe_settings.STRIPE_SECRET_KEY
+    ):
+        """
+        Syncs many objects of this model from the stripe data provided.
+
+        The objects are processed in batches of ``batch_size``. For each batch,
+        the existing rows are fetched in a single query, then the new and
+        changed rows are written with ``bulk_create``/``bulk_update`` (or an
+        ``ON CONFLICT`` upsert, where the database supports it). The
+        ``_attach_objects_post_save_hook`` of each object runs in a second pass,
+        once the whole batch has been written.
+
+        Foreign keys will also be retrieved and synced recursively.
+
+        :param data_list: an iterable of stripe objects (e.g. a list page)
+        :type data_list: Iterable[dict]
+        :param batch_size: The maximum number of objects written per batch.
+        :type batch_size: int
+        :returns: The synced instances, in the order of ``data_list``.
+        :rtype: List[cls]
+        """
+        instances = []
+        batch = []
+        for data in data_list:
+            batch.append(data)
+            if len(batch) >= batch_size:
+                instances.extend(cls._sync_batch_from_stripe_data(batch, api_key))
+                batch = []
+
+        if batch:
+            instances.extend(cls._sync_batch_from_stripe_data(batch, api_key))
+
+        return instances
+
+    @classmethod
+    def _supports_bulk_sync(cls) -> bool:
+        """
+        Whether objects of this model can be synced with bulk queries.
+
+        Multi-table models can't be written with ``bulk_create``, and models
+        customising their creation need to go through it one object at a time.
+        """
+        return (
+            not cls._meta.parents
+            and cls._create_from_stripe_object.__func__
+            is StripeModel._create_from_stripe_object.__func__
+            and cls._get_or_create_from_stripe_object.__func__
+            is StripeModel._get_or_create_from_stripe_object.__func__
         )
 
-        if not created:
-            record_data = cls._stripe_object_to_record(data, api_key=api_key)
-            for attr, value in record_data.items():
-                setattr(instance, attr, value)
+    @classmethod
+    def _sync_batch_from_stripe_data(cls, batch, api_key):
+        with stripe_identity_map() as identity_map:
+            if not cls._supports_bulk_sync():
+                return [
+                    cls.sync_from_stripe_data(data, api_key=api_key) for data in batch
+                ]
+
+            savepoint = identity_map.savepoint()
+            try:
+                with transaction.atomic(using=router.db_for_write(cls)):
+                    return cls._bulk_sync_from_stripe_data(batch, api_key)
+            except IntegrityError:
+                # Something else created some of these objects after they were
+                # fetched (see _get_or_create_from_stripe_object). Sync them one
+                # by one instead, which handles that race. The objects created
+                # or changed in the rolled back transaction must be forgotten.
+                identity_map.rollback(savepoint)
+                return [
+                    cls.sync_from_stripe_data(data, api_key=api_key) for data in batch
+                ]
+
+    @classmethod
+    def _bulk_sync_from_stripe_data(cls, batch, api_key):
+        db = router.db_for_write(cls)
+        now = timezone.now()
+        existing = {
+            instance.id: instance
+            for instance in cls.stripe_objects.using(db).filter(
+                id__in=[data["id"] for data in batch]
+            )
+        }
+
+        batch_ids = {data["id"] for data in batch}
+        by_account = {}
+        for data in batch:
+            by_account.setdefault(getattr(data, "stripe_account", None), []).append(
+                data
+            )
+        for stripe_account, data_list in by_account.items():
+            cls._prefetch_foreign_keys(
+                data_list, current_ids=batch_ids, stripe_account=stripe_account
+            )
+
+        # First pass: convert every object and run the pre-save hooks.
+        # If an object is in the batch more than once, its last version wins.
+        synced = {}
+        to_create = []
+        to_update = []
+        # Only the fields that changed on at least one of the updated objects
+        update_fields = set()
+        for data_id, data in {data["id"]: data for data in batch}.items():
+            instance = existing.get(data_id)
+            current_ids = {data_id}
+            payload_hash = get_payload_hash(data)
+
+            if instance is not None and instance.djstripe_payload_hash == payload_hash:
+                # Already synced from this very data, skip it entirely.
+                synced[data_id] = (instance, None, None)
+                continue
+
+            if instance is None:
+                # Same conversion as in _create_from_stripe_object()
+                pending_relations = []
+                instance = cls(
+                    **cls._stripe_object_to_record(
+                        data,
+                        current_ids=current_ids,
+                        pending_relations=pending_relations,
+                        stripe_account=getattr(data, "stripe_account", None),
+                        api_key=api_key,
+                    )
+                )
+                to_create.append(instance)
+            else:
+                # Same conversion as for existing objects in sync_from_stripe_data()
+                pending_relations = None
+                old_values = instance._get_field_values()
+                record_data = cls._stripe_object_to_record(data, api_key=api_key)
+                for attr, value in record_data.items():
+                    setattr(instance, attr, value)
+
+            instance.djstripe_payload_hash = payload_hash
             instance._attach_objects_hook(cls, data, current_ids=current_ids)
-            instance.save()
-            instance._attach_objects_post_save_hook(cls, data)
+            if pending_relations is None:
+                changed_fields = instance._get_changed_fields(old_values)
+                update_fields.update(changed_fields)
+                if changed_fields:
+                    to_update.append(instance)
+                    instance.djstripe_source_timestamp = now
+            else:
+                instance.djstripe_source_timestamp = now
+            synced[data_id] = (instance, data, pending_relations)
+
+        # Write the whole batch.
+        fields = [
+            field.name for field in cls._meta.concrete_fields if not field.primary_key
+        ]
+        if to_create:
+            features = connections[db].features
+            if cls._meta.get_field("id").unique and getattr(
+                features, "supports_update_conflicts_with_target", False
+            ):
+                # Django 4.1+: upsert, so that objects created concurrently
+                # since they were fetched don't abort the batch.
+                created = cls.objects.using(db).bulk_create(
+                    to_create,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=[
+                        name
+                        for name in fields
+                        if name not in ("id", "djstripe_created")
+                    ],
+                )
+            else:
+                created = cls.objects.using(db).bulk_create(to_create)
+
+            missing_pks = [obj.id for obj in created if obj.pk is None]
+            if missing_pks:
+                # Not every backend returns primary keys from bulk inserts.
+                pks = dict(
+                    cls.objects.using(db)
+                    .filter(id__in=missing_pks)
+                    .values_list("id", "pk")
+                )
+                for obj in created:
+                    if obj.pk is None:
+                        obj.pk = pks[obj.id]
+
+        if to_update:
+            for instance in to_update:
+                # bulk_update() doesn't set auto_now fields.
+                instance.djstripe_updated = now
+            cls.objects.using(db).bulk_update(
+                to_update, sorted(update_fields) + SYNC_FIELDS
+            )
 
-        for field in instance._meta.concrete_fields:
-            if isinstance(field, StripePercentField):
-                # get rid of cached values
-                delattr(instance, field.name)
+        # Second pass: run the post-save hooks now that every object exists.
+        identity_map = get_identity_map()
+        for instance, data, pending_relations in synced.values():
+            if identity_map is not None:
+                identity_map.add(instance)
+            if data is None:
+                # skipped, see above
+                continue
+            instance._attach_objects_post_save_hook(
+                cls, data, pending_relations=pending_relations
+            )
 
-        return instance
+            for field in instance._meta.concrete_fields:
+                if isinstance(field, StripePercentField):
+                    # get rid of cached values
+                    delattr(instance, field.name)
+
+        return [synced[data["id"]][0] for data in batch]
 
     @classmethod
     def _get_or_retrieve(cls, id, stripe_account=None, **kwargs):
@@ -965,10 +1824,20 @@ class StripeModel(StripeBaseModel):
         Retrieve object from the db, if it exists. If it doesn't, query Stripe to fetch
         the object and sync with the db.
         """
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            instance = identity_map.get(cls, id)
+            if instance is not None:
+                return instance
+
         try:
-            return cls.objects.get(id=id)
+            instance = cls.objects.get(id=id)
         except cls.DoesNotExist:
             pass
+        else:
+            if identity_map is not None:
+                identity_map.add(instance)
+            return instance
 
         if stripe_account:
             kwargs["stripe_account"] = str(stripe_account)
@@ -983,6 +1852,28 @@ class StripeModel(StripeBaseModel):
         instance = cls.sync_from_stripe_data(data)
         return instance
 
+    @classmethod
+    async def _aget_or_retrieve(cls, id, stripe_account=None, **kwargs):
+        """
+        Async version of _get_or_retrieve().
+        """
+        try:
+            return await sync_to_async(cls.objects.get)(id=id)
+        except cls.DoesNotExist:
+            pass
+
+        if stripe_account:
+            kwargs["stripe_account"] = str(stripe_account)
+
+        kwargs.setdefault(
+            "api_key",
+            djstripe_settings.get_default_api_key(livemode=kwargs.get("livemode")),
+        )
+        data = await sync_to_async(cls.stripe_class.retrieve, thread_sensitive=False)(
+            id=id, **kwargs
+        )
+        return await cls.async_sync_from_stripe_data(data)
+
     def __str__(self):
         return f"<id={self.id}>"
 
@@ -1006,3 +1897,68 @@ class IdempotencyKey(models.Model):
     @property
     def is_expired(self) -> bool:
         return timezone.now() > self.created + timedelta(hours=24)
+
+
+class SyncCheckpoint(models.Model):
+    """
+    The progress of the incremental syncs of a model for a Stripe account.
+
+    Used by ``djstripe_sync_models --incremental`` to only list the objects
+    created since the last completed sync, and to resume an interrupted sync
+    where it stopped.
+    """
+
+    model_name = models.CharField(
+        max_length=100, help_text="The name of the synced dj-stripe model."
+    )
+    stripe_account = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="The ID of the Stripe Account the objects were listed for.",
+    )
+    high_water_mark = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="The creation time of the newest object synced by the last "
+        "completed sync.",
+    )
+    pending_high_water_mark = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="The creation time of the newest object synced by the sync in "
+        "progress.",
+    )
+    starting_after = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="The ID of the last object synced by the sync in progress, "
+        "which it resumes from if it's interrupted.",
+    )
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("model_name", "stripe_account")
+
+    def __str__(self):
+        return f"{self.model_name} on {self.stripe_account or '(default account)'}"
+
+    def advance(self, created, object_id):
+        """
+        Record that the sync in progress got to the object with the given
+        creation time and id.
+        """
+        if created and (
+            self.pending_high_water_mark is None
+            or created > self.pending_high_water_mark
+        ):
+            self.pending_high_water_mark = created
+        self.starting_after = object_id
+
+    def complete(self):
+        """
+        Record that the sync in progress completed.
+        """
+        if self.pending_high_water_mark is not None:
+            self.high_water_mark = self.pending_high_water_mark
+        self.pending_high_water_mark = None
+        self.starting_after = ""
@@ -993,9 +993,10 @@ class InvoiceItem(StripeModel):
 
         if self.pk:
             # only call .set() on saved instance (ie don't on items of UpcomingInvoice)
-            self.tax_rates.set(
-                cls._stripe_object_to_tax_rates(target_cls=TaxRate, data=data)
-            )
+            tax_rates = cls._stripe_object_to_tax_rates(target_cls=TaxRate, data=data)
+            # A new object has no tax rates to clear
+            if tax_rates or pending_relations is None:
+                self.tax_rates.set(tax_rates)
 
     def __str__(self):
         return self.description
@@ -1752,9 +1753,10 @@ class SubscriptionItem(StripeModel):
             cls, data, pending_relations=pending_relations
         )
 
-        self.tax_rates.set(
-            cls._stripe_object_to_tax_rates(target_cls=TaxRate, data=data)
-        )
+        tax_rates = cls._stripe_object_to_tax_rates(target_cls=TaxRate, data=data)
+        # A new object has no tax rates to clear
+        if tax_rates or pending_relations is None:
+            self.tax_rates.set(tax_rates)
 
 
 class SubscriptionSchedule(StripeModel):
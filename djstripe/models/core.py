@@ -11,7 +11,7 @@ from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 from stripe.error import InvalidRequestError
 
-from .. import enums, webhooks
+from .. import enums, instrumentation, webhooks
 from ..exceptions import MultipleSubscriptionException
 from ..fields import (
     JSONField,
@@ -26,7 +26,6 @@ from ..fields import (
 )
 from ..managers import ChargeManager
 from ..settings import djstripe_settings
-from ..signals import WEBHOOK_SIGNALS
 from ..utils import get_friendly_currency_amount
 from .base import IdempotencyKey, StripeModel, logger
 
@@ -1512,16 +1511,20 @@ class Event(StripeModel):
 
     @classmethod
     def process(cls, data):
-        qs = cls.objects.filter(id=data["id"])
-        if qs.exists():
-            return qs.first()
+        event = cls.objects.filter(id=data["id"]).first()
+        if event is not None:
+            return event
 
         # Rollback any DB operations in the case of failure so
         # we will retry creating and processing the event the
         # next time the webhook fires.
-        with transaction.atomic():
+        event_type = data.get("type", "")
+        with transaction.atomic(), instrumentation.measure(
+            "webhook.event", event_type=event_type
+        ):
             # process the event and create an Event Object
-            ret = cls._create_from_stripe_object(data)
+            with instrumentation.measure("webhook.event.create", event_type=event_type):
+                ret = cls._create_from_stripe_object(data)
             ret.invoke_webhook_handlers()
             return ret
 
@@ -1534,11 +1537,12 @@ class Event(StripeModel):
         (or handlers registered in djstripe plugins or contrib packages).
         """
 
-        webhooks.call_handlers(event=self)
+        dispatch = webhooks.get_dispatch(str(self.type))
+        webhooks.call_handlers(event=self, dispatch=dispatch)
 
-        signal = WEBHOOK_SIGNALS.get(self.type)
-        if signal:
-            return signal.send(sender=Event, event=self)
+        if dispatch.signal:
+            with instrumentation.measure("webhook.signal", event_type=self.type):
+                return dispatch.signal.send(sender=Event, event=self)
 
     @cached_property
     def parts(self):
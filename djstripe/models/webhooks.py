@@ -2,19 +2,26 @@
 Module for dj-stripe Webhook models
 """
 
+import base64
+import gzip
 import json
 import warnings
 from traceback import format_exc
 from uuid import uuid4
 
 import stripe
-from django.db import models
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
 from django.utils.datastructures import CaseInsensitiveMapping
 from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
 
 from ..context_managers import stripe_temporary_api_version
 from ..enums import WebhookEndpointStatus
 from ..fields import JSONField, StripeEnumField, StripeForeignKey
+from ..managers import WebhookEventTriggerManager
 from ..settings import djstripe_settings
 from ..signals import webhook_processing_error
 from .base import StripeModel, logger
@@ -73,6 +80,130 @@ class WebhookEndpoint(StripeModel):
         self.djstripe_uuid = data.get("metadata", {}).get("djstripe_uuid")
 
 
+# How WebhookEventTrigger bodies can be stored (see DJSTRIPE_WEBHOOK_BODY_STORAGE),
+# and the prefixes marking the bodies which aren't stored inline.
+BODY_STORAGES = ("inline", "gzip", "zstd", "storage")
+BODY_STORAGE_PREFIXES = {"gzip": "gzip:", "zstd": "zstd:", "storage": "storage:"}
+# Where bodies are saved in the storage backend
+BODY_STORAGE_PATH = "djstripe/webhook_bodies/"
+# The values of DJSTRIPE_WEBHOOK_DUPLICATE_POLICY
+DUPLICATE_POLICIES = ("process", "mark", "ignore")
+
+
+def get_body_storage_backend():
+    """
+    Returns the Django storage backend webhook bodies are saved to with
+    DJSTRIPE_WEBHOOK_BODY_STORAGE = "storage".
+    """
+    backend = djstripe_settings.WEBHOOK_BODY_STORAGE_BACKEND
+    if backend is None:
+        return default_storage
+    if isinstance(backend, str):
+        backend = import_string(backend)
+    if isinstance(backend, type):
+        backend = backend()
+    return backend
+
+
+def _get_zstandard():
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        raise ImproperlyConfigured(
+            "Storing webhook bodies with zstd requires the zstandard package."
+        )
+    return zstandard
+
+
+def get_body_storage(value):
+    """
+    Returns how a stored WebhookEventTrigger body is stored.
+    """
+    for storage, prefix in BODY_STORAGE_PREFIXES.items():
+        if value.startswith(prefix):
+            return storage
+    return "inline"
+
+
+def encode_body(body, storage=None):
+    """
+    Returns the value to store as the WebhookEventTrigger body for body, in
+    the given storage (DJSTRIPE_WEBHOOK_BODY_STORAGE by default).
+
+    Compressed bodies are base64-encoded, and bodies saved to the storage
+    backend are replaced with their name.
+    """
+    storage = storage or djstripe_settings.WEBHOOK_BODY_STORAGE
+    if storage == "inline" and get_body_storage(body) != "inline":
+        # A body starting with one of the prefixes would be decoded as such
+        storage = "gzip"
+    if storage == "inline":
+        return body
+
+    data = body.encode("utf-8")
+    if storage == "gzip":
+        encoded = base64.b64encode(gzip.compress(data)).decode("ascii")
+    elif storage == "zstd":
+        compressed = _get_zstandard().ZstdCompressor().compress(data)
+        encoded = base64.b64encode(compressed).decode("ascii")
+    elif storage == "storage":
+        encoded = get_body_storage_backend().save(
+            f"{BODY_STORAGE_PATH}{uuid4().hex}.json", ContentFile(data)
+        )
+    else:
+        raise ImproperlyConfigured(
+            f"Unknown webhook body storage {storage!r}, expected one of "
+            f"{', '.join(BODY_STORAGES)}."
+        )
+    return BODY_STORAGE_PREFIXES[storage] + encoded
+
+
+def decode_body(value, strict=False):
+    """
+    Returns the body stored as value by encode_body().
+
+    A compressed body which can't be decoded is returned as is, unless strict:
+    it is an inline body stored before DJSTRIPE_WEBHOOK_BODY_STORAGE existed,
+    which happens to start with a prefix. Errors reading a body from the
+    storage backend are always raised.
+    """
+    storage = get_body_storage(value)
+    if storage == "inline":
+        return value
+
+    encoded = value[len(BODY_STORAGE_PREFIXES[storage]) :]
+    if storage == "storage":
+        with get_body_storage_backend().open(encoded, "rb") as f:
+            return f.read().decode("utf-8")
+
+    # binascii.Error and UnicodeDecodeError are ValueErrors, gzip raises
+    # OSError and EOFError
+    decoding_errors = (ValueError, OSError, EOFError)
+    try:
+        if storage == "zstd":
+            zstandard = _get_zstandard()
+            decoding_errors += (zstandard.ZstdError,)
+            data = zstandard.ZstdDecompressor().decompress(base64.b64decode(encoded))
+        else:
+            data = gzip.decompress(base64.b64decode(encoded))
+        return data.decode("utf-8")
+    except decoding_errors:
+        if strict:
+            raise
+        logger.warning("Could not decode the %s webhook body", storage, exc_info=True)
+        return value
+
+
+def delete_stored_body(value):
+    """
+    Deletes the file of a body saved to the storage backend by encode_body().
+    """
+    if get_body_storage(value) == "storage":
+        get_body_storage_backend().delete(
+            value[len(BODY_STORAGE_PREFIXES["storage"]) :]
+        )
+
+
 def _get_version():
     from ..apps import __version__
 
@@ -129,6 +260,37 @@ class WebhookEventTrigger(models.Model):
         default=False,
         help_text="Whether or not the webhook event has been successfully processed",
     )
+    deferred = models.BooleanField(
+        default=False,
+        help_text="Whether or not processing of the webhook event was deferred "
+        "to the webhook queue",
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text="How many times the webhook queue tried to process the "
+        "webhook event",
+    )
+    next_attempt_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the webhook queue may next try to process the webhook event",
+    )
+    dead_lettered = models.BooleanField(
+        default=False,
+        help_text="Whether or not the webhook queue gave up on processing the "
+        "webhook event after too many failed attempts",
+    )
+    stripe_event_id = models.CharField(
+        max_length=255,
+        blank=True,
+        db_index=True,
+        help_text="The ID of the Stripe event in the webhook, as sent (untrusted)",
+    )
+    duplicate = models.BooleanField(
+        default=False,
+        help_text="Whether or not the webhook event was a redelivery of an event "
+        "which was already received, and was neither validated nor processed",
+    )
     exception = models.CharField(max_length=128, blank=True)
     traceback = models.TextField(
         blank=True, help_text="Traceback if an exception was thrown during processing"
@@ -163,6 +325,8 @@ class WebhookEventTrigger(models.Model):
         help_text="The endpoint this webhook was received on",
     )
 
+    objects = WebhookEventTriggerManager()
+
     def __str__(self):
         return f"id={self.id}, valid={self.valid}, processed={self.processed}"
 
@@ -176,6 +340,14 @@ class WebhookEventTrigger(models.Model):
         1. Create a WebhookEventTrigger object from a Django request.
         2. Validate the WebhookEventTrigger as a Stripe event using the API.
         3. If valid, process it into an Event object (and child resource).
+
+        With DJSTRIPE_WEBHOOK_PROCESSING_MODE = "deferred", the third step is
+        left to the webhook queue instead (see enqueue()).
+
+        Redeliveries of events which were already received are handled according
+        to DJSTRIPE_WEBHOOK_DUPLICATE_POLICY: unless it is "process", they are
+        neither validated nor processed, and the returned trigger is a
+        duplicate marker ("mark") or isn't saved at all ("ignore").
         """
 
         try:
@@ -190,6 +362,11 @@ class WebhookEventTrigger(models.Model):
         except ValueError:
             data = {}
 
+        event_id = str(data.get("id") or "")[:255]
+        duplicate = cls._handle_duplicate(event_id, ip, webhook_endpoint)
+        if duplicate is not None:
+            return duplicate
+
         if webhook_endpoint is None:
             stripe_account = StripeModel._find_owner_account(data=data)
             secret = djstripe_settings.WEBHOOK_SECRET
@@ -197,46 +374,107 @@ class WebhookEventTrigger(models.Model):
             stripe_account = webhook_endpoint.djstripe_owner_account
             secret = webhook_endpoint.secret
 
-        obj = cls.objects.create(
+        obj = cls(
             headers=dict(request.headers),
-            body=body,
             remote_ip=ip,
+            stripe_event_id=event_id,
             stripe_trigger_account=stripe_account,
             webhook_endpoint=webhook_endpoint,
         )
+        obj.set_body(body)
+        obj.save(force_insert=True)
+        obj._validate_and_process(secret)
 
+        return obj
+
+    def _validate_and_process(self, secret):
+        """
+        Validate the saved webhook event, then process it, pass it to
+        DJSTRIPE_WEBHOOK_EVENT_CALLBACK or enqueue it if it is valid.
+        """
         try:
-            obj.valid = obj.validate(secret=secret)
-            if obj.valid:
+            self.valid = self.validate(secret=secret)
+            if self.valid:
                 if djstripe_settings.WEBHOOK_EVENT_CALLBACK:
                     # If WEBHOOK_EVENT_CALLBACK, pass it for processing
-                    djstripe_settings.WEBHOOK_EVENT_CALLBACK(obj)
+                    djstripe_settings.WEBHOOK_EVENT_CALLBACK(self)
+                elif djstripe_settings.WEBHOOK_PROCESSING_MODE == "deferred":
+                    self.deferred = True
                 else:
                     # Process the item (do not save it, it'll get saved below)
-                    obj.process(save=False)
+                    self.process(save=False)
         except Exception as e:
-            max_length = WebhookEventTrigger._meta.get_field("exception").max_length
-            obj.exception = str(e)[:max_length]
-            obj.traceback = format_exc()
-
-            # Send the exception as the webhook_processing_error signal
-            webhook_processing_error.send(
-                sender=WebhookEventTrigger,
-                exception=e,
-                data=getattr(e, "http_body", ""),
-            )
+            self._record_exception(e)
 
             # re-raise the exception so Django sees it
             raise e
         finally:
-            obj.save()
+            self.save()
+
+        if self.deferred:
+            self.enqueue()
 
+    @classmethod
+    def _handle_duplicate(cls, event_id, remote_ip, webhook_endpoint):
+        """
+        Returns a duplicate marker (saved if DJSTRIPE_WEBHOOK_DUPLICATE_POLICY is
+        "mark") if the event with the given ID was already received, and
+        duplicates are marked or ignored. Otherwise, returns None.
+        """
+        duplicate_policy = djstripe_settings.WEBHOOK_DUPLICATE_POLICY
+        if (
+            # An invalid policy (see djstripe.C011) is handled like "process"
+            duplicate_policy not in ("mark", "ignore")
+            or not event_id
+            or not cls.objects.received(event_id).exists()
+        ):
+            return None
+
+        logger.info("Skipping duplicate webhook event %s", event_id)
+        obj = cls(
+            headers={},
+            remote_ip=remote_ip,
+            stripe_event_id=event_id,
+            duplicate=True,
+            webhook_endpoint=webhook_endpoint,
+        )
+        if duplicate_policy == "mark":
+            obj.save()
         return obj
 
+    def _record_exception(self, e):
+        max_length = WebhookEventTrigger._meta.get_field("exception").max_length
+        self.exception = str(e)[:max_length]
+        self.traceback = format_exc()
+
+        # Send the exception as the webhook_processing_error signal
+        webhook_processing_error.send(
+            sender=WebhookEventTrigger,
+            exception=e,
+            data=getattr(e, "http_body", ""),
+        )
+
+    @cached_property
+    def decoded_body(self):
+        """
+        The body of the webhook, decoded from how it is stored
+        (see DJSTRIPE_WEBHOOK_BODY_STORAGE).
+        """
+        return decode_body(self.body)
+
+    def set_body(self, body, storage=None):
+        """
+        Sets the body of the webhook, encoded for the given storage
+        (DJSTRIPE_WEBHOOK_BODY_STORAGE by default).
+        """
+        self.body = encode_body(body, storage)
+        self.__dict__["decoded_body"] = body
+        self.__dict__.pop("json_body", None)
+
     @cached_property
     def json_body(self):
         try:
-            return json.loads(self.body)
+            return json.loads(self.decoded_body)
         except ValueError:
             return {}
 
@@ -288,7 +526,7 @@ class WebhookEventTrigger(models.Model):
             signature = headers.get("stripe-signature")
             try:
                 stripe.WebhookSignature.verify_header(
-                    self.body, signature, secret, tolerance
+                    self.decoded_body, signature, secret, tolerance
                 )
             except stripe.error.SignatureVerificationError:
                 logger.exception("Failed to verify header")
@@ -318,3 +556,36 @@ class WebhookEventTrigger(models.Model):
             self.save()
 
         return self.event
+
+    def enqueue(self):
+        """
+        Hand the webhook event over to the webhook queue for processing.
+
+        The DJSTRIPE_WEBHOOK_QUEUE_BACKEND callable, if set, is called with the
+        trigger once the current transaction commits. Otherwise, the trigger
+        waits in the database for the djstripe_process_webhooks command.
+        """
+        backend = djstripe_settings.WEBHOOK_QUEUE_BACKEND
+        if backend:
+            transaction.on_commit(lambda: backend(self))
+
+    def process_deferred(self):
+        """
+        Process a webhook event whose processing was deferred to the webhook
+        queue. Webhook queue backends should call this from their workers.
+
+        Unlike process(), exceptions are recorded on the trigger and sent as the
+        webhook_processing_error signal instead of being raised.
+
+        :returns: whether the webhook event was processed successfully.
+        :rtype: bool
+        """
+        try:
+            self.process(save=False)
+        except Exception as e:
+            logger.exception("Failed to process webhook event trigger %s", self.id)
+            self._record_exception(e)
+        finally:
+            self.save()
+
+        return self.processed
@@ -99,6 +99,83 @@ class DjstripeSettings:
     def WEBHOOK_EVENT_CALLBACK(self):
         return self.get_callback_function("DJSTRIPE_WEBHOOK_EVENT_CALLBACK")
 
+    @property
+    def WEBHOOK_PROCESSING_MODE(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_PROCESSING_MODE", "inline")
+
+    # The webhook queue backend is called with each webhook whose processing
+    # was deferred. If it isn't set, deferred webhooks wait in the database for
+    # the djstripe_process_webhooks command.
+    @property
+    def WEBHOOK_QUEUE_BACKEND(self):
+        return self.get_callback_function("DJSTRIPE_WEBHOOK_QUEUE_BACKEND")
+
+    @property
+    def WEBHOOK_BODY_STORAGE(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_BODY_STORAGE", "inline")
+
+    @property
+    def WEBHOOK_BODY_STORAGE_BACKEND(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_BODY_STORAGE_BACKEND", None)
+
+    @property
+    def WEBHOOK_DUPLICATE_POLICY(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_DUPLICATE_POLICY", "process")
+
+    @property
+    def WEBHOOK_HANDLER_WORKERS(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_HANDLER_WORKERS", 4)
+
+    @property
+    def WEBHOOK_TRUST_PAYLOAD(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_TRUST_PAYLOAD", False)
+
+    @property
+    def WEBHOOK_SKIP_STALE_EVENTS(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_SKIP_STALE_EVENTS", False)
+
+    @property
+    def WEBHOOK_COALESCE_WINDOW(self):
+        return getattr(settings, "DJSTRIPE_WEBHOOK_COALESCE_WINDOW", 0)
+
+    # The HTTP client dj-stripe can install for the Stripe API requests,
+    # see djstripe.http_client.
+    @property
+    def HTTP_CLIENT_ENABLED(self):
+        return getattr(settings, "DJSTRIPE_HTTP_CLIENT_ENABLED", False)
+
+    @property
+    def HTTP_CLIENT_TIMEOUT(self):
+        return getattr(settings, "DJSTRIPE_HTTP_CLIENT_TIMEOUT", 80)
+
+    @property
+    def HTTP_CLIENT_POOL_SIZE(self):
+        return getattr(settings, "DJSTRIPE_HTTP_CLIENT_POOL_SIZE", 10)
+
+    @property
+    def HTTP_CLIENT_MAX_RETRIES(self):
+        return getattr(settings, "DJSTRIPE_HTTP_CLIENT_MAX_RETRIES", None)
+
+    @property
+    def AUTO_EXPAND(self):
+        return getattr(settings, "DJSTRIPE_AUTO_EXPAND", False)
+
+    @property
+    def AUTO_EXPAND_OVERRIDES(self):
+        return getattr(settings, "DJSTRIPE_AUTO_EXPAND_OVERRIDES", {})
+
+    @property
+    def INSTRUMENTATION_SINKS(self):
+        return getattr(settings, "DJSTRIPE_INSTRUMENTATION_SINKS", [])
+
+    @property
+    def INSTRUMENTATION_LATENCY_WINDOW(self):
+        return getattr(settings, "DJSTRIPE_INSTRUMENTATION_LATENCY_WINDOW", 0)
+
+    @property
+    def SYNC_PREFETCH_WORKERS(self):
+        return getattr(settings, "DJSTRIPE_SYNC_PREFETCH_WORKERS", 0)
+
     @property
     def SUBSCRIBER_CUSTOMER_KEY(self):
         return getattr(
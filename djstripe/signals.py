@@ -8,6 +8,15 @@ from django.dispatch import Signal
 # providing_args=["data", "exception"]
 webhook_processing_error = Signal()
 
+# Sent for each request to the Stripe API, see djstripe.http_client
+# providing_args=["method", "url", "status_code", "duration"]
+stripe_api_request = Signal()
+
+# Sent when a webhook handler registered with on_commit=True fails, with the
+# handler as the sender. See djstripe.webhooks.call_on_commit_handlers
+# providing_args=["event", "exception"]
+webhook_handler_failed = Signal()
+
 # A signal for each Event type. See https://stripe.com/docs/api/events/types
 
 WEBHOOK_SIGNALS = dict(
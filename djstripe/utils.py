@@ -3,6 +3,8 @@ Utility functions related to the djstripe app.
 """
 
 import datetime
+import hashlib
+import json
 from typing import Optional
 
 from django.conf import settings
@@ -99,3 +101,12 @@ def get_id_from_stripe_data(data):
         return data.get("id")
     else:
         return None
+
+
+def get_payload_hash(data) -> str:
+    """
+    Returns a hash of stripe object data, which is the same for equal data
+    regardless of the order of its keys.
+    """
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
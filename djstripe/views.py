@@ -1,11 +1,14 @@
 """
 dj-stripe - Views related to the djstripe app.
 """
+import asyncio
 import logging
+from functools import wraps
 
+from asgiref.sync import sync_to_async
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404
-from django.utils.decorators import method_decorator
+from django.utils.decorators import classonlymethod, method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
@@ -21,7 +24,8 @@ class ProcessWebhookView(View):
     A Stripe Webhook handler view.
 
     This will create a WebhookEventTrigger instance, verify it,
-    then attempt to process it.
+    then attempt to process it (or defer processing it to the webhook
+    queue, see DJSTRIPE_WEBHOOK_PROCESSING_MODE).
 
     If the webhook cannot be verified, returns HTTP 400.
 
@@ -48,6 +52,10 @@ class ProcessWebhookView(View):
             request, webhook_endpoint=webhook_endpoint
         )
 
+        if trigger.duplicate:
+            # Already received: Stripe must stop redelivering it
+            return HttpResponse("Duplicate webhook event discarded.")
+
         if trigger.is_test_event:
             # Since we don't do signature verification, we have to skip trigger.valid
             return HttpResponse("Test webhook successfully received and discarded!")
@@ -58,3 +66,29 @@ class ProcessWebhookView(View):
             return HttpResponseBadRequest()
 
         return HttpResponse(str(trigger.id))
+
+
+class AsyncProcessWebhookView(ProcessWebhookView):
+    """
+    The async version of ProcessWebhookView, for ASGI deployments.
+
+    Webhooks are processed the same way, in the thread of the current request
+    (as they are saved to the database), without blocking the event loop.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        if asyncio.iscoroutinefunction(view):
+            return view
+
+        # Before Django 4.1, views returned by View.as_view() are sync, even
+        # when their handlers are async.
+        @wraps(view)
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return async_view
+
+    async def post(self, request, uuid=None):
+        return await sync_to_async(super().post)(request, uuid=uuid)
@@ -14,23 +14,87 @@ The function signature is:
 There is also a "global registry" which is just a list of processors (as defined above)
 
 NOTE: global processors are called before other processors.
+
+Processors registered with on_commit=True only have side effects outside of the
+database (sending emails, notifying a CRM...): they are called in a thread pool
+once the event is committed, and their failures are logged instead of rolling
+back the event.
 """
 import functools
-import itertools
+import logging
+import os
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from django.db import connections, transaction
+from django.dispatch import Signal
 
-__all__ = ["handler", "handler_all", "call_handlers"]
+from . import instrumentation
+from .signals import WEBHOOK_SIGNALS, webhook_handler_failed
 
+__all__ = [
+    "handler",
+    "handler_all",
+    "call_handlers",
+    "call_on_commit_handlers",
+    "get_dispatch",
+]
+
+logger = logging.getLogger(__name__)
 
 registrations = defaultdict(list)
 registrations_global = list()
+# The handlers registered with on_commit=True
+on_commit_handlers = set()
 
 # Legacy. In previous versions of Stripe API, all test events used this ID.
 # Check out issue #779 for more information.
 TEST_EVENT_ID = "evt_00000000000000"
 
 
-def handler(*event_types):
+class Dispatch(NamedTuple):
+    """The handlers and signal of an event type, see get_dispatch()."""
+
+    event_type: str
+    handlers: Tuple[Callable, ...]
+    signal: Optional[Signal]
+    # The dotted path of each handler, for instrumentation
+    handler_names: Tuple[str, ...] = ()
+    # The handlers registered with on_commit=True, and their dotted paths
+    on_commit_handlers: Tuple[Callable, ...] = ()
+    on_commit_handler_names: Tuple[str, ...] = ()
+
+
+# The compiled dispatch of each event type, see get_dispatch()
+_dispatch_table = {}
+# The registries _dispatch_table was compiled from
+_dispatch_registries = None
+_dispatch_lock = threading.Lock()
+# Incremented whenever the table is cleared
+_dispatch_generation = 0
+
+# The thread pool calling the on_commit handlers, see _get_executor()
+_executor = None
+_executor_key = None
+_executor_lock = threading.Lock()
+
+
+def clear_dispatch_table():
+    """
+    Discard the compiled dispatch of every event type.
+
+    Called when a handler is registered: the dispatch is compiled again on next use.
+    """
+    global _dispatch_generation
+
+    with _dispatch_lock:
+        _dispatch_table.clear()
+        _dispatch_generation += 1
+
+
+def handler(*event_types, on_commit=False):
     """
     Decorator that registers a function as a webhook handler.
 
@@ -42,33 +106,117 @@ def handler(*event_types):
     the handler will receive events for 'customer.subscription.created',
     'customer.subscription.updated', etc.
 
+    With on_commit=True, the handler is called once the event is committed,
+    in a thread pool (see DJSTRIPE_WEBHOOK_HANDLER_WORKERS), and its failures
+    are logged and sent with the webhook_handler_failed signal instead of
+    rolling back the event. Only use it for handlers whose side effects are
+    outside of the database, such as sending emails.
+
     :param event_types: The event type(s) that should be handled.
     :type event_types: str.
+    :param on_commit: Whether to call the handler after commit, in isolation.
+    :type on_commit: bool
     """
 
     def decorator(func):
         for event_type in event_types:
             registrations[event_type].append(func)
+        if on_commit:
+            on_commit_handlers.add(func)
+        clear_dispatch_table()
         return func
 
     return decorator
 
 
-def handler_all(func=None):
+def handler_all(func=None, on_commit=False):
     """
     Decorator that registers a function as a webhook handler for ALL webhook events.
 
     Handles all webhooks regardless of event type or sub-type.
+
+    See handler() for on_commit.
     """
     if not func:
-        return functools.partial(handler_all)
+        return functools.partial(handler_all, on_commit=on_commit)
 
     registrations_global.append(func)
+    if on_commit:
+        on_commit_handlers.add(func)
+    clear_dispatch_table()
 
     return func
 
 
-def call_handlers(event):
+def get_dispatch(event_type):
+    """
+    Returns the handlers to call for an event type, in order, and the signal to
+    send for it (if any).
+
+    The dispatch of each event type is compiled on first use, and kept until a
+    handler is registered.
+
+    :param event_type: The event type (e.g. 'customer.subscription.created').
+    :type event_type: str
+    :rtype: Dispatch
+    """
+    global _dispatch_registries
+
+    # The registries can be replaced (e.g. in tests), which discards the table
+    if _is_compiled_from_registries():
+        dispatch = _dispatch_table.get(event_type)
+        if dispatch is not None:
+            return dispatch
+    generation = _dispatch_generation
+
+    # Build up a list of handlers with each qualified part of the event
+    # category and verb.  For example, "customer.subscription.created" creates:
+    #   1. "customer"
+    #   2. "customer.subscription"
+    #   3. "customer.subscription.created"
+    handlers = list(registrations_global)
+    parts = event_type.split(".")
+    for index, _ in enumerate(parts):
+        qualified_event_type = ".".join(parts[: (index + 1)])
+        # .get(): compiling must not add keys to the registrations
+        handlers.extend(registrations.get(qualified_event_type, ()))
+    inline_handlers = [h for h in handlers if h not in on_commit_handlers]
+    deferred_handlers = [h for h in handlers if h in on_commit_handlers]
+    dispatch = Dispatch(
+        event_type,
+        tuple(inline_handlers),
+        WEBHOOK_SIGNALS.get(event_type),
+        tuple(_get_handler_name(handler_func) for handler_func in inline_handlers),
+        tuple(deferred_handlers),
+        tuple(_get_handler_name(handler_func) for handler_func in deferred_handlers),
+    )
+
+    with _dispatch_lock:
+        if not _is_compiled_from_registries():
+            _dispatch_table.clear()
+            _dispatch_registries = (registrations, registrations_global)
+        if generation == _dispatch_generation:
+            # Otherwise a handler was registered while compiling
+            _dispatch_table[event_type] = dispatch
+    return dispatch
+
+
+def _get_handler_name(handler_func):
+    qualname = getattr(handler_func, "__qualname__", None)
+    if qualname is None:
+        return repr(handler_func)
+    return f"{handler_func.__module__}.{qualname}"
+
+
+def _is_compiled_from_registries():
+    return (
+        _dispatch_registries is not None
+        and _dispatch_registries[0] is registrations
+        and _dispatch_registries[1] is registrations_global
+    )
+
+
+def call_handlers(event, dispatch=None):
     """
     Invoke all handlers for the provided event type/sub-type.
 
@@ -78,21 +226,105 @@ def call_handlers(event):
     2. Event type handlers
     3. Event sub-type handlers
 
-    Handlers within each group are invoked in order of registration.
+    Handlers within each group are invoked in order of registration. The
+    handlers registered with on_commit=True are invoked once the current
+    transaction is committed instead, see call_on_commit_handlers().
+
+    The duration of each handler call is recorded in the "webhook.handler"
+    stage of djstripe.instrumentation.
 
     :param event: The event model object.
     :type event: ``djstripe.models.Event``
+    :param dispatch: The dispatch of the event type, if already looked up.
+    :type dispatch: ``Dispatch``
     """
-    chain = [registrations_global]
+    if dispatch is None:
+        dispatch = get_dispatch(".".join(event.parts))
 
-    # Build up a list of handlers with each qualified part of the event
-    # category and verb.  For example, "customer.subscription.created" creates:
-    #   1. "customer"
-    #   2. "customer.subscription"
-    #   3. "customer.subscription.created"
-    for index, _ in enumerate(event.parts):
-        qualified_event_type = ".".join(event.parts[: (index + 1)])
-        chain.append(registrations[qualified_event_type])
+    for handler_func, handler_name in zip(dispatch.handlers, dispatch.handler_names):
+        _call_handler(event, dispatch.event_type, handler_func, handler_name)
 
-    for handler_func in itertools.chain(*chain):
+    if dispatch.on_commit_handlers:
+        transaction.on_commit(
+            functools.partial(call_on_commit_handlers, event, dispatch)
+        )
+
+
+def call_on_commit_handlers(event, dispatch):
+    """
+    Invoke the handlers registered with on_commit=True for the provided event,
+    in the thread pool, or one after the other in this thread if
+    DJSTRIPE_WEBHOOK_HANDLER_WORKERS is 0.
+
+    A failing handler doesn't prevent the others from running: its exception is
+    logged and sent with the webhook_handler_failed signal.
+
+    :returns: The futures of the handler calls submitted to the thread pool.
+    :rtype: list
+    """
+    # Imported here, so that this module can be imported before Django is set up
+    from .settings import djstripe_settings
+
+    handlers = zip(dispatch.on_commit_handlers, dispatch.on_commit_handler_names)
+    workers = djstripe_settings.WEBHOOK_HANDLER_WORKERS
+    if not workers:
+        for handler_func, handler_name in handlers:
+            _call_isolated_handler(
+                event, dispatch.event_type, handler_func, handler_name
+            )
+        return []
+
+    executor = _get_executor(workers)
+    return [
+        executor.submit(
+            _call_isolated_handler,
+            event,
+            dispatch.event_type,
+            handler_func,
+            handler_name,
+            close_connections=True,
+        )
+        for handler_func, handler_name in handlers
+    ]
+
+
+def _call_handler(event, event_type, handler_func, handler_name):
+    with instrumentation.measure(
+        "webhook.handler", event_type=event_type, handler=handler_name
+    ):
         handler_func(event=event)
+
+
+def _call_isolated_handler(
+    event, event_type, handler_func, handler_name, close_connections=False
+):
+    try:
+        _call_handler(event, event_type, handler_func, handler_name)
+    except Exception as e:
+        logger.exception("Webhook handler %s failed for %r", handler_name, event.id)
+        webhook_handler_failed.send(sender=handler_func, event=event, exception=e)
+    finally:
+        if close_connections:
+            # Django opens a connection per thread, which would otherwise leak.
+            connections.close_all()
+
+
+def _get_executor(workers):
+    """
+    Returns the thread pool calling the on_commit handlers, with the given
+    number of workers.
+    """
+    global _executor, _executor_key
+
+    # Threads don't survive forks, so each process starts its own pool.
+    key = (os.getpid(), workers)
+    if _executor_key != key:
+        with _executor_lock:
+            if _executor_key != key:
+                if _executor is not None and _executor_key[0] == key[0]:
+                    _executor.shutdown(wait=False)
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="djstripe-webhooks"
+                )
+                _executor_key = key
+    return _executor
@@ -15,8 +15,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict
 
+import stripe
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
 from django.utils import dateformat, timezone
 
 from djstripe.webhooks import TEST_EVENT_ID
@@ -93,6 +95,38 @@ class AssertStripeFksMixin:
                 logger.warning("checked {}".format(field_str))
 
 
+class AssertBatchedSyncMixin:
+    def assert_synced_in_batch(self, sync_list, item_data, few=2, many=20):
+        """
+        Asserts that syncing many objects takes as many queries as syncing a few
+        :param sync_list: called with a single page stripe list of copies of
+            item_data, returns the synced objects
+        :param item_data: the stripe object to copy
+        :param few: how many copies to sync first
+        :param many: how many copies to sync then
+        """
+        query_counts = []
+        for count in (few, many):
+            data_list = stripe.ListObject.construct_from(
+                {
+                    "object": "list",
+                    "data": [
+                        dict(deepcopy(item_data), id=f"{item_data['id']}_{count}_{i}")
+                        for i in range(count)
+                    ],
+                    "has_more": False,
+                },
+                None,
+            )
+            with CaptureQueriesContext(connection) as context:
+                synced = sync_list(data_list)
+            self.assertEqual(len(synced), count)
+            query_counts.append(len(context.captured_queries))
+
+        few_queries, many_queries = query_counts
+        self.assertEqual(many_queries, few_queries)
+
+
 def load_fixture(filename):
     with FIXTURE_DIR_PATH.joinpath(filename).open("r") as f:
         return json.load(f)
@@ -0,0 +1,74 @@
+"""
+Microbenchmark for StripeModel._stripe_object_to_record.
+
+Compares the cost per object of mapping Charge, Invoice and Subscription
+payloads with a cached field mapping plan against rebuilding the plan on every
+call (which is what every call used to do).
+
+Foreign key resolution and owner account lookups are stubbed out, so only the
+field mapping itself is measured and no database is needed.
+
+Run it from the repository root with:
+    python -m tests.benchmarks.bench_stripe_object_to_record [--number N]
+"""
+import argparse
+import os
+import timeit
+from copy import deepcopy
+from unittest.mock import patch
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from djstripe.models import Charge, Invoice, StripeModel, Subscription  # noqa: E402
+from djstripe.models.base import clear_field_mapping_plans  # noqa: E402
+
+from .. import FAKE_CHARGE, FAKE_INVOICE, FAKE_SUBSCRIPTION  # noqa: E402
+
+PAYLOADS = (
+    (Charge, FAKE_CHARGE),
+    (Invoice, FAKE_INVOICE),
+    (Subscription, FAKE_SUBSCRIPTION),
+)
+
+
+def _fake_foreign_key(cls, field, manipulated_data, **kwargs):
+    return None, True, False
+
+
+def bench(model, data, number, cached):
+    data = deepcopy(data)
+
+    def run():
+        if not cached:
+            clear_field_mapping_plans()
+        model._stripe_object_to_record(data)
+
+    run()  # warm up
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    with patch.object(
+        StripeModel,
+        "_stripe_object_field_to_foreign_key",
+        classmethod(_fake_foreign_key),
+    ), patch.object(StripeModel, "_find_owner_account", return_value=None):
+        print(f"{'model':<14}{'uncached (us)':>15}{'cached (us)':>14}{'speedup':>10}")
+        for model, data in PAYLOADS:
+            uncached = bench(model, data, args.number, cached=False)
+            cached = bench(model, data, args.number, cached=True)
+            print(
+                f"{model.__name__:<14}{uncached * 1e6:>15.1f}{cached * 1e6:>14.1f}"
+                f"{uncached / cached:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
 """
 dj-stripe Context Manager Tests.
 """
+from copy import deepcopy
+from unittest.mock import patch
+
 import stripe
+from django.db import IntegrityError
 from django.test import TestCase
 
-from djstripe.context_managers import stripe_temporary_api_version
+from djstripe.context_managers import (
+    get_identity_map,
+    stripe_identity_map,
+    stripe_temporary_api_version,
+)
+from djstripe.models import Coupon, Product
+
+from . import FAKE_COUPON
 
 
 class TestTemporaryVersion(TestCase):
@@ -25,3 +36,80 @@ class TestTemporaryVersion(TestCase):
             self.assertEqual(stripe.api_version, "newversion")
 
         self.assertEqual(stripe.api_version, version)
+
+
+class TestIdentityMap(TestCase):
+    def test_nested_blocks_share_identity_map(self):
+        self.assertIsNone(get_identity_map())
+
+        with stripe_identity_map() as identity_map:
+            self.assertIs(get_identity_map(), identity_map)
+            with stripe_identity_map() as nested_identity_map:
+                self.assertIs(nested_identity_map, identity_map)
+            self.assertIs(get_identity_map(), identity_map)
+
+        self.assertIsNone(get_identity_map())
+
+    def test_objects_loaded_once(self):
+        Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+        with stripe_identity_map() as identity_map:
+            with self.assertNumQueries(1):
+                coupon, created = Coupon._get_or_create_from_stripe_object(
+                    deepcopy(FAKE_COUPON)
+                )
+                same_coupon, _ = Coupon._get_or_create_from_stripe_object(
+                    deepcopy(FAKE_COUPON)
+                )
+
+        self.assertFalse(created)
+        self.assertIs(same_coupon, coupon)
+        self.assertEqual((identity_map.hits, identity_map.misses), (1, 1))
+
+    def test_synced_objects_added(self):
+        with stripe_identity_map() as identity_map:
+            coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+            self.assertIs(identity_map.get(Coupon, FAKE_COUPON["id"]), coupon)
+
+    def test_rollback(self):
+        with stripe_identity_map() as identity_map:
+            kept = Coupon(id="coupon-1")
+            identity_map.add(kept)
+            identity_map.prefetched[(Coupon, "coupon-1")] = {"id": "coupon-1"}
+            savepoint = identity_map.savepoint()
+            identity_map.add(Coupon(id="coupon-2"))
+            # Replaced in the rolled back transaction
+            identity_map.add(Coupon(id="coupon-1"))
+            identity_map.prefetched.clear()
+            identity_map.api_key_accounts["sk_test"] = None
+
+            identity_map.rollback(savepoint)
+
+            self.assertEqual(list(identity_map.instances), [(Coupon, "coupon-1")])
+            self.assertIs(identity_map.instances[(Coupon, "coupon-1")], kept)
+            self.assertEqual(
+                identity_map.prefetched, {(Coupon, "coupon-1"): {"id": "coupon-1"}}
+            )
+            self.assertEqual(identity_map.api_key_accounts, {})
+
+    def test_objects_created_in_race_forgotten(self):
+        coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+        def create_from_stripe_object(data, **kwargs):
+            # e.g. a related object, created before the conflicting insert
+            get_identity_map().add(Product(id="prod_unsaved"))
+            raise IntegrityError("duplicate key")
+
+        with stripe_identity_map() as identity_map, patch.object(
+            Coupon, "_create_from_stripe_object", side_effect=create_from_stripe_object
+        ), patch.object(Coupon.stripe_objects, "get") as get_mock:
+            # The object doesn't exist yet when it is looked up
+            get_mock.side_effect = [Coupon.DoesNotExist(), coupon]
+
+            same_coupon, created = Coupon._get_or_create_from_stripe_object(
+                deepcopy(FAKE_COUPON)
+            )
+
+            self.assertEqual(same_coupon, coupon)
+            self.assertFalse(created)
+            self.assertIsNone(identity_map.get(Product, "prod_unsaved"))
@@ -67,14 +67,14 @@ class EventTest(TestCase):
         when the event doesn't already exist.
         """
         # Set up mocks
-        mock_objects.filter.return_value.exists.return_value = False
+        mock_objects.filter.return_value.first.return_value = None
         mock_data = {"id": "foo_id", "other_stuff": "more_things"}
 
         result = Event.process(data=mock_data)
 
         # Check that all the expected work was performed
         mock_objects.filter.assert_called_once_with(id=mock_data["id"])
-        mock_objects.filter.return_value.exists.assert_called_once_with()
+        mock_objects.filter.return_value.first.assert_called_once_with()
         mock_atomic.return_value.__enter__.assert_called_once_with()
         mock__create_from_stripe_object.assert_called_once_with(mock_data)
         (
@@ -93,15 +93,12 @@ class EventTest(TestCase):
         Test that process event returns the existing event and skips webhook processing
         when the event already exists.
         """
-        # Set up mocks
-        mock_objects.filter.return_value.exists.return_value = True
         mock_data = {"id": "foo_id", "other_stuff": "more_things"}
 
         result = Event.process(data=mock_data)
 
         # Make sure that the db was queried and the existing results used.
         mock_objects.filter.assert_called_once_with(id=mock_data["id"])
-        mock_objects.filter.return_value.exists.assert_called_once_with()
         mock_objects.filter.return_value.first.assert_called_once_with()
         # Make sure the webhook actions and event object creation were not performed.
         mock_atomic.return_value.__enter__.assert_not_called()
@@ -173,20 +170,25 @@ class EventRaceConditionTest(TestCase):
     ):
         transfer = Transfer.sync_from_stripe_data(deepcopy(FAKE_TRANSFER))
         transfer_retrieve_mock.reset_mock()
+        # the transfer changed since, so that its sync isn't skipped
+        transfer_retrieve_mock.return_value = dict(
+            deepcopy(FAKE_TRANSFER), description="Updated transfer"
+        )
         event_data = deepcopy(FAKE_EVENT_TRANSFER_CREATED)
 
         # emulate the race condition in _get_or_create_from_stripe_object where
         # an object is created by a different request during the call
         #
         # Sequence of events:
-        # 1) first Transfer.stripe_objects.get fails with DoesNotExist
+        # 1) the Transfer.stripe_objects.get of sync_from_stripe_data and then
+        #    of _get_or_create_from_stripe_object fail with DoesNotExist
         #    (due to it not existing in reality, but due to our side_effect in the test)
         # 2) object is really created by a different request in reality
         # 3) Transfer._create_from_stripe_object fails with IntegrityError due to
         #    duplicate id
-        # 4) second Transfer.stripe_objects.get succeeds
+        # 4) the last Transfer.stripe_objects.get succeeds
         #    (due to being created by step 2 in reality, due to side effect in the test)
-        side_effect = [Transfer.DoesNotExist(), transfer]
+        side_effect = [Transfer.DoesNotExist(), Transfer.DoesNotExist(), transfer]
 
         with patch(
             "djstripe.models.Transfer.stripe_objects.get",
@@ -195,5 +197,5 @@ class EventRaceConditionTest(TestCase):
         ) as transfer_objects_get_mock:
             Event.process(event_data)
 
-        self.assertEqual(transfer_objects_get_mock.call_count, 2)
+        self.assertEqual(transfer_objects_get_mock.call_count, 3)
         self.assertEqual(transfer_retrieve_mock.call_count, 1)
@@ -1,14 +1,18 @@
 """
 dj-stripe Event Handler tests
 """
+import time
 from copy import deepcopy
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import ANY, call, patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from stripe.error import InvalidRequestError
 
+from djstripe import event_handlers
 from djstripe.enums import SubscriptionStatus
 from djstripe.models import (
     Card,
@@ -32,6 +36,7 @@ from djstripe.models.billing import TaxId
 from djstripe.models.checkout import Session
 from djstripe.models.core import File
 from djstripe.models.payment_methods import BankAccount
+from djstripe.settings import djstripe_settings
 
 from . import (
     FAKE_ACCOUNT,
@@ -2149,6 +2154,145 @@ class TestPlanEvents(EventTestCase):
             Plan.objects.get(id=FAKE_PLAN["id"])
 
 
+class TestCrudLikeEventCoalescing(EventTestCase):
+    def setUp(self):
+        event_handlers._recent_retrieves.clear()
+
+    def _process_plan_events(self):
+        for event_id, event_type in (
+            ("evt_1", "plan.created"),
+            ("evt_2", "plan.updated"),
+        ):
+            event = self._create_event(
+                FAKE_EVENT_PLAN_CREATED,
+                patch_data={"id": event_id, "type": event_type},
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                event.invoke_webhook_handlers()
+
+    @override_settings(DJSTRIPE_WEBHOOK_COALESCE_WINDOW=60)
+    @patch("stripe.Plan.retrieve", return_value=deepcopy(FAKE_PLAN), autospec=True)
+    @patch(
+        "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
+    )
+    def test_events_coalesced(self, product_retrieve_mock, plan_retrieve_mock):
+        self._process_plan_events()
+
+        plan_retrieve_mock.assert_called_once()
+        self.assertEqual(Event.objects.filter(type__startswith="plan.").count(), 2)
+        Plan.objects.get(id=FAKE_PLAN["id"])
+
+    @patch("stripe.Plan.retrieve", return_value=deepcopy(FAKE_PLAN), autospec=True)
+    @patch(
+        "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
+    )
+    def test_events_not_coalesced_by_default(
+        self, product_retrieve_mock, plan_retrieve_mock
+    ):
+        self._process_plan_events()
+
+        self.assertEqual(plan_retrieve_mock.call_count, 2)
+
+    @override_settings(DJSTRIPE_WEBHOOK_COALESCE_WINDOW=60)
+    @patch("stripe.Plan.retrieve", return_value=deepcopy(FAKE_PLAN), autospec=True)
+    @patch(
+        "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
+    )
+    def test_later_event_not_coalesced(self, product_retrieve_mock, plan_retrieve_mock):
+        event = self._create_event(FAKE_EVENT_PLAN_CREATED)
+        with self.captureOnCommitCallbacks(execute=True):
+            event.invoke_webhook_handlers()
+
+        # the event happened after the plan was retrieved
+        event = self._create_event(
+            FAKE_EVENT_PLAN_CREATED,
+            patch_data={
+                "id": "evt_2",
+                "type": "plan.updated",
+                "created": int(time.time()) + 10,
+            },
+        )
+        event.invoke_webhook_handlers()
+
+        self.assertEqual(plan_retrieve_mock.call_count, 2)
+
+
+@override_settings(DJSTRIPE_WEBHOOK_SKIP_STALE_EVENTS=True)
+@patch("stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True)
+@patch("stripe.Plan.retrieve", return_value=deepcopy(FAKE_PLAN), autospec=True)
+class TestStaleEvents(EventTestCase):
+    def test_stale_event_skipped(self, plan_retrieve_mock, product_retrieve_mock):
+        plan = Plan.sync_from_stripe_data(deepcopy(FAKE_PLAN))
+
+        # the event happened before the plan was last synced
+        event = self._create_event(FAKE_EVENT_PLAN_REQUEST_IS_OBJECT)
+        event.invoke_webhook_handlers()
+
+        plan_retrieve_mock.assert_not_called()
+        self.assertEqual(Plan.objects.get().djstripe_updated, plan.djstripe_updated)
+
+    def test_later_event_synced(self, plan_retrieve_mock, product_retrieve_mock):
+        Plan.sync_from_stripe_data(deepcopy(FAKE_PLAN))
+
+        event = self._create_event(
+            FAKE_EVENT_PLAN_REQUEST_IS_OBJECT,
+            patch_data={"created": int(time.time()) + 10},
+        )
+        event.invoke_webhook_handlers()
+
+        plan_retrieve_mock.assert_called_once()
+
+
+@override_settings(DJSTRIPE_WEBHOOK_TRUST_PAYLOAD=True)
+@patch("stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True)
+@patch("stripe.Plan.retrieve", return_value=deepcopy(FAKE_PLAN), autospec=True)
+class TestTrustedWebhookPayload(EventTestCase):
+    def _process_plan_event(self, **patch_data):
+        patch_data.setdefault("api_version", djstripe_settings.STRIPE_API_VERSION)
+        event = self._create_event(FAKE_EVENT_PLAN_CREATED, patch_data=patch_data)
+        event.invoke_webhook_handlers()
+
+    def test_synced_from_payload(self, plan_retrieve_mock, product_retrieve_mock):
+        self._process_plan_event()
+
+        plan_retrieve_mock.assert_not_called()
+        plan = Plan.objects.get(id=FAKE_PLAN["id"])
+        self.assertEqual(plan.nickname, FAKE_PLAN["nickname"])
+
+    def test_other_api_version(self, plan_retrieve_mock, product_retrieve_mock):
+        self._process_plan_event(api_version="2016-03-07")
+
+        plan_retrieve_mock.assert_called_once()
+
+    @override_settings(DJSTRIPE_WEBHOOK_VALIDATION=None)
+    def test_validation_disabled(self, plan_retrieve_mock, product_retrieve_mock):
+        self._process_plan_event()
+
+        plan_retrieve_mock.assert_called_once()
+
+    def test_local_object_newer(self, plan_retrieve_mock, product_retrieve_mock):
+        Plan.sync_from_stripe_data(deepcopy(FAKE_PLAN))
+
+        # the event happened before the plan was last synced
+        self._process_plan_event()
+
+        plan_retrieve_mock.assert_called_once()
+
+    def test_retrieved_data_synced_with_clock_behind(
+        self, plan_retrieve_mock, product_retrieve_mock
+    ):
+        # Synced from an event which, by the local clock, happens in the future
+        Plan.sync_from_stripe_data(
+            deepcopy(FAKE_PLAN), source_timestamp=timezone.now() + timedelta(hours=1)
+        )
+        plan_retrieve_mock.return_value = dict(deepcopy(FAKE_PLAN), nickname="New")
+
+        self._process_plan_event(api_version="2016-03-07")
+
+        plan_retrieve_mock.assert_called_once()
+        self.assertEqual(Plan.objects.get().nickname, "New")
+
+
 class TestPriceEvents(EventTestCase):
     @patch("stripe.Price.retrieve", autospec=True)
     @patch("stripe.Event.retrieve", autospec=True)
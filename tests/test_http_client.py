@@ -0,0 +1,129 @@
+"""
+dj-stripe HTTP Client Tests.
+"""
+import threading
+from unittest.mock import MagicMock, patch
+
+import requests
+import stripe
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djstripe.http_client import DjstripeHTTPClient, install_http_client
+from djstripe.settings import djstripe_settings
+from djstripe.signals import stripe_api_request
+
+
+class TestInstallHTTPClient(TestCase):
+    def setUp(self):
+        self.default_http_client = stripe.default_http_client
+        stripe.default_http_client = None
+
+    def tearDown(self):
+        stripe.default_http_client = self.default_http_client
+
+    @override_settings(
+        DJSTRIPE_HTTP_CLIENT_TIMEOUT=(3, 30),
+        DJSTRIPE_HTTP_CLIENT_POOL_SIZE=4,
+        DJSTRIPE_HTTP_CLIENT_MAX_RETRIES=2,
+    )
+    def test_installed(self):
+        self.assertTrue(install_http_client())
+
+        client = stripe.default_http_client
+        self.assertIsInstance(client, DjstripeHTTPClient)
+        self.assertEqual(client._timeout, (3, 30))
+        self.assertEqual(client._pool_size, 4)
+        self.assertEqual(client._max_network_retries(), 2)
+
+    def test_disabled_by_default(self):
+        self.assertFalse(djstripe_settings.HTTP_CLIENT_ENABLED)
+
+    def test_existing_client_kept(self):
+        client = stripe.http_client.RequestsClient()
+        stripe.default_http_client = client
+
+        self.assertFalse(install_http_client())
+        self.assertIs(stripe.default_http_client, client)
+
+
+class TestDjstripeHTTPClient(TestCase):
+    def test_adapter_shared_by_threads(self):
+        client = DjstripeHTTPClient(pool_size=4)
+        session = client._get_session()
+        self.assertIs(client._get_session(), session)
+
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(client._get_session()))
+        thread.start()
+        thread.join()
+
+        # One session per thread, sharing the connection pool
+        self.assertIsNot(sessions[0], session)
+        adapter = session.get_adapter("https://api.stripe.com")
+        self.assertIs(sessions[0].get_adapter("https://api.stripe.com"), adapter)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    def test_adapter_per_process(self):
+        client = DjstripeHTTPClient()
+        session = client._get_session()
+        adapter = session.get_adapter("https://api.stripe.com")
+
+        with patch("djstripe.http_client.os.getpid", return_value=-1):
+            session = client._get_session()
+            self.assertIsNot(session.get_adapter("https://api.stripe.com"), adapter)
+
+    @patch.object(requests.Session, "request")
+    def test_proxy_read_at_request_time(self, request_mock):
+        request_mock.return_value = MagicMock(
+            status_code=200, content=b"{}", headers={}
+        )
+        client = DjstripeHTTPClient()
+
+        with patch.object(stripe, "proxy", "http://proxy:3128"), patch.object(
+            stripe, "verify_ssl_certs", False
+        ):
+            client.request("get", "https://api.stripe.com/v1/customers", {})
+
+        kwargs = request_mock.call_args[1]
+        self.assertEqual(
+            kwargs["proxies"],
+            {"http": "http://proxy:3128", "https": "http://proxy:3128"},
+        )
+        self.assertFalse(kwargs["verify"])
+
+        client = DjstripeHTTPClient(proxy="http://other:3128")
+        with patch.object(stripe, "proxy", "http://proxy:3128"):
+            client.request("get", "https://api.stripe.com/v1/customers", {})
+
+        self.assertEqual(
+            request_mock.call_args[1]["proxies"],
+            {"http": "http://other:3128", "https": "http://other:3128"},
+        )
+
+    def test_default_max_retries(self):
+        with patch.object(stripe, "max_network_retries", 3):
+            self.assertEqual(DjstripeHTTPClient()._max_network_retries(), 3)
+
+    @patch.object(requests.Session, "request")
+    def test_request_timed(self, request_mock):
+        request_mock.return_value = MagicMock(
+            status_code=200, content=b"{}", headers={}
+        )
+        receiver = MagicMock()
+        stripe_api_request.connect(receiver)
+        self.addCleanup(stripe_api_request.disconnect, receiver)
+
+        client = DjstripeHTTPClient(timeout=5)
+        content, status_code, _ = client.request(
+            "get", "https://api.stripe.com/v1/customers", {}
+        )
+
+        self.assertEqual((content, status_code), (b"{}", 200))
+        self.assertEqual(request_mock.call_args[1]["timeout"], 5)
+        receiver.assert_called_once()
+        kwargs = receiver.call_args[1]
+        self.assertEqual(kwargs["method"], "get")
+        self.assertEqual(kwargs["url"], "https://api.stripe.com/v1/customers")
+        self.assertEqual(kwargs["status_code"], 200)
+        self.assertGreaterEqual(kwargs["duration"], 0)
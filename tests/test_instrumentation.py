@@ -0,0 +1,171 @@
+"""
+dj-stripe Instrumentation Tests.
+"""
+from collections import defaultdict
+from copy import deepcopy
+from unittest.mock import Mock, call, patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from djstripe import instrumentation, webhooks
+from djstripe.instrumentation import (
+    ERROR,
+    SUCCESS,
+    LatencySummary,
+    Measurement,
+    StatsdSink,
+    latency_summary,
+)
+from djstripe.models import Event
+
+from . import FAKE_EVENT_TRANSFER_CREATED
+
+sink = Mock()
+
+
+class TestMeasure(TestCase):
+    def setUp(self):
+        sink.reset_mock()
+
+    @override_settings(
+        DJSTRIPE_INSTRUMENTATION_SINKS=["tests.test_instrumentation.sink"]
+    )
+    def test_measure(self):
+        with instrumentation.measure("webhook.event", event_type="customer.created"):
+            pass
+        with self.assertRaises(ValueError):
+            with instrumentation.measure("webhook.handler", handler="handle"):
+                raise ValueError
+
+        success, error = [args[0] for args, _ in sink.call_args_list]
+        self.assertEqual(
+            success._replace(duration=0),
+            Measurement("webhook.event", 0, SUCCESS, "customer.created", ""),
+        )
+        self.assertEqual(
+            error._replace(duration=0),
+            Measurement("webhook.handler", 0, ERROR, "", "handle"),
+        )
+
+    def test_no_sinks(self):
+        with instrumentation.measure("webhook.event"):
+            pass
+        instrumentation.record("webhook.event", 1)
+
+        self.assertEqual(instrumentation.get_sinks(), [])
+        sink.assert_not_called()
+
+    @override_settings(DJSTRIPE_INSTRUMENTATION_SINKS=[Mock(side_effect=KeyError)])
+    def test_failing_sink(self):
+        with instrumentation.measure("webhook.event"):
+            pass
+
+    @override_settings(
+        DJSTRIPE_INSTRUMENTATION_SINKS=["tests.test_instrumentation.sink"]
+    )
+    def test_event_process(self):
+        handler = Mock()
+        with patch.object(
+            webhooks, "registrations", defaultdict(list, {"transfer": [handler]})
+        ), patch.object(webhooks, "registrations_global", []):
+            Event.process(deepcopy(FAKE_EVENT_TRANSFER_CREATED))
+
+        handler.assert_called_once()
+        measurements = [args[0] for args, _ in sink.call_args_list]
+        self.assertEqual(
+            [(m.stage, m.outcome, m.event_type) for m in measurements],
+            [
+                ("webhook.event.create", SUCCESS, "transfer.created"),
+                ("webhook.handler", SUCCESS, "transfer.created"),
+                ("webhook.signal", SUCCESS, "transfer.created"),
+                ("webhook.event", SUCCESS, "transfer.created"),
+            ],
+        )
+        self.assertEqual(measurements[1].handler, repr(handler))
+
+
+class TestSinks(TestCase):
+    def test_statsd_sink(self):
+        client = Mock()
+        statsd_sink = StatsdSink(client)
+
+        statsd_sink(Measurement("webhook.event", 0.25, SUCCESS, "customer.created"))
+        statsd_sink(
+            Measurement(
+                "webhook.handler", 0.5, ERROR, "customer.created", "app.handlers.handle"
+            )
+        )
+
+        client.timing.assert_has_calls(
+            [
+                call("djstripe.webhook.event.customer.created", 250),
+                call(
+                    "djstripe.webhook.handler.customer.created.app_handlers_handle", 500
+                ),
+            ]
+        )
+        client.incr.assert_has_calls(
+            [
+                call("djstripe.webhook.event.customer.created.success"),
+                call(
+                    "djstripe.webhook.handler.customer.created.app_handlers_handle.error"
+                ),
+            ]
+        )
+
+    def test_latency_summary(self):
+        summary = LatencySummary(window=10)
+        for duration in range(1, 21):
+            summary(Measurement("webhook.event", duration, SUCCESS, "customer.created"))
+        summary(Measurement("webhook.event", 100, ERROR, "invoice.paid"))
+        summary(Measurement("webhook.handler", 1000, SUCCESS, "invoice.paid"))
+
+        self.assertEqual(
+            summary.summary(),
+            [
+                {
+                    "event_type": "invoice.paid",
+                    "count": 1,
+                    "errors": 1,
+                    "p50": 100,
+                    "p95": 100,
+                    "max": 100,
+                },
+                {
+                    "event_type": "customer.created",
+                    "count": 10,
+                    "errors": 0,
+                    "p50": 15,
+                    "p95": 19,
+                    "max": 20,
+                },
+            ],
+        )
+
+
+@override_settings(DJSTRIPE_INSTRUMENTATION_LATENCY_WINDOW=100)
+class TestLatencyAdmin(TestCase):
+    def setUp(self):
+        latency_summary.clear()
+        self.addCleanup(latency_summary.clear)
+        user = get_user_model().objects.create_superuser(
+            username="admin", email="admin@example.com", password="admin"
+        )
+        self.client.force_login(user)
+
+    def test_latency_view(self):
+        instrumentation.record("webhook.event", 0.5, event_type="customer.created")
+
+        response = self.client.get(reverse("admin:djstripe_event_latency"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "customer.created")
+        self.assertContains(response, "0.500")
+
+    def test_changelist_links_to_latency(self):
+        response = self.client.get(reverse("admin:djstripe_event_changelist"))
+
+        self.assertContains(response, reverse("admin:djstripe_event_latency"))
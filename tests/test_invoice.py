@@ -12,7 +12,13 @@ from django.test.testcases import TestCase
 from stripe.error import InvalidRequestError
 
 from djstripe.enums import InvoiceStatus
-from djstripe.models import Invoice, Plan, Subscription, UpcomingInvoice
+from djstripe.models import (
+    Invoice,
+    InvoiceItem,
+    Plan,
+    Subscription,
+    UpcomingInvoice,
+)
 from djstripe.settings import djstripe_settings
 
 from . import (
@@ -31,13 +37,14 @@ from . import (
     FAKE_TAX_RATE_EXAMPLE_2_SALES,
     FAKE_UPCOMING_INVOICE,
     IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+    AssertBatchedSyncMixin,
     AssertStripeFksMixin,
 )
 
 pytestmark = pytest.mark.django_db
 
 
-class InvoiceTest(AssertStripeFksMixin, TestCase):
+class InvoiceTest(AssertBatchedSyncMixin, AssertStripeFksMixin, TestCase):
     def setUp(self):
         # create a Stripe Platform Account
         self.account = FAKE_PLATFORM_ACCOUNT.create()
@@ -818,6 +825,63 @@ class InvoiceTest(AssertStripeFksMixin, TestCase):
             | {"djstripe.Invoice.subscription"},
         )
 
+    @patch(
+        "djstripe.models.Account.get_default_account",
+        autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+    )
+    @patch(
+        "stripe.BalanceTransaction.retrieve",
+        return_value=deepcopy(FAKE_BALANCE_TRANSACTION),
+        autospec=True,
+    )
+    @patch(
+        "stripe.Subscription.retrieve",
+        return_value=deepcopy(FAKE_SUBSCRIPTION),
+        autospec=True,
+    )
+    @patch("stripe.Charge.retrieve", return_value=deepcopy(FAKE_CHARGE), autospec=True)
+    @patch(
+        "stripe.PaymentIntent.retrieve",
+        return_value=deepcopy(FAKE_PAYMENT_INTENT_I),
+        autospec=True,
+    )
+    @patch(
+        "stripe.PaymentMethod.retrieve",
+        return_value=deepcopy(FAKE_CARD_AS_PAYMENT_METHOD),
+        autospec=True,
+    )
+    @patch(
+        "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
+    )
+    def test_invoice_items_synced_in_batch(
+        self,
+        product_retrieve_mock,
+        paymentmethod_card_retrieve_mock,
+        payment_intent_retrieve_mock,
+        charge_retrieve_mock,
+        subscription_retrieve_mock,
+        balance_transaction_retrieve_mock,
+        default_account_mock,
+    ):
+        default_account_mock.return_value = self.account
+        invoice = Invoice.sync_from_stripe_data(deepcopy(FAKE_INVOICE))
+
+        def sync_lines(lines):
+            data = deepcopy(FAKE_INVOICE)
+            data["lines"] = lines
+            with patch.object(
+                stripe.ListObject, "auto_paging_iter"
+            ) as auto_paging_iter_mock:
+                items = Invoice._stripe_object_to_invoice_items(
+                    InvoiceItem, data, invoice
+                )
+            auto_paging_iter_mock.assert_not_called()
+            return items
+
+        # Everything is written or looked up once per batch
+        self.assert_synced_in_batch(sync_lines, FAKE_INVOICE["lines"]["data"][0])
+        self.assertEqual(invoice.invoiceitems.count(), 23)
+
     @patch(
         "djstripe.models.Account.get_default_account",
         autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
@@ -10,7 +10,14 @@ from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.utils import timezone
 
-from djstripe.models import Charge, Customer, Plan, Subscription, Transfer
+from djstripe.models import (
+    Charge,
+    Customer,
+    Plan,
+    Subscription,
+    Transfer,
+    WebhookEventTrigger,
+)
 
 from . import (
     FAKE_PLAN,
@@ -310,3 +317,75 @@ class ChargeManagerTest(TestCase):
             paid_totals["total_refunded"],
             "Total amount refunded is not correct.",
         )
+
+
+class WebhookEventTriggerManagerTest(TestCase):
+    def _create_trigger(self, **kwargs):
+        kwargs.setdefault("valid", True)
+        return WebhookEventTrigger.objects.create(
+            remote_ip="127.0.0.1", headers={}, body="{}", **kwargs
+        )
+
+    def test_pending(self):
+        deferred = self._create_trigger(deferred=True)
+        failed = self._create_trigger(exception="Test error")
+        retry_due = self._create_trigger(
+            deferred=True, next_attempt_at=timezone.now() - datetime.timedelta(1)
+        )
+
+        # inline webhook events being processed
+        self._create_trigger()
+        # invalid, processed or given up on
+        self._create_trigger(deferred=True, valid=False)
+        self._create_trigger(deferred=True, processed=True)
+        self._create_trigger(deferred=True, dead_lettered=True)
+        # retry not due yet
+        self._create_trigger(
+            deferred=True, next_attempt_at=timezone.now() + datetime.timedelta(1)
+        )
+
+        self.assertEqual(
+            set(WebhookEventTrigger.objects.pending()), {deferred, failed, retry_due}
+        )
+
+    def test_claim(self):
+        first = self._create_trigger(deferred=True)
+        second = self._create_trigger(deferred=True)
+        self._create_trigger(deferred=True)
+
+        claimed = WebhookEventTrigger.objects.claim(
+            WebhookEventTrigger.objects.pending(), limit=2, lease=60
+        )
+
+        self.assertEqual(claimed, [first, second])
+        self.assertEqual([trigger.attempts for trigger in claimed], [1, 1])
+        self.assertTrue(all(t.next_attempt_at > timezone.now() for t in claimed))
+
+        # claimed triggers are leased, only the last one is left to claim
+        self.assertEqual(
+            len(
+                WebhookEventTrigger.objects.claim(
+                    WebhookEventTrigger.objects.pending(), limit=2, lease=60
+                )
+            ),
+            1,
+        )
+
+    def test_claim_gives_up_after_max_attempts(self):
+        # e.g. its worker crashed during the last attempt, and its lease ran out
+        exhausted = self._create_trigger(
+            deferred=True,
+            attempts=3,
+            next_attempt_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+        retried = self._create_trigger(deferred=True, attempts=2)
+
+        claimed = WebhookEventTrigger.objects.claim(
+            WebhookEventTrigger.objects.pending(), limit=2, lease=60, max_attempts=3
+        )
+
+        self.assertEqual(claimed, [retried])
+        exhausted.refresh_from_db()
+        self.assertTrue(exhausted.dead_lettered)
+        self.assertIsNone(exhausted.next_attempt_at)
+        self.assertEqual(exhausted.attempts, 3)
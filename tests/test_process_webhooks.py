@@ -0,0 +1,107 @@
+"""
+dj-stripe djstripe_process_webhooks Command Tests.
+"""
+import io
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djstripe.models import WebhookEventTrigger
+
+
+class TestProcessWebhooks(TestCase):
+    def setUp(self):
+        self.trigger = WebhookEventTrigger.objects.create(
+            remote_ip="127.0.0.1",
+            headers={},
+            body="{}",
+            valid=True,
+            deferred=True,
+        )
+
+    def _process(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command(
+            "djstripe_process_webhooks",
+            "--max-attempts",
+            "3",
+            "--retry-delay",
+            "60",
+            stdout=stdout,
+            stderr=stderr,
+        )
+        self.trigger.refresh_from_db()
+        return stderr.getvalue()
+
+    def _make_due(self):
+        WebhookEventTrigger.objects.filter(id=self.trigger.id).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    @patch.object(WebhookEventTrigger, "process_deferred", return_value=True)
+    def test_processed(self, process_deferred_mock):
+        self._process()
+
+        process_deferred_mock.assert_called_once()
+        self.assertEqual(self.trigger.attempts, 1)
+        self.assertFalse(self.trigger.dead_lettered)
+
+    @patch.object(WebhookEventTrigger, "process_deferred", return_value=False)
+    def test_retried_with_backoff_then_dead_lettered(self, process_deferred_mock):
+        # Each retry waits between half and all of a doubling delay
+        for attempt, delay in ((1, 60), (2, 120)):
+            before = timezone.now()
+            stderr = self._process()
+
+            self.assertIn("retrying at", stderr)
+            self.assertEqual(self.trigger.attempts, attempt)
+            self.assertFalse(self.trigger.dead_lettered)
+            self.assertGreaterEqual(
+                self.trigger.next_attempt_at, before + timedelta(seconds=delay / 2)
+            )
+            self.assertLessEqual(
+                self.trigger.next_attempt_at,
+                timezone.now() + timedelta(seconds=delay),
+            )
+
+            # Not retried before it is due
+            self._process()
+            self.assertEqual(self.trigger.attempts, attempt)
+            self._make_due()
+
+        stderr = self._process()
+
+        self.assertIn("Gave up on", stderr)
+        self.assertEqual(self.trigger.attempts, 3)
+        self.assertTrue(self.trigger.dead_lettered)
+        self.assertIsNone(self.trigger.next_attempt_at)
+        self.assertEqual(process_deferred_mock.call_count, 3)
+
+    @patch("djstripe.management.commands.djstripe_process_webhooks.random.uniform")
+    @patch.object(WebhookEventTrigger, "process_deferred", return_value=False)
+    def test_jitter(self, process_deferred_mock, uniform_mock):
+        uniform_mock.return_value = 45
+
+        before = timezone.now()
+        self._process()
+
+        uniform_mock.assert_called_once_with(30, 60)
+        self.assertGreaterEqual(
+            self.trigger.next_attempt_at, before + timedelta(seconds=45)
+        )
+
+    @patch.object(WebhookEventTrigger, "process_deferred")
+    def test_lease_ran_out_after_last_attempt(self, process_deferred_mock):
+        # The worker of the last attempt crashed, and its lease ran out
+        WebhookEventTrigger.objects.filter(id=self.trigger.id).update(
+            attempts=3, next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self._process()
+
+        process_deferred_mock.assert_not_called()
+        self.assertTrue(self.trigger.dead_lettered)
+        self.assertEqual(self.trigger.attempts, 3)
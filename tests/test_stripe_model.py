@@ -1,13 +1,41 @@
 """
 dj-stripe StripeModel Model Tests.
 """
+import threading
+from copy import deepcopy
 from unittest.mock import MagicMock, patch
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.db import IntegrityError, connection
 from django.test import TestCase
-
-from djstripe.models import Account, Customer, StripeModel
+from django.test.utils import CaptureQueriesContext, override_settings
+from stripe.error import InvalidRequestError
+
+from djstripe.context_managers import get_identity_map, stripe_identity_map
+from djstripe.models import (
+    Account,
+    Charge,
+    Coupon,
+    Customer,
+    Invoice,
+    PaymentIntent,
+    Price,
+    Product,
+    StripeModel,
+    SyncCheckpoint,
+)
+from djstripe.models.base import (
+    AUTO_EXPAND_MIN_SYNCS,
+    clear_field_mapping_plans,
+    clear_refetch_stats,
+    get_refetch_stats,
+    record_refetch,
+)
 from djstripe.settings import djstripe_settings
+from djstripe.utils import convert_tstamp, get_payload_hash
+
+from . import FAKE_COUPON, FAKE_PRICE, FAKE_PRODUCT
 
 pytestmark = pytest.mark.django_db
 
@@ -37,6 +65,565 @@ class TestStripeModelExceptions(TestCase):
             )
 
 
+class TestFieldMappingPlan(TestCase):
+    def test_plan_is_cached(self):
+        plan = Charge._get_field_mapping_plan()
+        self.assertIs(plan, Charge._get_field_mapping_plan())
+
+    def test_plan_is_rebuilt_after_clear(self):
+        plan = Charge._get_field_mapping_plan()
+        clear_field_mapping_plans()
+        rebuilt_plan = Charge._get_field_mapping_plan()
+        self.assertIsNot(plan, rebuilt_plan)
+        self.assertEqual(
+            [field for field, _ in plan], [field for field, _ in rebuilt_plan]
+        )
+
+    def test_plan_fields(self):
+        field_names = [field.name for field, _ in Charge._get_field_mapping_plan()]
+
+        self.assertIn("amount", field_names)
+        self.assertNotIn("djstripe_owner_account", field_names)
+        self.assertNotIn("djstripe_id", field_names)
+        # reverse many relations aren't synced
+        self.assertNotIn("refunds", field_names)
+
+        relations = [
+            field.name
+            for field, convert in Charge._get_field_mapping_plan()
+            if convert is None
+        ]
+        self.assertIn("customer", relations)
+        self.assertIn("balance_transaction", relations)
+
+    def test_plan_blanks_null_text_fields(self):
+        converters = dict(
+            (field.name, convert)
+            for field, convert in Customer._get_field_mapping_plan()
+        )
+        self.assertEqual(converters["description"]({"description": None}), "")
+        self.assertEqual(converters["description"]({"description": "foo"}), "foo")
+        self.assertIsNone(converters["metadata"]({"metadata": None}))
+
+
+class TestAttachPendingRelations(TestCase):
+    def setUp(self):
+        self.old_product = Product.objects.create(
+            id="prod_old", name="Old", type="service"
+        )
+        for price_id in ("price_1", "price_2", "price_3"):
+            Price.objects.create(
+                id=price_id,
+                product=self.old_product,
+                currency="usd",
+                active=True,
+                type="one_time",
+            )
+
+    def test_relations_updated_in_one_query(self):
+        product = Product.objects.create(id="prod_new", name="New", type="service")
+        field = Price._meta.get_field("product")
+        other_relation = ("price_3", field, "prod_other")
+        pending_relations = [
+            ("price_1", field, product.id),
+            other_relation,
+            ("price_2", field, product.id),
+        ]
+
+        # One UPDATE for both prices, rather than a SELECT, a full-row UPDATE
+        # and a reload of the product for each of them.
+        with self.assertNumQueries(1):
+            product._attach_objects_post_save_hook(
+                Product, {}, pending_relations=pending_relations
+            )
+
+        self.assertEqual(pending_relations, [other_relation])
+        self.assertEqual(
+            set(Price.objects.filter(product=product).values_list("id", flat=True)),
+            {"price_1", "price_2"},
+        )
+        self.assertEqual(Price.objects.get(id="price_3").product, self.old_product)
+
+    def test_loaded_instances_updated(self):
+        product = Product.objects.create(id="prod_new", name="New", type="service")
+        field = Price._meta.get_field("product")
+
+        with stripe_identity_map() as identity_map:
+            price = Price.objects.get(id="price_1")
+            identity_map.add(price)
+            product._attach_objects_post_save_hook(
+                Product, {}, pending_relations=[("price_1", field, product.id)]
+            )
+
+        self.assertIs(price.product, product)
+
+
+@override_settings(DJSTRIPE_SYNC_PREFETCH_WORKERS=4)
+class TestPrefetchForeignKeys(TestCase):
+    def setUp(self):
+        self.data = {
+            "id": "ch_1",
+            "customer": "cus_1",
+            "invoice": "in_1",
+            "payment_intent": "pi_1",
+            "balance_transaction": None,
+        }
+        # Only returns once both objects are being retrieved at the same time
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def retrieve(self, id, **kwargs):
+        self.barrier.wait()
+        return {"id": id}
+
+    def test_retrieved_concurrently(self):
+        Customer.objects.create(id="cus_1", livemode=False)
+
+        with patch.object(
+            Invoice.stripe_class, "retrieve", side_effect=self.retrieve
+        ) as invoice_retrieve, patch.object(
+            PaymentIntent.stripe_class, "retrieve", side_effect=self.retrieve
+        ), stripe_identity_map() as identity_map:
+            Charge._prefetch_foreign_keys([self.data], current_ids={"ch_1"})
+
+            self.assertEqual(
+                set(identity_map.prefetched),
+                {(Invoice, "in_1"), (PaymentIntent, "pi_1")},
+            )
+            self.assertEqual(Invoice._pop_prefetched("in_1"), {"id": "in_1"})
+            self.assertIsNone(Invoice._pop_prefetched("in_1"))
+            # The existing customer is loaded for the sync of the foreign key
+            self.assertIn((Customer, "cus_1"), identity_map.instances)
+
+        invoice_retrieve.assert_called_once()
+
+    def test_existing_objects_loaded_once(self):
+        customer = Customer.objects.create(id="cus_1", livemode=False)
+        data = {**self.data, "invoice": None, "payment_intent": None}
+
+        with stripe_identity_map():
+            with self.assertNumQueries(1):
+                Charge._prefetch_foreign_keys([data], current_ids={"ch_1"})
+            with self.assertNumQueries(0):
+                instance, created = Customer._get_or_create_from_stripe_object(
+                    data, "customer"
+                )
+
+        self.assertEqual(instance, customer)
+        self.assertFalse(created)
+
+    def test_current_ids_skipped(self):
+        with patch.object(
+            Invoice.stripe_class, "retrieve"
+        ) as invoice_retrieve, stripe_identity_map() as identity_map:
+            Charge._prefetch_foreign_keys([self.data], current_ids={"in_1"})
+
+        invoice_retrieve.assert_not_called()
+        self.assertEqual(identity_map.prefetched, {})
+
+    @override_settings(DJSTRIPE_SYNC_PREFETCH_WORKERS=0)
+    def test_disabled(self):
+        with patch.object(
+            Invoice.stripe_class, "retrieve"
+        ) as invoice_retrieve, stripe_identity_map() as identity_map:
+            Charge._prefetch_foreign_keys([self.data])
+
+        invoice_retrieve.assert_not_called()
+        self.assertEqual(identity_map.prefetched, {})
+
+
+class TestAutoExpand(TestCase):
+    def setUp(self):
+        clear_refetch_stats()
+        self.addCleanup(clear_refetch_stats)
+
+    def test_refetch_recorded(self):
+        price_data = deepcopy(FAKE_PRICE)
+        price_data["product"] = FAKE_PRODUCT["id"]
+
+        with patch.object(
+            Product.stripe_class, "retrieve", return_value=deepcopy(FAKE_PRODUCT)
+        ):
+            Price.sync_from_stripe_data(price_data)
+            Price.sync_from_stripe_data({**price_data, "nickname": "Renamed"})
+
+        # Only retrieved the first time
+        self.assertEqual(get_refetch_stats()[Price]["product"], (2, 1))
+
+    @override_settings(DJSTRIPE_AUTO_EXPAND=True)
+    def test_refetched_fields_expanded(self):
+        for _ in range(AUTO_EXPAND_MIN_SYNCS - 1):
+            record_refetch(Charge, "customer", True)
+            record_refetch(Charge, "invoice", False)
+        self.assertEqual(Charge._get_auto_expand_fields(), [])
+
+        record_refetch(Charge, "customer", True)
+        record_refetch(Charge, "invoice", False)
+        self.assertEqual(Charge._get_auto_expand_fields(), ["customer"])
+        self.assertEqual(Charge._get_list_auto_expand_fields(), ["data.customer"])
+
+    @override_settings(
+        DJSTRIPE_AUTO_EXPAND_OVERRIDES={
+            "Charge": ["invoice"],
+            "Invoice": ["subscription"],
+            "Subscription": ["customer"],
+            "Customer": ["default_source"],
+        }
+    )
+    def test_overrides(self):
+        self.assertEqual(
+            Charge._get_auto_expand_fields(),
+            [
+                "invoice",
+                "invoice.subscription",
+                "invoice.subscription.customer",
+                "invoice.subscription.customer.default_source",
+            ],
+        )
+        # Stripe rejects expansions more than 4 levels deep
+        self.assertEqual(
+            Charge._get_list_auto_expand_fields(),
+            [
+                "data.invoice",
+                "data.invoice.subscription",
+                "data.invoice.subscription.customer",
+            ],
+        )
+
+    @override_settings(DJSTRIPE_AUTO_EXPAND_OVERRIDES={"Price": ["product"]})
+    def test_api_retrieve_expanded(self):
+        price = Price(id="price_1")
+
+        with patch.object(Price, "stripe_class") as stripe_class_mock:
+            price.api_retrieve(stripe_account="acct_1")
+
+        stripe_class_mock.retrieve.assert_called_once_with(
+            id="price_1",
+            api_key=djstripe_settings.STRIPE_SECRET_KEY,
+            expand=["tiers", "product"],
+            stripe_account="acct_1",
+        )
+
+    @override_settings(DJSTRIPE_AUTO_EXPAND_OVERRIDES={"Price": ["product"]})
+    def test_rejected_expansions_disabled(self):
+        price = Price(id="price_1")
+
+        with patch.object(Price, "stripe_class") as stripe_class_mock:
+            stripe_class_mock.retrieve.side_effect = [
+                InvalidRequestError(
+                    "This property cannot be expanded (product).", "expand"
+                ),
+                {"id": "price_1"},
+            ]
+            self.assertEqual(price.api_retrieve(), {"id": "price_1"})
+
+        self.assertEqual(
+            [call[1]["expand"] for call in stripe_class_mock.retrieve.call_args_list],
+            [["tiers", "product"], ["tiers"]],
+        )
+        self.assertEqual(Price._get_auto_expand_fields(), [])
+
+
+class TestAsyncApi(TestCase):
+    @patch.object(Coupon, "stripe_class")
+    def test_aapi_list(self, stripe_class_mock):
+        second_page = MagicMock(data=[{"id": "coupon-3"}], has_more=False)
+        first_page = MagicMock(
+            data=[{"id": "coupon-1"}, {"id": "coupon-2"}], has_more=True
+        )
+        first_page.next_page.return_value = second_page
+        stripe_class_mock.list.return_value = first_page
+
+        async def list_ids():
+            return [item["id"] async for item in Coupon.aapi_list(limit=2)]
+
+        self.assertEqual(
+            async_to_sync(list_ids)(), ["coupon-1", "coupon-2", "coupon-3"]
+        )
+        stripe_class_mock.list.assert_called_once_with(
+            api_key=djstripe_settings.STRIPE_SECRET_KEY, limit=2
+        )
+
+    def test_aapi_retrieve(self):
+        coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+        with patch.object(Coupon, "stripe_class") as stripe_class_mock:
+            data = async_to_sync(coupon.aapi_retrieve)(stripe_account="acct_1")
+
+        self.assertIs(data, stripe_class_mock.retrieve.return_value)
+        stripe_class_mock.retrieve.assert_called_once_with(
+            id=coupon.id,
+            api_key=coupon.default_api_key,
+            expand=[],
+            stripe_account="acct_1",
+        )
+
+    def test_async_sync_from_stripe_data(self):
+        coupon = async_to_sync(Coupon.async_sync_from_stripe_data)(
+            deepcopy(FAKE_COUPON)
+        )
+
+        self.assertEqual(coupon, Coupon.objects.get(id=FAKE_COUPON["id"]))
+
+
+class TestSourceTimestamp(TestCase):
+    def _coupon_data(self, **kwargs):
+        data = deepcopy(FAKE_COUPON)
+        data.update(kwargs)
+        return data
+
+    def test_stamped_on_create_and_update(self):
+        coupon = Coupon.sync_from_stripe_data(
+            self._coupon_data(), source_timestamp=convert_tstamp(100)
+        )
+        self.assertEqual(coupon.djstripe_source_timestamp, convert_tstamp(100))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.djstripe_source_timestamp, convert_tstamp(100))
+
+        coupon = Coupon.sync_from_stripe_data(self._coupon_data(times_redeemed=3))
+        self.assertGreater(coupon.djstripe_source_timestamp, convert_tstamp(100))
+
+    def test_stamped_in_insert(self):
+        with CaptureQueriesContext(connection) as context:
+            coupon = Coupon.sync_from_stripe_data(
+                self._coupon_data(), source_timestamp=convert_tstamp(100)
+            )
+
+        writes = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"djstripe_source_timestamp"', writes[0])
+        self.assertIn('"djstripe_payload_hash"', writes[0])
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.djstripe_payload_hash, get_payload_hash(FAKE_COUPON))
+
+    def test_older_data_skipped(self):
+        Coupon.sync_from_stripe_data(
+            self._coupon_data(times_redeemed=2), source_timestamp=convert_tstamp(200)
+        )
+
+        coupon = Coupon.sync_from_stripe_data(
+            self._coupon_data(times_redeemed=1), source_timestamp=convert_tstamp(100)
+        )
+
+        self.assertEqual(coupon.times_redeemed, 2)
+        self.assertEqual(Coupon.objects.get().times_redeemed, 2)
+        self.assertEqual(coupon.djstripe_source_timestamp, convert_tstamp(200))
+
+    def test_newer_data_synced(self):
+        Coupon.sync_from_stripe_data(
+            self._coupon_data(times_redeemed=1), source_timestamp=convert_tstamp(100)
+        )
+
+        # Stripe timestamps have a one second resolution
+        for timestamp in (100, 101):
+            coupon = Coupon.sync_from_stripe_data(
+                self._coupon_data(times_redeemed=timestamp),
+                source_timestamp=convert_tstamp(timestamp),
+            )
+            self.assertEqual(coupon.times_redeemed, timestamp)
+
+
+class TestChangedFields(TestCase):
+    def setUp(self):
+        self.coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+    def _get_updates(self, sync, data):
+        with CaptureQueriesContext(connection) as context:
+            sync(data)
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+
+    def test_unchanged_object_not_saved(self):
+        updates = self._get_updates(Coupon.sync_from_stripe_data, deepcopy(FAKE_COUPON))
+        self.assertEqual(updates, [])
+
+    def test_unchanged_objects_not_bulk_saved(self):
+        updates = self._get_updates(
+            Coupon.sync_many_from_stripe_data, [deepcopy(FAKE_COUPON)]
+        )
+        self.assertEqual(updates, [])
+
+    def test_only_changed_fields_saved(self):
+        data = deepcopy(FAKE_COUPON)
+        data["times_redeemed"] += 1
+
+        updates = self._get_updates(Coupon.sync_from_stripe_data, data)
+
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"times_redeemed"', updates[0])
+        self.assertIn('"djstripe_source_timestamp"', updates[0])
+        self.assertNotIn('"metadata"', updates[0])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, data["times_redeemed"])
+
+
+class TestPayloadHash(TestCase):
+    def setUp(self):
+        self.coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+    def test_hash_stored(self):
+        self.assertEqual(
+            self.coupon.djstripe_payload_hash, get_payload_hash(FAKE_COUPON)
+        )
+        self.coupon.refresh_from_db()
+        self.assertEqual(
+            self.coupon.djstripe_payload_hash, get_payload_hash(FAKE_COUPON)
+        )
+
+    @patch.object(Coupon, "_stripe_object_to_record")
+    def test_unchanged_payload_skipped(self, stripe_object_to_record_mock):
+        with self.assertNumQueries(1):
+            coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+        self.assertEqual(coupon.pk, self.coupon.pk)
+        stripe_object_to_record_mock.assert_not_called()
+
+    @patch.object(Coupon, "_stripe_object_to_record")
+    def test_unchanged_payload_skipped_in_bulk(self, stripe_object_to_record_mock):
+        coupons = Coupon.sync_many_from_stripe_data([deepcopy(FAKE_COUPON)])
+
+        self.assertEqual([coupon.pk for coupon in coupons], [self.coupon.pk])
+        stripe_object_to_record_mock.assert_not_called()
+
+    def test_changed_payload_fetched_once(self):
+        data = deepcopy(FAKE_COUPON)
+        data["times_redeemed"] += 1
+
+        with CaptureQueriesContext(connection) as context:
+            coupon = Coupon.sync_from_stripe_data(data)
+
+        selects = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('SELECT "djstripe_coupon"')
+        ]
+        self.assertEqual(len(selects), 1)
+        self.assertEqual(coupon.times_redeemed, data["times_redeemed"])
+
+    def test_local_changes_not_skipped(self):
+        self.coupon.times_redeemed += 1
+        self.coupon.save(update_fields=["times_redeemed"])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.djstripe_payload_hash, "")
+
+        coupon = Coupon.sync_from_stripe_data(deepcopy(FAKE_COUPON))
+
+        self.assertEqual(coupon.times_redeemed, FAKE_COUPON["times_redeemed"])
+        self.assertEqual(coupon.djstripe_payload_hash, get_payload_hash(FAKE_COUPON))
+
+
+class TestSyncManyFromStripeData(TestCase):
+    def _coupon_data(self, id, **kwargs):
+        data = deepcopy(FAKE_COUPON)
+        data.update(id=id, **kwargs)
+        return data
+
+    def test_creates_and_updates(self):
+        existing = Coupon.sync_from_stripe_data(self._coupon_data("coupon-1"))
+
+        coupons = Coupon.sync_many_from_stripe_data(
+            [
+                self._coupon_data("coupon-1", times_redeemed=5),
+                self._coupon_data("coupon-2"),
+                self._coupon_data("coupon-3"),
+            ]
+        )
+
+        self.assertEqual(
+            [coupon.id for coupon in coupons], ["coupon-1", "coupon-2", "coupon-3"]
+        )
+        self.assertEqual(coupons[0].pk, existing.pk)
+        self.assertTrue(all(coupon.pk for coupon in coupons))
+        self.assertEqual(Coupon.objects.count(), 3)
+        self.assertEqual(Coupon.objects.get(id="coupon-1").times_redeemed, 5)
+
+    def test_batches(self):
+        coupons = Coupon.sync_many_from_stripe_data(
+            (self._coupon_data(f"coupon-{i}") for i in range(5)), batch_size=2
+        )
+
+        self.assertEqual(len(coupons), 5)
+        self.assertEqual(Coupon.objects.count(), 5)
+
+    def test_duplicates_in_batch(self):
+        coupons = Coupon.sync_many_from_stripe_data(
+            [
+                self._coupon_data("coupon-1"),
+                self._coupon_data("coupon-1", times_redeemed=2),
+            ]
+        )
+
+        self.assertIs(coupons[0], coupons[1])
+        self.assertEqual(Coupon.objects.get().times_redeemed, 2)
+
+    def test_falls_back_to_sync_from_stripe_data_on_integrity_error(self):
+        with patch.object(
+            Coupon, "_bulk_sync_from_stripe_data", side_effect=IntegrityError
+        ), patch.object(Coupon, "sync_from_stripe_data") as mock_sync:
+            Coupon.sync_many_from_stripe_data(
+                [self._coupon_data("coupon-1"), self._coupon_data("coupon-2")]
+            )
+
+        self.assertEqual(mock_sync.call_count, 2)
+
+    def test_integrity_error_keeps_outer_identity_map(self):
+        product = Product(id="prod_outer")
+
+        def bulk_sync(batch, api_key):
+            get_identity_map().add(Product(id="prod_outer"))
+            get_identity_map().add(Coupon(id="coupon-1"))
+            raise IntegrityError
+
+        with stripe_identity_map() as identity_map, patch.object(
+            Coupon, "_bulk_sync_from_stripe_data", side_effect=bulk_sync
+        ), patch.object(Coupon, "sync_from_stripe_data"):
+            identity_map.add(product)
+            Coupon.sync_many_from_stripe_data([self._coupon_data("coupon-1")])
+
+            self.assertIs(identity_map.get(Product, "prod_outer"), product)
+            self.assertIsNone(identity_map.get(Coupon, "coupon-1"))
+
+    def test_not_bulk_syncable_model(self):
+        self.assertTrue(Coupon._supports_bulk_sync())
+        # Account customises _create_from_stripe_object
+        self.assertFalse(Account._supports_bulk_sync())
+
+        with patch.object(Account, "sync_from_stripe_data") as mock_sync:
+            Account.sync_many_from_stripe_data([{"id": "acct_1"}, {"id": "acct_2"}])
+
+        self.assertEqual(mock_sync.call_count, 2)
+
+
+class TestSyncCheckpoint(TestCase):
+    def test_advance_and_complete(self):
+        checkpoint = SyncCheckpoint(model_name="Customer")
+
+        # Stripe lists objects from newest to oldest
+        checkpoint.advance(convert_tstamp(200), "cus_2")
+        checkpoint.advance(convert_tstamp(100), "cus_1")
+        self.assertEqual(checkpoint.pending_high_water_mark, convert_tstamp(200))
+        self.assertEqual(checkpoint.starting_after, "cus_1")
+        self.assertIsNone(checkpoint.high_water_mark)
+
+        checkpoint.complete()
+        self.assertEqual(checkpoint.high_water_mark, convert_tstamp(200))
+        self.assertIsNone(checkpoint.pending_high_water_mark)
+        self.assertEqual(checkpoint.starting_after, "")
+
+    def test_complete_without_objects_keeps_high_water_mark(self):
+        checkpoint = SyncCheckpoint(
+            model_name="Customer", high_water_mark=convert_tstamp(200)
+        )
+        checkpoint.complete()
+        self.assertEqual(checkpoint.high_water_mark, convert_tstamp(200))
+
+
 @pytest.mark.parametrize("stripe_account", (None, "acct_fakefakefakefake001"))
 @pytest.mark.parametrize(
     "api_key, expected_api_key",
@@ -14,7 +14,7 @@ from django.utils import timezone
 from stripe.error import InvalidRequestError
 
 from djstripe.enums import SubscriptionStatus
-from djstripe.models import Plan, Product, Subscription
+from djstripe.models import Plan, Product, Subscription, SubscriptionItem
 from djstripe.models.billing import Invoice
 
 from . import (
@@ -42,6 +42,7 @@ from . import (
     FAKE_SUBSCRIPTION_MULTI_PLAN,
     FAKE_SUBSCRIPTION_NOT_PERIOD_CURRENT,
     FAKE_TAX_RATE_EXAMPLE_1_VAT,
+    AssertBatchedSyncMixin,
     AssertStripeFksMixin,
     datetime_to_unix,
 )
@@ -123,7 +124,7 @@ class SubscriptionStrTest(TestCase):
         )
 
 
-class SubscriptionTest(AssertStripeFksMixin, TestCase):
+class SubscriptionTest(AssertBatchedSyncMixin, AssertStripeFksMixin, TestCase):
     @patch(
         "stripe.BalanceTransaction.retrieve",
         return_value=deepcopy(FAKE_BALANCE_TRANSACTION),
@@ -894,6 +895,48 @@ class SubscriptionTest(AssertStripeFksMixin, TestCase):
             ),
         )
 
+    @patch("stripe.Plan.retrieve", autospec=True)
+    @patch(
+        "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
+    )
+    @patch(
+        "stripe.Customer.retrieve",
+        return_value=deepcopy(FAKE_CUSTOMER_II),
+        autospec=True,
+    )
+    @patch(
+        "stripe.Subscription.retrieve",
+        autospec=True,
+    )
+    def test_items_reconciled_in_batch(
+        self,
+        subscription_retrieve_mock,
+        customer_retrieve_mock,
+        product_retrieve_mock,
+        plan_retrieve_mock,
+    ):
+        subscription_fake = deepcopy(FAKE_SUBSCRIPTION_MULTI_PLAN)
+        subscription_fake["latest_invoice"] = FAKE_INVOICE["id"]
+        subscription_retrieve_mock.return_value = subscription_fake
+        subscription = Subscription.sync_from_stripe_data(subscription_fake)
+
+        def sync_items(items_list):
+            data = deepcopy(subscription_fake)
+            data["items"] = items_list
+            items = Subscription._stripe_object_to_subscription_items(
+                SubscriptionItem, data, subscription
+            )
+            self.assertEqual(
+                set(subscription.items.values_list("id", flat=True)),
+                {item.id for item in items},
+            )
+            return items
+
+        # Everything is read, written or deleted once per subscription
+        self.assert_synced_in_batch(
+            sync_items, FAKE_SUBSCRIPTION_MULTI_PLAN["items"]["data"][0]
+        )
+
     @patch("stripe.Plan.retrieve", autospec=True)
     @patch(
         "stripe.Product.retrieve", return_value=deepcopy(FAKE_PRODUCT), autospec=True
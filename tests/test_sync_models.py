@@ -0,0 +1,353 @@
+"""
+dj-stripe djstripe_sync_models Command Tests.
+"""
+import io
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from stripe.error import APIConnectionError
+
+from djstripe.management.commands.djstripe_sync_models import (
+    Command,
+    _sync_work_unit,
+)
+from djstripe.models import (
+    CountrySpec,
+    Coupon,
+    Price,
+    Product,
+    Subscription,
+    SubscriptionItem,
+    SyncCheckpoint,
+)
+from djstripe.utils import convert_tstamp
+
+from . import FAKE_COUPON, FAKE_PRICE, FAKE_PRODUCT
+
+# SQLite can't write from several threads at once, so the work units of a model
+# (one per account) are only synced concurrently on the other databases.
+ACCOUNTS = {"acct_1"} if connection.vendor == "sqlite" else {"acct_1", "acct_2"}
+
+
+class FakeApiList:
+    """
+    Lists a copy of the given Stripe objects per Stripe account, recording the
+    calls in the order they were made.
+    """
+
+    def __init__(self, calls, model, *data_list):
+        self.calls = calls
+        self.model = model
+        self.data_list = data_list
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        account = kwargs.get("stripe_account")
+        with self.lock:
+            self.calls.append((self.model.__name__, kwargs))
+        return [_for_account(data, account) for data in self.data_list]
+
+
+def _for_account(data, account):
+    data = deepcopy(data)
+    data["id"] = f"{data['id']}-{account}"
+    if data.get("object") == "price":
+        data["product"] = f"{data['product']}-{account}"
+    return data
+
+
+class SpawnRecordingExecutor(ThreadPoolExecutor):
+    """
+    Runs the work units of --mode process in threads, so that they see the
+    mocks, after checking that they could be sent to a spawned process.
+    """
+
+    start_methods = []
+
+    def __init__(self, max_workers, mp_context, initializer):
+        self.start_methods.append(mp_context.get_start_method())
+        super().__init__(max_workers=max_workers, initializer=initializer)
+
+    def submit(self, fn, *args, **kwargs):
+        pickle.dumps((fn, args, kwargs))
+        return super().submit(fn, *args, **kwargs)
+
+
+class TestSyncStripeObjects(TestCase):
+    def setUp(self):
+        self.command = Command(stdout=io.StringIO(), stderr=io.StringIO())
+        self.command.batch_size = 100
+
+    @patch.object(
+        Coupon, "sync_many_from_stripe_data", side_effect=IntegrityError("Conflict")
+    )
+    def test_bulk_failure_synced_one_by_one(self, sync_many_mock):
+        synced = list(self.command.sync_stripe_objects(Coupon, [deepcopy(FAKE_COUPON)]))
+
+        self.assertEqual([coupon.id for coupon in synced], [FAKE_COUPON["id"]])
+        self.assertIn("one by one: Conflict", self.command.stderr.getvalue())
+
+    @patch.object(Coupon, "sync_many_from_stripe_data", side_effect=TypeError("Bug"))
+    def test_unexpected_bulk_failure_raised(self, sync_many_mock):
+        with self.assertRaises(TypeError):
+            list(self.command.sync_stripe_objects(Coupon, [deepcopy(FAKE_COUPON)]))
+
+        self.assertFalse(Coupon.objects.exists())
+
+
+class TestSyncModelsCommand(TransactionTestCase):
+    """
+    The work units are synced in threads, which use their own database
+    connections and so can't see the data of a TestCase transaction.
+    """
+
+    def setUp(self):
+        self.calls = []
+        for model, data in (
+            (Coupon, FAKE_COUPON),
+            (Product, FAKE_PRODUCT),
+            (Price, FAKE_PRICE),
+        ):
+            patcher = patch.object(
+                model, "api_list", side_effect=FakeApiList(self.calls, model, data)
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(Command, "get_stripe_account", return_value=ACCOUNTS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync_with_workers(self):
+        call_command(
+            "djstripe_sync_models",
+            "Price",
+            "Coupon",
+            "Product",
+            "--workers",
+            "2",
+            "--mode",
+            "thread",
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+
+        for model, data in (
+            (Coupon, FAKE_COUPON),
+            (Product, FAKE_PRODUCT),
+            (Price, FAKE_PRICE),
+        ):
+            self.assertEqual(
+                set(model.objects.values_list("id", flat=True)),
+                {f"{data['id']}-{account}" for account in ACCOUNTS},
+            )
+        for account in ACCOUNTS:
+            price = Price.objects.get(id=f"{FAKE_PRICE['id']}-{account}")
+            self.assertEqual(price.product.id, f"{FAKE_PRODUCT['id']}-{account}")
+
+        # The prices have a foreign key to the products: they're synced after
+        synced_models = [model_name for model_name, _ in self.calls]
+        self.assertEqual(len(synced_models), 3 * len(ACCOUNTS))
+        self.assertLess(
+            max(i for i, name in enumerate(synced_models) if name == "Product"),
+            min(i for i, name in enumerate(synced_models) if name == "Price"),
+        )
+
+    @patch(
+        "djstripe.management.commands.djstripe_sync_models.ProcessPoolExecutor",
+        SpawnRecordingExecutor,
+    )
+    def test_sync_with_worker_processes(self):
+        SpawnRecordingExecutor.start_methods.clear()
+
+        call_command(
+            "djstripe_sync_models",
+            "Coupon",
+            "--workers",
+            "2",
+            "--mode",
+            "process",
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+
+        self.assertEqual(SpawnRecordingExecutor.start_methods, ["spawn"])
+        self.assertEqual(
+            set(Coupon.objects.values_list("id", flat=True)),
+            {f"{FAKE_COUPON['id']}-{account}" for account in ACCOUNTS},
+        )
+
+    def test_sync_work_unit(self):
+        count, errors = _sync_work_unit(
+            "Coupon",
+            {"stripe_account": "acct_1"},
+            batch_size=100,
+            incremental=False,
+            since=None,
+        )
+
+        self.assertEqual((count, errors), (1, 0))
+        self.assertTrue(
+            Coupon.objects.filter(id=f"{FAKE_COUPON['id']}-acct_1").exists()
+        )
+
+    def test_sort_models_by_dependencies(self):
+        self.assertEqual(
+            Command.sort_models_by_dependencies([Price, Coupon, Product]),
+            [Product, Price, Coupon],
+        )
+
+
+def _coupon(id, created):
+    return dict(deepcopy(FAKE_COUPON), id=id, created=created)
+
+
+@patch.object(Command, "get_stripe_account", return_value={"acct_1"})
+class TestIncrementalSync(TestCase):
+    def _sync(self, *args, model_name="Coupon"):
+        stderr = io.StringIO()
+        call_command(
+            "djstripe_sync_models",
+            model_name,
+            "--incremental",
+            *args,
+            stdout=io.StringIO(),
+            stderr=stderr,
+        )
+        return stderr.getvalue()
+
+    def _get_checkpoint(self):
+        return SyncCheckpoint.objects.get(model_name="Coupon", stripe_account="acct_1")
+
+    @patch.object(
+        Coupon,
+        "api_list",
+        side_effect=lambda **kwargs: [
+            _coupon("coupon-2", 200),
+            _coupon("coupon-1", 100),
+        ],
+    )
+    def test_next_sync_starts_from_checkpoint(self, api_list_mock, *mocks):
+        self._sync()
+
+        self.assertEqual(api_list_mock.call_args[1], {"stripe_account": "acct_1"})
+        self.assertEqual(Coupon.objects.count(), 2)
+        checkpoint = self._get_checkpoint()
+        self.assertEqual(checkpoint.high_water_mark, convert_tstamp(200))
+        self.assertEqual(checkpoint.starting_after, "")
+
+        self._sync()
+
+        self.assertEqual(
+            api_list_mock.call_args[1],
+            {"created": {"gte": 200}, "stripe_account": "acct_1"},
+        )
+
+    @patch.object(
+        Coupon, "api_list", side_effect=lambda **kwargs: [_coupon("coupon-1", 100)]
+    )
+    def test_interrupted_sync_resumed(self, api_list_mock, *mocks):
+        SyncCheckpoint.objects.create(
+            model_name="Coupon",
+            stripe_account="acct_1",
+            high_water_mark=convert_tstamp(50),
+            pending_high_water_mark=convert_tstamp(200),
+            starting_after="coupon-2",
+        )
+
+        self._sync()
+
+        self.assertEqual(
+            api_list_mock.call_args[1],
+            {
+                "created": {"gte": 50},
+                "starting_after": "coupon-2",
+                "stripe_account": "acct_1",
+            },
+        )
+        checkpoint = self._get_checkpoint()
+        self.assertEqual(checkpoint.high_water_mark, convert_tstamp(200))
+        self.assertEqual(checkpoint.starting_after, "")
+
+    def test_failed_sync_not_completed(self, *mocks):
+        def api_list(**kwargs):
+            yield _coupon("coupon-2", 200)
+            raise APIConnectionError("Connection lost")
+
+        with patch.object(Coupon, "api_list", side_effect=api_list):
+            stderr = self._sync("--batch-size", "1")
+
+        self.assertIn("Connection lost", stderr)
+        # Resumed after the last synced object, without moving the high-water mark
+        checkpoint = self._get_checkpoint()
+        self.assertIsNone(checkpoint.high_water_mark)
+        self.assertEqual(checkpoint.starting_after, "coupon-2")
+
+        with patch.object(Coupon, "api_list", return_value=[]) as api_list_mock:
+            self._sync()
+
+        self.assertEqual(
+            api_list_mock.call_args[1],
+            {"starting_after": "coupon-2", "stripe_account": "acct_1"},
+        )
+        self.assertEqual(self._get_checkpoint().high_water_mark, convert_tstamp(200))
+
+    @patch.object(CountrySpec, "api_list", return_value=[])
+    def test_not_incremental_notice_once(self, *mocks):
+        with patch.object(
+            Command, "get_stripe_account", return_value={"acct_1", "acct_2"}
+        ):
+            stderr = self._sync(model_name="CountrySpec")
+
+        self.assertEqual(stderr.count("can't be synced incrementally"), 1)
+
+
+@patch.object(Command, "get_stripe_account", return_value={"acct_1"})
+class TestListKwargsGenerators(TestCase):
+    def test_consumed_lazily(self, *mocks):
+        events = []
+
+        def list_subscriptions(**kwargs):
+            for id in ("sub_1", "sub_2"):
+                events.append(("listed", id))
+                yield SimpleNamespace(id=id)
+
+        def list_subscription_items(**kwargs):
+            events.append(("synced", kwargs["subscription"]))
+            return []
+
+        with patch.object(
+            Subscription, "api_list", side_effect=list_subscriptions
+        ), patch.object(
+            SubscriptionItem, "api_list", side_effect=list_subscription_items
+        ) as api_list_mock:
+            call_command(
+                "djstripe_sync_models",
+                "SubscriptionItem",
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+
+        # The items of each subscription are synced before the next is listed
+        self.assertEqual(
+            events,
+            [
+                ("listed", "sub_1"),
+                ("synced", "sub_1"),
+                ("listed", "sub_2"),
+                ("synced", "sub_2"),
+            ],
+        )
+        self.assertEqual(
+            [
+                (call[1]["subscription"], call[1]["stripe_account"])
+                for call in api_list_mock.call_args_list
+            ],
+            [("sub_1", "acct_1"), ("sub_2", "acct_1")],
+        )
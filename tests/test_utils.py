@@ -14,6 +14,7 @@ from django.utils import timezone
 from djstripe.utils import (
     convert_tstamp,
     get_friendly_currency_amount,
+    get_payload_hash,
     get_supported_currency_choices,
 )
 
@@ -81,3 +82,15 @@ class TestUtils(TestCase):
         self.assertEqual(
             get_friendly_currency_amount(Decimal("9.99"), "eur"), "€9.99 EUR"
         )
+
+    def test_get_payload_hash(self):
+        payload_hash = get_payload_hash({"id": "cus_1", "metadata": {"a": 1, "b": 2}})
+        self.assertEqual(len(payload_hash), 64)
+        self.assertEqual(
+            get_payload_hash({"metadata": {"b": 2, "a": 1}, "id": "cus_1"}),
+            payload_hash,
+        )
+        self.assertNotEqual(
+            get_payload_hash({"id": "cus_1", "metadata": {"a": 1, "b": 3}}),
+            payload_hash,
+        )
@@ -1,7 +1,11 @@
 """
 dj-stripe Webhook Tests.
 """
+import asyncio
+import io
 import json
+import tempfile
+import threading
 import warnings
 from collections import defaultdict
 from copy import deepcopy
@@ -9,15 +13,33 @@ from unittest.mock import Mock, PropertyMock, call, patch
 from uuid import UUID
 
 import pytest
-from django.test import TestCase, override_settings
+from asgiref.sync import async_to_sync
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
 from django.test.client import Client
 from django.urls import reverse
 
 from djstripe import webhooks
+from djstripe.checks import check_webhook_duplicate_policy
 from djstripe.models import Event, Transfer, WebhookEventTrigger
-from djstripe.models.webhooks import WebhookEndpoint, get_remote_ip
+from djstripe.models.webhooks import (
+    WebhookEndpoint,
+    decode_body,
+    encode_body,
+    get_body_storage,
+    get_remote_ip,
+)
 from djstripe.settings import djstripe_settings
-from djstripe.webhooks import TEST_EVENT_ID, call_handlers, handler, handler_all
+from djstripe.signals import WEBHOOK_SIGNALS, webhook_handler_failed
+from djstripe.views import AsyncProcessWebhookView
+from djstripe.webhooks import (
+    TEST_EVENT_ID,
+    call_handlers,
+    get_dispatch,
+    handler,
+    handler_all,
+)
 
 from . import (
     FAKE_CUSTOM_ACCOUNT,
@@ -56,6 +78,21 @@ class TestWebhookEventTrigger(TestCase):
         event_trigger = WebhookEventTrigger.objects.first()
         self.assertTrue(event_trigger.is_test_event)
 
+    def test_async_webhook_view(self):
+        view = AsyncProcessWebhookView.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+
+        request = RequestFactory().post(
+            reverse("djstripe:webhook"),
+            json.dumps(FAKE_EVENT_TEST_CHARGE_SUCCEEDED),
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="PLACEHOLDER",
+        )
+        resp = async_to_sync(view)(request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(WebhookEventTrigger.objects.get().is_test_event)
+
     def test___str__(self):
         self.assertEqual(WebhookEventTrigger.objects.count(), 0)
         resp = self._send_event(FAKE_EVENT_TEST_CHARGE_SUCCEEDED)
@@ -457,6 +494,305 @@ class TestWebhookEventTrigger(TestCase):
         self.assertEqual(event_trigger.exception, "'Test error'")
 
 
+@override_settings(
+    DJSTRIPE_WEBHOOK_VALIDATION="verify_signature",
+    DJSTRIPE_WEBHOOK_SECRET="whsec_XXXXX",
+    DJSTRIPE_WEBHOOK_PROCESSING_MODE="deferred",
+)
+@patch(
+    "stripe.WebhookSignature.verify_header",
+    return_value=True,
+    autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+)
+class TestDeferredWebhookProcessing(TestCase):
+    def _send_event(self, event_data):
+        return Client().post(
+            reverse("djstripe:webhook"),
+            json.dumps(event_data),
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="PLACEHOLDER",
+        )
+
+    @patch("stripe.Event.retrieve", autospec=True)
+    def test_webhook_is_not_processed(self, event_retrieve_mock, verify_header_mock):
+        resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        self.assertEqual(resp.status_code, 200)
+        trigger = WebhookEventTrigger.objects.get()
+        self.assertTrue(trigger.valid)
+        self.assertTrue(trigger.deferred)
+        self.assertFalse(trigger.processed)
+        self.assertFalse(Event.objects.exists())
+        event_retrieve_mock.assert_not_called()
+
+    @patch.object(Transfer, "_attach_objects_post_save_hook")
+    @patch(
+        "stripe.Account.retrieve",
+        return_value=deepcopy(FAKE_STANDARD_ACCOUNT),
+        autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+    )
+    @patch(
+        "stripe.Transfer.retrieve", return_value=deepcopy(FAKE_TRANSFER), autospec=True
+    )
+    def test_process_deferred(
+        self,
+        transfer_retrieve_mock,
+        account_retrieve_mock,
+        transfer__attach_object_post_save_hook_mock,
+        verify_header_mock,
+    ):
+        self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+        trigger = WebhookEventTrigger.objects.get()
+
+        self.assertTrue(trigger.process_deferred())
+
+        trigger.refresh_from_db()
+        self.assertTrue(trigger.processed)
+        self.assertEqual(trigger.event.id, FAKE_EVENT_TRANSFER_CREATED["id"])
+
+    @patch.object(Event, "process", side_effect=KeyError("Test error"))
+    def test_process_deferred_error(self, event_process_mock, verify_header_mock):
+        self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+        trigger = WebhookEventTrigger.objects.get()
+
+        self.assertFalse(trigger.process_deferred())
+
+        trigger.refresh_from_db()
+        self.assertFalse(trigger.processed)
+        self.assertEqual(trigger.exception, "'Test error'")
+
+    def test_queue_backend(self, verify_header_mock):
+        backend_mock = Mock()
+
+        with override_settings(
+            DJSTRIPE_WEBHOOK_QUEUE_BACKEND=backend_mock
+        ), self.captureOnCommitCallbacks(execute=True):
+            self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        backend_mock.assert_called_once_with(WebhookEventTrigger.objects.get())
+
+
+@override_settings(
+    DJSTRIPE_WEBHOOK_VALIDATION="verify_signature",
+    DJSTRIPE_WEBHOOK_SECRET="whsec_XXXXX",
+    DJSTRIPE_WEBHOOK_PROCESSING_MODE="deferred",
+)
+@patch(
+    "stripe.WebhookSignature.verify_header",
+    return_value=True,
+    autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+)
+class TestDuplicateWebhooks(TestCase):
+    def setUp(self):
+        self.trigger = WebhookEventTrigger.objects.create(
+            remote_ip="127.0.0.1",
+            headers={},
+            body=json.dumps(FAKE_EVENT_TRANSFER_CREATED),
+            stripe_event_id=FAKE_EVENT_TRANSFER_CREATED["id"],
+            valid=True,
+            processed=True,
+        )
+
+    def _send_event(self, event_data):
+        return Client().post(
+            reverse("djstripe:webhook"),
+            json.dumps(event_data),
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="PLACEHOLDER",
+        )
+
+    def test_duplicate_processed(self, verify_header_mock):
+        resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        self.assertEqual(resp.status_code, 200)
+        verify_header_mock.assert_called_once()
+        trigger = WebhookEventTrigger.objects.latest("id")
+        self.assertEqual(trigger.stripe_event_id, FAKE_EVENT_TRANSFER_CREATED["id"])
+        self.assertTrue(trigger.deferred)
+        self.assertFalse(trigger.duplicate)
+
+    @override_settings(DJSTRIPE_WEBHOOK_DUPLICATE_POLICY="ignore")
+    def test_duplicate_ignored(self, verify_header_mock):
+        # A single indexed read
+        with self.assertNumQueries(1):
+            resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        self.assertEqual(resp.status_code, 200)
+        verify_header_mock.assert_not_called()
+        self.assertEqual(WebhookEventTrigger.objects.get(), self.trigger)
+
+    @override_settings(DJSTRIPE_WEBHOOK_DUPLICATE_POLICY="mark")
+    def test_duplicate_marked(self, verify_header_mock):
+        resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        self.assertEqual(resp.status_code, 200)
+        verify_header_mock.assert_not_called()
+        marker = WebhookEventTrigger.objects.latest("id")
+        self.assertNotEqual(marker, self.trigger)
+        self.assertTrue(marker.duplicate)
+        self.assertEqual(marker.stripe_event_id, FAKE_EVENT_TRANSFER_CREATED["id"])
+        self.assertEqual(marker.body, "")
+        self.assertFalse(marker.valid)
+
+    @override_settings(DJSTRIPE_WEBHOOK_DUPLICATE_POLICY="marks")
+    def test_invalid_policy(self, verify_header_mock):
+        self.assertEqual(
+            [message.id for message in check_webhook_duplicate_policy()],
+            ["djstripe.C011"],
+        )
+
+        resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        # Handled like "process"
+        self.assertEqual(resp.status_code, 200)
+        verify_header_mock.assert_called_once()
+        self.assertFalse(WebhookEventTrigger.objects.latest("id").duplicate)
+
+    @override_settings(DJSTRIPE_WEBHOOK_DUPLICATE_POLICY="ignore")
+    def test_failed_event_redelivered(self, verify_header_mock):
+        WebhookEventTrigger.objects.filter(id=self.trigger.id).update(
+            processed=False, exception="Boom!"
+        )
+
+        resp = self._send_event(FAKE_EVENT_TRANSFER_CREATED)
+
+        self.assertEqual(resp.status_code, 200)
+        verify_header_mock.assert_called_once()
+        self.assertEqual(WebhookEventTrigger.objects.count(), 2)
+
+
+@override_settings(
+    DJSTRIPE_WEBHOOK_VALIDATION="verify_signature",
+    DJSTRIPE_WEBHOOK_SECRET="whsec_XXXXX",
+    DJSTRIPE_WEBHOOK_PROCESSING_MODE="deferred",
+)
+@patch(
+    "stripe.WebhookSignature.verify_header",
+    return_value=True,
+    autospec=IS_STATICMETHOD_AUTOSPEC_SUPPORTED,
+)
+class TestWebhookBodyStorage(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.storage = FileSystemStorage(location=tmpdir.name)
+        self.body = json.dumps(FAKE_EVENT_TRANSFER_CREATED)
+
+    def _send_event(self):
+        Client().post(
+            reverse("djstripe:webhook"),
+            self.body,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="PLACEHOLDER",
+        )
+        return WebhookEventTrigger.objects.get()
+
+    @override_settings(DJSTRIPE_WEBHOOK_BODY_STORAGE="gzip")
+    def test_gzip(self, verify_header_mock):
+        trigger = self._send_event()
+
+        self.assertTrue(trigger.body.startswith("gzip:"))
+        self.assertTrue(trigger.valid)
+        self.assertEqual(verify_header_mock.call_args[0][0], self.body)
+        self.assertEqual(trigger.decoded_body, self.body)
+        self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+
+    def test_storage(self, verify_header_mock):
+        with override_settings(
+            DJSTRIPE_WEBHOOK_BODY_STORAGE="storage",
+            DJSTRIPE_WEBHOOK_BODY_STORAGE_BACKEND=self.storage,
+        ):
+            trigger = self._send_event()
+            name = trigger.body[len("storage:") :]
+
+            self.assertTrue(trigger.body.startswith("storage:djstripe/webhook_bodies/"))
+            self.assertTrue(trigger.valid)
+            with self.storage.open(name) as f:
+                self.assertEqual(f.read().decode(), self.body)
+            self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+
+    def test_inline(self, verify_header_mock):
+        trigger = self._send_event()
+
+        self.assertEqual(trigger.body, self.body)
+        self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+
+    def test_inline_body_with_prefix(self, verify_header_mock):
+        body = "storage:../secrets.json"
+        stored = encode_body(body, "inline")
+
+        self.assertTrue(stored.startswith("gzip:"))
+        self.assertEqual(decode_body(stored), body)
+
+    def test_invalid_body_with_prefix(self, verify_header_mock):
+        self.assertEqual(decode_body("gzip:invalid"), "gzip:invalid")
+
+    def test_storage_read_error_raised(self, verify_header_mock):
+        with override_settings(DJSTRIPE_WEBHOOK_BODY_STORAGE_BACKEND=self.storage):
+            stored = encode_body(self.body, "storage")
+            with patch.object(
+                self.storage, "open", side_effect=OSError("Timed out")
+            ), self.assertRaises(OSError):
+                decode_body(stored)
+
+    def test_migrate_unreadable_body_kept(self, verify_header_mock):
+        with override_settings(DJSTRIPE_WEBHOOK_BODY_STORAGE_BACKEND=self.storage):
+            trigger = WebhookEventTrigger.objects.create(
+                remote_ip="127.0.0.1",
+                headers={},
+                body=encode_body(self.body, "storage"),
+            )
+            name = trigger.body[len("storage:") :]
+
+            stderr = io.StringIO()
+            with patch.object(self.storage, "open", side_effect=OSError("Timed out")):
+                call_command(
+                    "djstripe_migrate_webhook_bodies",
+                    storage="gzip",
+                    stdout=io.StringIO(),
+                    stderr=stderr,
+                )
+
+            self.assertIn("Timed out", stderr.getvalue())
+            # The body still refers to the file, which wasn't deleted
+            trigger.refresh_from_db()
+            self.assertEqual(trigger.body, f"storage:{name}")
+            self.assertTrue(self.storage.exists(name))
+            self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+
+    def test_migrate_bodies(self, verify_header_mock):
+        for _ in range(3):
+            WebhookEventTrigger.objects.create(
+                remote_ip="127.0.0.1", headers={}, body=self.body
+            )
+
+        with override_settings(DJSTRIPE_WEBHOOK_BODY_STORAGE_BACKEND=self.storage):
+            call_command(
+                "djstripe_migrate_webhook_bodies",
+                storage="storage",
+                batch_size=2,
+                stdout=io.StringIO(),
+            )
+            names = []
+            for trigger in WebhookEventTrigger.objects.all():
+                self.assertEqual(get_body_storage(trigger.body), "storage")
+                self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+                names.append(trigger.body[len("storage:") :])
+
+            call_command(
+                "djstripe_migrate_webhook_bodies",
+                storage="gzip",
+                stdout=io.StringIO(),
+            )
+
+        for trigger in WebhookEventTrigger.objects.all():
+            self.assertEqual(get_body_storage(trigger.body), "gzip")
+            self.assertEqual(trigger.json_body, FAKE_EVENT_TRANSFER_CREATED)
+        # The bodies moved out of the storage backend are deleted from it
+        for name in names:
+            self.assertFalse(self.storage.exists(name))
+
+
 class TestWebhookHandlers(TestCase):
     def setUp(self):
         # Reset state of registrations per test
@@ -470,6 +806,10 @@ class TestWebhookHandlers(TestCase):
         self.addCleanup(patcher.stop)
         self.registrations_global = patcher.start()
 
+        patcher = patch.object(webhooks, "on_commit_handlers", new_callable=set)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
     def test_global_handler_registration(self):
         func_mock = Mock()
         handler_all()(func_mock)
@@ -522,6 +862,89 @@ class TestWebhookHandlers(TestCase):
         self.assertEqual(2, func_mock.call_count)
         func_mock.assert_has_calls([call(event=event1), call(event=event2)])
 
+    def test_dispatch_compiled_once(self):
+        handler("foo")(Mock())
+
+        dispatch = get_dispatch("foo.bar")
+        self.assertIs(get_dispatch("foo.bar"), dispatch)
+
+        func_mock = Mock()
+        handler("foo.bar")(func_mock)
+        self.assertIsNot(get_dispatch("foo.bar"), dispatch)
+        self.assertEqual(get_dispatch("foo.bar").handlers[-1], func_mock)
+
+    def test_dispatch_signal(self):
+        self.assertIs(
+            get_dispatch("customer.created").signal,
+            WEBHOOK_SIGNALS["customer.created"],
+        )
+        self.assertIsNone(get_dispatch("wib.ble").signal)
+
+    def test_handler_timing(self):
+        def handle(event):
+            pass
+
+        handler("foo")(handle)
+        sink = Mock()
+
+        with override_settings(DJSTRIPE_INSTRUMENTATION_SINKS=[sink]):
+            self._call_handlers("foo.bar", {"data": "foo"})
+
+        sink.assert_called_once()
+        measurement = sink.call_args[0][0]
+        self.assertEqual(measurement.stage, "webhook.handler")
+        self.assertEqual(measurement.event_type, "foo.bar")
+        self.assertTrue(measurement.handler.endswith(".handle"))
+        self.assertGreaterEqual(measurement.duration, 0)
+
+    @override_settings(DJSTRIPE_WEBHOOK_HANDLER_WORKERS=0)
+    def test_on_commit_handlers(self):
+        calls = []
+        handler("foo")(lambda event: calls.append("inline"))
+        handler("foo", on_commit=True)(lambda event: calls.append("foo"))
+        handler_all(on_commit=True)(lambda event: calls.append("all"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._call_handlers("foo.bar", {"data": "foo"})
+            self.assertEqual(calls, ["inline"])
+
+        self.assertEqual(calls, ["inline", "all", "foo"])
+
+    @override_settings(DJSTRIPE_WEBHOOK_HANDLER_WORKERS=0)
+    def test_on_commit_handler_failure_isolated(self):
+        error = ValueError("Boom!")
+        failing_mock = Mock(side_effect=error)
+        func_mock = Mock()
+        handler("foo", on_commit=True)(failing_mock)
+        handler("foo", on_commit=True)(func_mock)
+        receiver = Mock()
+        webhook_handler_failed.connect(receiver)
+        self.addCleanup(webhook_handler_failed.disconnect, receiver)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event = self._call_handlers("foo.bar", {"data": "foo"})
+
+        func_mock.assert_called_once_with(event=event)
+        receiver.assert_called_once()
+        self.assertIs(receiver.call_args[1]["sender"], failing_mock)
+        self.assertIs(receiver.call_args[1]["exception"], error)
+
+    @override_settings(DJSTRIPE_WEBHOOK_HANDLER_WORKERS=2)
+    def test_on_commit_handlers_thread_pool(self):
+        threads = []
+        handler("foo", on_commit=True)(
+            lambda event: threads.append(threading.current_thread())
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._call_handlers("foo.bar", {"data": "foo"})
+        (callback,) = callbacks
+        for future in callback():
+            future.result(timeout=5)
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
     def test_webhook_event_trigger_invalid_body(self):
         trigger = WebhookEventTrigger(remote_ip="127.0.0.1", body="invalid json")
         assert not trigger.json_body